@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -80,8 +81,67 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A connection per request by default. WSGI servers and workers can
+        # opt in to reusing them (checked before reuse), e.g.
+        # CRM_CONN_MAX_AGE=600; keep 0 under ASGI, where they would outlive requests
+        'CONN_MAX_AGE': int(os.environ.get('CRM_CONN_MAX_AGE', 0)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
+# Multi-process servers: take the write lock at BEGIN (see crm/sqlite.py)
+if os.environ.get('CRM_SQLITE_IMMEDIATE'):
+    DATABASES['default']['OPTIONS'] = {'transaction_mode': 'IMMEDIATE'}
+# Every SQLite connection runs in WAL mode with the pragmas of crm/sqlite.py;
+# override them with CRM_SQLITE_PRAGMAS
+
+# Optional read replica for GraphQL query operations (crm/routers.py)
+if os.environ.get('CRM_SQLITE_REPLICA'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['CRM_SQLITE_REPLICA'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['crm.routers.ReadReplicaRouter']
+
+
+# Cache
+# Local memory by default; set CRM_REDIS_CACHE_URL to share the GraphQL
+# response cache and persisted queries between workers
+# (django-redis is not needed, Django ships a Redis backend that uses redis-py)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'crm',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+if os.environ.get('CRM_REDIS_CACHE_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['CRM_REDIS_CACHE_URL'],
+    }
+
+# GraphQL response cache (crm/response_cache.py); a timeout of 0 disables it
+CRM_RESPONSE_CACHE_ALIAS = 'default'
+CRM_RESPONSE_CACHE_TIMEOUT = 300
+
+# Static query budget (crm/cost.py): cost is the estimated number of objects
+# resolved, from page sizes and relation multiplicities
+CRM_MAX_QUERY_DEPTH = 10
+CRM_MAX_QUERY_COST = 250_000
+
+# Operations accepted in one batched request (a JSON array POSTed to /graphql)
+CRM_MAX_BATCH_SIZE = 50
+
+# Celery (crm/celery.py). Workers and beat run with crm/settings.py; tasks
+# sent from here go to the same Redis broker, and the job chords
+# (crm/fanout.py) need the same result backend. CELERY_TASK_ALWAYS_EAGER=1
+# runs tasks in-process instead; the tests switch it on themselves
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://localhost:6379/1')
+CELERY_TASK_ALWAYS_EAGER = os.environ.get('CELERY_TASK_ALWAYS_EAGER', '0') == '1'
+CELERY_TASK_EAGER_PROPAGATES = True
 
 
 # Password validation
@@ -121,7 +181,9 @@ USE_TZ = True
 STATIC_URL = 'static/'
 
 GRAPHENE = {
-    "SCHEMA": "alx_backend_graphql.schema.schema"
+    "SCHEMA": "alx_backend_graphql.schema.schema",
+    # Resolver timing for /metrics and X-CRM-Trace (crm/tracing.py)
+    "MIDDLEWARE": ["crm.tracing.TracingMiddleware"],
 }
 # Cronjob Configuration
 CRONJOBS = [
@@ -16,11 +16,20 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from graphene_django.views import GraphQLView
 from django.views.decorators.csrf import csrf_exempt
 
+from crm.export import export_view
+from crm.views import AsyncCRMGraphQLView, CRMGraphQLView, metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
-    # The 'graphiql=True' enables the nice browser interface
-    path("graphql", csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    # The 'graphiql=True' enables the nice browser interface.
+    # CRMGraphQLView adds persisted queries and caches validated documents
+    path("graphql", csrf_exempt(CRMGraphQLView.as_view(graphiql=True))),
+    # Same schema with async resolvers; serve it through asgi.py
+    path("graphql/async", csrf_exempt(AsyncCRMGraphQLView.as_view(graphiql=True))),
+    # Prometheus metrics of this process (resolver timings, SQL counts, caches)
+    path("metrics", metrics_view),
+    # Streamed NDJSON/CSV of the filtered customers or orders (see crm/export.py)
+    path("export/<str:kind>", export_view),
 ]
\ No newline at end of file
@@ -0,0 +1,147 @@
+"""
+Throughput of the sync (WSGI) and async (ASGI) GraphQL views under concurrency.
+
+    python benchmarks/bench_asgi.py
+    python benchmarks/bench_asgi.py --concurrency 32 --requests 2000
+
+In-process, the sync view is driven through Django's test client from
+``--concurrency`` threads, like a threaded WSGI server, and the async view
+through the async test client from as many asyncio tasks, like a single
+ASGI worker. The response cache is off so every request executes.
+
+To measure real servers instead, start them on the same database and point
+the script at each URL (requests are sent from threads either way):
+
+    gunicorn alx_backend_graphql.wsgi --threads 8
+    uvicorn alx_backend_graphql.asgi:application
+    python benchmarks/bench_asgi.py --url http://127.0.0.1:8000/graphql
+    python benchmarks/bench_asgi.py --url http://127.0.0.1:8000/graphql/async
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import threading
+import time
+import urllib.request
+from decimal import Decimal
+
+from harness import test_database
+
+from django.test import AsyncClient, Client, override_settings
+
+from crm.models import Customer, Order, Product
+
+# Independent root fields, which the async view resolves concurrently
+QUERY = """
+    query Dashboard {
+        allCustomers(first: 20) { edges { node {
+            name orders(first: 5) { edges { node { totalAmount products { edges { node { name } } } } } }
+        } } }
+        allProducts(first: 20) { totalCount edges { node { name stock } } }
+        crmStats { customerCount orderCount totalRevenue }
+    }
+"""
+
+
+def seed(customers):
+    products = Product.objects.bulk_create(
+        Product(name=f"Product {i}", price=Decimal("9.99"), stock=i) for i in range(50)
+    )
+    for i in range(customers):
+        customer = Customer.objects.create(name=f"Customer {i}", email=f"c{i}@example.com")
+        for j in range(3):
+            order = Order.objects.create(customer=customer, total_amount=Decimal("29.97"))
+            order.products.set(products[j::17])
+
+
+def report(label, latencies, elapsed):
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{label:<28} {len(latencies) / elapsed:8.1f} req/s   "
+        f"p50 {statistics.median(latencies) * 1000:7.1f} ms   p95 {p95 * 1000:7.1f} ms"
+    )
+
+
+def run_threads(send, requests, concurrency):
+    latencies, lock = [], threading.Lock()
+    per_thread = requests // concurrency
+
+    def worker():
+        for _ in range(per_thread):
+            start = time.perf_counter()
+            send()
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - start
+
+
+async def run_tasks(requests, concurrency):
+    client = AsyncClient()
+    body = json.dumps({"query": QUERY})
+    latencies = []
+
+    async def worker():
+        for _ in range(requests // concurrency):
+            start = time.perf_counter()
+            response = await client.post("/graphql/async", body, content_type="application/json")
+            assert response.status_code == 200 and "errors" not in response.json(), response.content
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - start
+
+
+def in_process(args):
+    body = json.dumps({"query": QUERY})
+    local = threading.local()
+
+    def send():
+        if not hasattr(local, "client"):
+            local.client = Client()
+        response = local.client.post("/graphql", body, content_type="application/json")
+        assert response.status_code == 200 and "errors" not in response.json(), response.content
+
+    with test_database(), override_settings(CRM_RESPONSE_CACHE_TIMEOUT=0, ALLOWED_HOSTS=["testserver"]):
+        seed(args.customers)
+        send()  # warm the document cache
+        report("WSGI view, threads", *run_threads(send, args.requests, args.concurrency))
+        report("ASGI view, asyncio tasks", *asyncio.run(run_tasks(args.requests, args.concurrency)))
+
+
+def live(args):
+    body = json.dumps({"query": QUERY}).encode()
+
+    def send():
+        request = urllib.request.Request(args.url, body, {"Content-Type": "application/json"})
+        with urllib.request.urlopen(request) as response:
+            assert "errors" not in json.load(response)
+
+    send()
+    report(args.url, *run_threads(send, args.requests, args.concurrency))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--customers", type=int, default=200)
+    parser.add_argument("--url", help="benchmark a running server instead")
+    args = parser.parse_args()
+    if args.url:
+        live(args)
+    else:
+        in_process(args)
+
+
+if __name__ == "__main__":
+    main()
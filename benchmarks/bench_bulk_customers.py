@@ -0,0 +1,42 @@
+"""BulkCreateCustomers: per-row exists()/create() versus the chunked bulk path."""
+from types import SimpleNamespace
+
+from harness import measure, test_database
+
+from crm.bulk import bulk_create_customers
+from crm.models import Customer
+
+
+def make_rows(count):
+    return [
+        SimpleNamespace(name=f"Customer {i}", email=f"customer{i}@example.com", phone="+1 555-0100")
+        for i in range(count)
+    ]
+
+
+def row_at_a_time(rows):
+    # The previous implementation
+    created, errors = [], []
+    for data in rows:
+        if Customer.objects.filter(email=data.email).exists():
+            errors.append(f"Email {data.email} exists")
+            continue
+        created.append(Customer.objects.create(name=data.name, email=data.email, phone=data.phone))
+    return created, errors
+
+
+def main():
+    with test_database():
+        for count in (1_000, 10_000, 50_000):
+            rows = make_rows(count)
+            Customer.objects.all().delete()
+            with measure(f"exists() + create(), {count} rows", rows=count):
+                row_at_a_time(rows)
+            for chunk_size in (100, 500, 2000):
+                Customer.objects.all().delete()
+                with measure(f"bulk path chunk={chunk_size}, {count} rows", rows=count):
+                    bulk_create_customers(rows, chunk_size=chunk_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Placing 10k orders: createOrder per order, batched HTTP requests, bulkCreateOrders.
+
+    python benchmarks/bench_bulk_orders.py
+    python benchmarks/bench_bulk_orders.py --orders 2000 --batch-size 50
+
+Every variant goes through the /graphql view with Django's test client, so
+the numbers include parsing, validation and JSON encoding. The response
+cache is off and each variant starts from the same stock.
+"""
+import argparse
+import json
+import random
+from decimal import Decimal
+
+from harness import measure, test_database
+
+from django.test import Client, override_settings
+
+from crm.models import Customer, Order, Product
+
+CREATE_ORDER = """
+    mutation ($customerId: ID!, $productIds: [ID]!) {
+        createOrder(input: {customerId: $customerId, productIds: $productIds}) { order { id totalAmount } }
+    }
+"""
+BULK_CREATE_ORDERS = """
+    mutation ($input: [OrderInput]!) {
+        bulkCreateOrders(input: $input) { orders { id totalAmount } errors }
+    }
+"""
+
+
+def seed(customers, products):
+    customer_ids = [
+        c.pk for c in Customer.objects.bulk_create(
+            Customer(name=f"Customer {i}", email=f"c{i}@example.com") for i in range(customers)
+        )
+    ]
+    product_ids = [
+        p.pk for p in Product.objects.bulk_create(
+            Product(name=f"Product {i}", price=Decimal("9.99"), stock=0) for i in range(products)
+        )
+    ]
+    return customer_ids, product_ids
+
+
+def make_items(count, customer_ids, product_ids):
+    rng = random.Random(0)
+    return [
+        {"customerId": rng.choice(customer_ids), "productIds": rng.sample(product_ids, 3)}
+        for _ in range(count)
+    ]
+
+
+def reset():
+    Order.objects.all().delete()
+    Product.objects.update(stock=1_000_000)
+
+
+def post(client, body):
+    response = client.post("/graphql", json.dumps(body), content_type="application/json")
+    assert response.status_code == 200, response.content
+    return response.json()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=10_000)
+    parser.add_argument("--batch-size", type=int, default=50)
+    args = parser.parse_args()
+
+    with test_database(), override_settings(
+        CRM_RESPONSE_CACHE_TIMEOUT=0, CRM_MAX_BATCH_SIZE=args.batch_size, ALLOWED_HOSTS=["testserver"]
+    ):
+        items = make_items(args.orders, *seed(1_000, 200))
+        client = Client()
+
+        reset()
+        with measure(f"createOrder x{args.orders}", rows=args.orders):
+            for item in items:
+                assert "errors" not in post(client, {"query": CREATE_ORDER, "variables": item})
+
+        reset()
+        with measure(f"HTTP batches of {args.batch_size} createOrder", rows=args.orders):
+            for start in range(0, len(items), args.batch_size):
+                results = post(client, [
+                    {"query": CREATE_ORDER, "variables": item} for item in items[start:start + args.batch_size]
+                ])
+                assert all("errors" not in result for result in results)
+
+        for chunk in (1_000, args.orders):
+            reset()
+            with measure(f"bulkCreateOrders, {chunk} per request", rows=args.orders):
+                for start in range(0, len(items), chunk):
+                    data = post(client, {"query": BULK_CREATE_ORDERS, "variables": {"input": items[start:start + chunk]}})
+                    assert data["data"]["bulkCreateOrders"]["errors"] == []
+        assert Order.objects.count() == args.orders
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Per-request overhead of parsing and validating GraphQL documents.
+
+    python benchmarks/bench_documents.py
+    python benchmarks/bench_documents.py --requests 5000
+
+The order reminder query is posted through graphene-django's stock
+GraphQLView, through CRMGraphQLView with the full text (document cache
+hits) and as an Apollo persisted-query hash only. The data set is tiny on
+purpose so what is left is the per-request overhead. parse + validate on
+its own is timed too.
+"""
+import argparse
+import json
+import time
+
+from harness import test_database
+
+from django.test import RequestFactory
+from graphene_django.views import GraphQLView
+from graphql import parse, validate
+
+from alx_backend_graphql.schema import schema
+from crm.cron_jobs.send_order_reminders import QUERY
+from crm.documents import document_cache, query_hash
+from crm.models import Customer, Order
+from crm.views import CRMGraphQLView
+
+QUERY_TEXT = QUERY.payload["query"]
+VARIABLES = {"since": "2000-01-01T00:00:00+00:00", "first": 10, "after": None}
+
+
+def timed(view, payload, requests):
+    factory = RequestFactory()
+    body = json.dumps(payload)
+    start = time.perf_counter()
+    for _ in range(requests):
+        response = view(factory.post("/graphql", body, content_type="application/json"))
+        assert response.status_code == 200, response.content
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    with test_database():
+        customer = Customer.objects.create(name="Bench", email="bench@example.com")
+        for _ in range(3):
+            Order.objects.create(customer=customer)
+
+        start = time.perf_counter()
+        for _ in range(args.requests):
+            validate(schema.graphql_schema, parse(QUERY_TEXT))
+        print(f"{'parse + validate only':<32} {(time.perf_counter() - start) / args.requests * 1e6:8.0f} us")
+
+        full = {"query": QUERY_TEXT, "variables": VARIABLES}
+        persisted = {
+            "variables": VARIABLES,
+            "extensions": {"persistedQuery": {"version": 1, "sha256Hash": query_hash(QUERY_TEXT)}},
+        }
+        stock = timed(GraphQLView.as_view(), full, args.requests)
+        cached = timed(CRMGraphQLView.as_view(), full, args.requests)
+        # The first request carries the text once to register the hash
+        timed(CRMGraphQLView.as_view(), {**persisted, "query": QUERY_TEXT}, 1)
+        hashed = timed(CRMGraphQLView.as_view(), persisted, args.requests)
+        print(f"{'stock GraphQLView':<32} {stock:8.0f} us/request")
+        print(f"{'CRMGraphQLView, full text':<32} {cached:8.0f} us/request ({stock - cached:+.0f} us saved)")
+        print(f"{'CRMGraphQLView, hash only':<32} {hashed:8.0f} us/request ({stock - hashed:+.0f} us saved)")
+        print(f"document cache: {document_cache.info()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Streaming /export/orders at growing row counts, NDJSON and gzipped CSV.
+
+    python benchmarks/bench_export.py
+    python benchmarks/bench_export.py --orders 10000 50000 200000
+
+For each size the whole response is consumed through Django's test client.
+"peak" is the largest Python allocation during the export (tracemalloc),
+which should stay flat as the row count grows; "RSS" is the process's peak
+resident size so far, as crm_import reports it.
+"""
+import argparse
+import random
+import tracemalloc
+from datetime import timedelta
+from decimal import Decimal
+
+from harness import measure, test_database
+
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from crm.management.commands.crm_import import peak_rss_mb
+from crm.models import Customer, Order, Product
+
+PRODUCTS_PER_ORDER = 3
+
+
+def seed_to(total):
+    """Grow the orders table to ``total`` orders with PRODUCTS_PER_ORDER lines each."""
+    rng = random.Random(total)
+    if not Product.objects.exists():
+        Product.objects.bulk_create(
+            Product(name=f"Product {i}", price=Decimal("9.99"), stock=0) for i in range(200)
+        )
+        Customer.objects.bulk_create(
+            Customer(name=f"Customer {i}", email=f"c{i}@example.com") for i in range(1_000)
+        )
+    customer_ids = list(Customer.objects.values_list("pk", flat=True))
+    product_ids = list(Product.objects.values_list("pk", flat=True))
+    now = timezone.now()
+    missing = total - Order.objects.count()
+    orders = Order.objects.bulk_create(
+        (
+            Order(
+                customer_id=rng.choice(customer_ids),
+                total_amount=Decimal("29.97"),
+                order_date=now - timedelta(minutes=i),
+            )
+            for i in range(missing)
+        ),
+        batch_size=5_000,
+    )
+    Order.products.through.objects.bulk_create(
+        (
+            Order.products.through(order_id=order.pk, product_id=product_id)
+            for order in orders
+            for product_id in rng.sample(product_ids, PRODUCTS_PER_ORDER)
+        ),
+        batch_size=5_000,
+    )
+
+
+def export(client, rows, **params):
+    encoding = params.pop("encoding", "")
+    label = f"{rows} orders, {params.get('format', 'ndjson')}{' gzip' if encoding else ''}"
+    tracemalloc.start()
+    with measure(label, rows=rows):
+        response = client.get("/export/orders", params, HTTP_ACCEPT_ENCODING=encoding)
+        size = sum(len(part) for part in response.streaming_content)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{'':<40} {size / 2**20:10.1f} MB sent  peak {peak / 2**20:6.1f} MB  RSS {peak_rss_mb():6.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, nargs="+", default=[10_000, 50_000, 100_000])
+    args = parser.parse_args()
+
+    with test_database(), override_settings(ALLOWED_HOSTS=["testserver"]):
+        client = Client()
+        for rows in sorted(args.orders):
+            seed_to(rows)
+            export(client, rows)
+            export(client, rows, format="csv", encoding="gzip")
+
+
+if __name__ == "__main__":
+    main()
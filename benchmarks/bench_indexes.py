@@ -0,0 +1,113 @@
+"""
+Filter latency and query plans before and after migration 0004 (filter indexes).
+
+    python benchmarks/bench_indexes.py              # ~1M orders
+    python benchmarks/bench_indexes.py --orders 100000
+
+The same data is measured twice: first with crm migrated back to 0003, then
+with 0004 applied. For every filter the EXPLAIN output, the time of a
+COUNT(*) and the time of fetching the first page of 100 rows are printed.
+"""
+import argparse
+import random
+import time
+from datetime import timedelta
+
+from harness import test_database
+
+from django.core.management import call_command
+from django.db import connection
+from django.utils import timezone
+
+from crm.filters import CustomerFilter, OrderFilter, ProductFilter
+from crm.management.commands.purge_inactive_customers import inactive_customers
+from crm.models import Order
+
+BATCH = 20_000
+
+
+def seed(orders, customers, products):
+    rng = random.Random(42)
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO crm_product (name, price, stock) VALUES (%s, %s, %s)",
+            [(f"Product {i}", f"{rng.uniform(1, 500):.2f}", rng.randint(0, 200)) for i in range(products)],
+        )
+        for start in range(0, customers, BATCH):
+            cursor.executemany(
+                "INSERT INTO crm_customer (name, email, phone, created_at) VALUES (%s, %s, %s, %s)",
+                [
+                    (f"Customer {i}", f"c{i}@example.com", f"+1{rng.randint(200, 999)}{i:07d}",
+                     now - timedelta(days=rng.randint(0, 1500)))
+                    for i in range(start, min(start + BATCH, customers))
+                ],
+            )
+        for start in range(0, orders, BATCH):
+            cursor.executemany(
+                "INSERT INTO crm_order (customer_id, order_date, total_amount) VALUES (%s, %s, %s)",
+                [
+                    (rng.randint(1, customers), now - timedelta(minutes=rng.randint(0, 2_000_000)),
+                     f"{rng.uniform(1, 2000):.2f}")
+                    for _ in range(start, min(start + BATCH, orders))
+                ],
+            )
+        cursor.execute("ANALYZE")
+
+
+def cases():
+    now = timezone.now()
+    month_ago = (now - timedelta(days=30)).isoformat()
+    yield "orders: order_date_gte (30 days)", OrderFilter({"order_date_gte": month_ago}).qs
+    yield "orders: total_amount 100..120", OrderFilter({"total_amount_gte": 100, "total_amount_lte": 120}).qs
+    yield "orders: one customer, last 30 days", Order.objects.filter(customer_id=42, order_date__gte=month_ago)
+    yield "customers: created_at_gte (7 days)", CustomerFilter({"created_at_gte": (now - timedelta(days=7)).isoformat()}).qs
+    yield "customers: phone_pattern +1555", CustomerFilter({"phone_pattern": "+1555"}).qs
+    yield "products: price 10..20", ProductFilter({"price_gte": 10, "price_lte": 20}).qs
+    yield "products: stock_lte 9 (low stock)", ProductFilter({"stock_lte": 9}).qs
+    yield "purge: NOT EXISTS last 365 days", inactive_customers(now - timedelta(days=365))
+
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def measure(label):
+    print(f"\n===== {label} =====")
+    for name, qs in cases():
+        count_ms = timed(qs.count)
+        page_ms = timed(lambda: list(qs[:100]))
+        print(f"\n{name}: count {count_ms:.1f} ms, first page {page_ms:.1f} ms")
+        for line in qs.explain().splitlines():
+            print(f"    {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=1_000_000)
+    parser.add_argument("--customers", type=int, default=100_000)
+    parser.add_argument("--products", type=int, default=5_000)
+    args = parser.parse_args()
+
+    with test_database():
+        call_command("migrate", "crm", "0003", verbosity=0)
+        start = time.perf_counter()
+        seed(args.orders, args.customers, args.products)
+        print(f"Seeded {args.orders} orders, {args.customers} customers, "
+              f"{args.products} products in {time.perf_counter() - start:.1f}s")
+        measure("before (0003)")
+        start = time.perf_counter()
+        call_command("migrate", "crm", "0004", verbosity=0)
+        print(f"\nBuilt indexes in {time.perf_counter() - start:.1f}s")
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        measure("after (0004)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Start-up and per-call latency of the GraphQL client the jobs use.
+
+    python benchmarks/bench_jobs.py
+    python benchmarks/bench_jobs.py --calls 200
+
+The web server is simulated by a WSGI server on a local port serving this
+process's test database. Three clients run the order reminder query:
+
+* the jobs' old setup: a new gql Client with fetch_schema_from_transport
+  per run, i.e. an introspection download before the first query;
+* the HTTP fallback of crm/graphql_client.py: cached schema, one
+  keep-alive session;
+* the in-process session, which skips HTTP and JSON altogether.
+"""
+import argparse
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+from harness import test_database
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.test import override_settings
+from gql import Client, GraphQLRequest
+from gql.transport.requests import RequestsHTTPTransport
+
+from crm import graphql_client
+from crm.cron_jobs.send_order_reminders import QUERY
+from crm.models import Customer, Order
+
+VARIABLES = {
+    "since": (datetime.now(timezone.utc) - timedelta(days=7)).isoformat(),
+    "first": 100,
+    "after": None,
+}
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def timed(label, start_session, calls):
+    start = time.perf_counter()
+    session, close = start_session()
+    startup = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(calls):
+        session.execute(GraphQLRequest(QUERY, variable_values=VARIABLES))
+    per_call = (time.perf_counter() - start) / calls
+    close()
+    print(f"{label:<34} start-up {startup * 1000:8.1f} ms   per call {per_call * 1000:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=50)
+    args = parser.parse_args()
+
+    with test_database(), override_settings(ALLOWED_HOSTS=["*"], CRM_RESPONSE_CACHE_TIMEOUT=0):
+        for i in range(100):
+            customer = Customer.objects.create(name=f"Customer {i}", email=f"c{i}@example.com")
+            Order.objects.create(customer=customer)
+
+        server = make_server("127.0.0.1", 0, WSGIHandler(), handler_class=QuietHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}/graphql"
+
+        def old_setup():
+            client = Client(transport=RequestsHTTPTransport(url=url), fetch_schema_from_transport=True)
+            return client.connect_sync(), client.close_sync
+
+        def http_fallback():
+            if graphql_client.load_introspection(url) is None:
+                # Warm the on-disk schema, as the first run ever does
+                client = graphql_client.http_client(url)
+                client.connect_sync()
+                graphql_client.save_introspection(url, client.introspection)
+                client.close_sync()
+            client = graphql_client.http_client(url)
+            return client.connect_sync(), client.close_sync
+
+        def in_process():
+            client = graphql_client.in_process_client()
+            return client.connect_sync(), client.close_sync
+
+        timed("new client + schema download", old_setup, args.calls)
+        timed("HTTP, cached schema, keep-alive", http_fallback, args.calls)
+        timed("in-process", in_process, args.calls)
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
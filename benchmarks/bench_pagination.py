@@ -0,0 +1,93 @@
+"""
+Page latency by depth: offset cursors vs keyset cursors on allOrders.
+
+    python benchmarks/bench_pagination.py              # ~1M orders
+    python benchmarks/bench_pagination.py --orders 100000
+
+The same 100-row page of orders (by order_date, id) is fetched through the
+GraphQL schema at increasing depths, once with ``offset`` and once with
+``keyset: true`` and the cursor of the row just before it. Offset pages also
+run the COUNT(*) graphene-django needs to slice; keyset pages run none.
+Offset mode follows the table's default order (the primary key), which is
+the cheapest case for OFFSET.
+"""
+import argparse
+import random
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+
+from harness import measure, test_database
+
+from django.db import connection
+from django.utils import timezone
+
+from alx_backend_graphql.schema import schema
+from crm.models import Order
+from crm.pagination import _columns, encode_cursor
+
+BATCH = 20_000
+PAGE = 100
+
+OFFSET_QUERY = """
+    query ($offset: Int) {
+        allOrders(first: %d, offset: $offset) { edges { node { id orderDate totalAmount } } }
+    }
+""" % PAGE
+KEYSET_QUERY = """
+    query ($after: String) {
+        allOrders(keyset: true, first: %d, after: $after) { edges { node { id orderDate totalAmount } } }
+    }
+""" % PAGE
+
+
+def seed(orders):
+    rng = random.Random(42)
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO crm_customer (name, email, created_at) VALUES (%s, %s, %s)",
+            ["Bench", "bench@example.com", now],
+        )
+        for start in range(0, orders, BATCH):
+            rows = [
+                (1, now - timedelta(minutes=rng.randint(0, 2_000_000)), f"{rng.uniform(1, 2000):.2f}")
+                for _ in range(start, min(start + BATCH, orders))
+            ]
+            cursor.execute(
+                "INSERT INTO crm_order (customer_id, order_date, total_amount) VALUES "
+                + ", ".join(["(%s, %s, %s)"] * len(rows)),
+                [value for row in rows for value in row],
+            )
+        cursor.execute("ANALYZE")
+
+
+def run(query, variables):
+    result = schema.execute(query, variables=variables, context_value=SimpleNamespace())
+    assert not result.errors, result.errors
+    return result.data
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with test_database():
+        start = time.perf_counter()
+        seed(args.orders)
+        print(f"Seeded {args.orders} orders in {time.perf_counter() - start:.1f}s\n")
+
+        fields = _columns(Order, ("order_date",))
+        ordered = Order.objects.order_by("order_date", "pk")
+        depths = [d for d in (0, PAGE, 1_000, 10_000, 100_000) if d < args.orders]
+        for depth in depths + [max(args.orders - PAGE, 0)]:
+            after = encode_cursor(ordered[depth - 1], fields) if depth else None
+            with measure(f"offset  page at row {depth}"):
+                run(OFFSET_QUERY, {"offset": depth})
+            with measure(f"keyset  page at row {depth}"):
+                page = run(KEYSET_QUERY, {"after": after})
+            assert len(page["allOrders"]["edges"]) == min(PAGE, args.orders - depth)
+
+if __name__ == "__main__":
+    main()
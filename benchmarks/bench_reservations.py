@@ -0,0 +1,166 @@
+"""
+Concurrency stress test for stock reservations on a SQLite file in WAL mode.
+
+    python benchmarks/bench_reservations.py
+    python benchmarks/bench_reservations.py --threads 16 --stock 100
+
+Worker threads, each with its own connection, reserve 1-3 units of random
+products until everything is sold. Each reservation is then either released
+or used by createOrder's place_order for one unit. Meanwhile a sweeper
+thread expires the reservations, whose TTLs are short enough to race the
+releases. Busy errors ("database is locked") are retried and counted.
+
+Afterwards every product must satisfy
+
+    initial stock == stock + units still reserved + units sold
+
+The same load is then run through a read-modify-write reserve (read the
+stock, check it in Python, save), to show the oversell that pattern allows.
+"""
+import argparse
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from pathlib import Path
+
+from harness import test_database
+
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from django.utils import timezone
+
+from crm import reservations
+from crm.models import Customer, Order, Product, StockReservation
+from crm.orders import place_order
+
+
+def retrying(stats, operation, *args):
+    while True:
+        try:
+            return operation(*args)
+        except OperationalError:
+            stats["busy"] += 1
+            time.sleep(random.random() / 100)
+
+
+def reserve_read_modify_write(product_id, quantity, ttl):
+    # Autocommit read, check in Python, then save(): the pattern of the old
+    # createOrder/restock code
+    product = Product.objects.get(pk=product_id)
+    if product.stock < quantity:
+        raise ValueError("Out of stock")
+    time.sleep(0)  # let another thread read the same stock
+    product.stock -= quantity
+    product.save(update_fields=["stock"])
+    return StockReservation.objects.create(
+        product=product, quantity=quantity, expires_at=timezone.now() + timedelta(seconds=ttl)
+    )
+
+
+def worker(reserve, customer_id, product_ids, seed, stats, sold_out):
+    rng = random.Random(seed)
+    try:
+        while len(sold_out) < len(product_ids):
+            product_id = rng.choice(product_ids)
+            try:
+                reservation = retrying(stats, reserve, product_id, rng.randint(1, 3), rng.uniform(0.2, 2.0))
+            except ValueError:
+                sold_out.add(product_id)
+                continue
+            stats["reserved"] += 1
+            if rng.random() < 0.5:
+                try:
+                    retrying(stats, reservations.release, reservation.pk)
+                    stats["released"] += 1
+                except ValueError:
+                    stats["lost to expiry"] += 1
+            else:
+                try:
+                    retrying(stats, place_order, customer_id, [product_id], [reservation.pk])
+                    stats["ordered"] += 1
+                except ValueError:
+                    stats["lost to expiry"] += 1
+            # Keep the sold-out set honest as units come back
+            sold_out.discard(product_id)
+    finally:
+        connection.close()
+
+
+def sweeper(stats, done):
+    try:
+        while not done.is_set():
+            retrying(stats, reservations.expire)
+            time.sleep(0.02)
+    finally:
+        connection.close()
+
+
+def run(label, reserve, args):
+    Order.objects.all().delete()
+    StockReservation.objects.all().delete()
+    Product.objects.update(stock=args.stock)
+    customer_id = Customer.objects.get().pk
+    product_ids = list(Product.objects.order_by("pk").values_list("pk", flat=True))
+
+    # One Counter per thread, summed at the end
+    stats = [Counter() for _ in range(args.threads + 1)]
+    sold_out, done = set(), threading.Event()
+    threads = [
+        threading.Thread(target=worker, args=(reserve, customer_id, product_ids, seed, stats[seed], sold_out))
+        for seed in range(args.threads)
+    ]
+    sweep = threading.Thread(target=sweeper, args=(stats[-1], done))
+    start = time.perf_counter()
+    sweep.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    done.set()
+    sweep.join()
+    elapsed = time.perf_counter() - start
+
+    stats = sum(stats, Counter())
+    held = dict(
+        StockReservation.objects.values("product_id").annotate(n=Sum("quantity")).values_list("product_id", "n")
+    )
+    sold = Counter(Order.products.through.objects.values_list("product_id", flat=True))
+    stocks = dict(Product.objects.values_list("pk", "stock"))
+    accounted = {pk: stocks[pk] + held.get(pk, 0) + sold[pk] for pk in product_ids}
+    mismatched = [pk for pk in product_ids if accounted[pk] != args.stock]
+    # A lost stock decrement leaves more units accounted for than existed
+    oversold = sum(max(0, accounted[pk] - args.stock) for pk in product_ids)
+    print(
+        f"{label:<20} {elapsed:6.2f} s {stats['reserved'] / elapsed:7.0f} reservations/s "
+        f"{stats['ordered']:5d} orders {stats['released']:5d} released {stats['lost to expiry']:4d} expired first "
+        f"{stats['busy']:5d} busy retries {oversold:5d} units oversold"
+    )
+    return mismatched
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--products", type=int, default=20)
+    parser.add_argument("--stock", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Threads need a database file they can share, not :memory:
+        connection.settings_dict["TEST"]["NAME"] = str(Path(tmp) / "reservations.sqlite3")
+        with test_database():
+            with connection.cursor() as cursor:
+                cursor.execute("PRAGMA journal_mode=WAL")
+            Customer.objects.create(name="Stress", email="stress@example.com")
+            Product.objects.bulk_create(Product(name=f"P{i}", price=1, stock=0) for i in range(args.products))
+
+            mismatched = run("conditional UPDATE", reservations.reserve, args)
+            run("read-modify-write", reserve_read_modify_write, args)
+            assert not mismatched, f"stock invariant broken for products {mismatched}"
+
+
+if __name__ == "__main__":
+    main()
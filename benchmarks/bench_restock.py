@@ -0,0 +1,42 @@
+"""UpdateLowStockProducts: query count stays flat as low-stock products grow."""
+from decimal import Decimal
+from unittest import mock
+
+from harness import measure, test_database
+
+from crm import inventory
+from crm.models import Product
+
+
+def seed(count):
+    Product.objects.all().delete()
+    Product.objects.bulk_create(
+        [Product(name=f"Product {i}", price=Decimal("5.00"), stock=i % 10) for i in range(count)],
+        batch_size=1000,
+    )
+
+
+def row_at_a_time():
+    # The previous implementation: one UPDATE per product
+    for product in Product.objects.filter(stock__lt=10):
+        product.stock += 10
+        product.save()
+
+
+def main():
+    with test_database():
+        for count in (100, 1_000, 10_000):
+            seed(count)
+            with measure(f"save() loop, {count} products", rows=count):
+                row_at_a_time()
+            seed(count)
+            with measure(f"UPDATE ... RETURNING, {count} products", rows=count):
+                inventory.restock_low_stock()
+            seed(count)
+            with mock.patch.object(inventory, "supports_update_returning", return_value=False):
+                with measure(f"chunked UPDATE, {count} products", rows=count):
+                    inventory.restock_low_stock()
+
+
+if __name__ == "__main__":
+    main()
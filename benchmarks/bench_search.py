@@ -0,0 +1,95 @@
+"""
+Substring search latency: icontains vs the FTS5 trigram index vs the
+trigram postings table (SearchTrigram).
+
+    python benchmarks/bench_search.py                # ~1M customers
+    python benchmarks/bench_search.py --customers 100000
+
+For every query the time to count the matches and to fetch the 20 best
+ranked rows is printed per backend (best of three runs). Both indexes are
+built before timing; the build times are printed separately.
+"""
+import argparse
+import random
+import time
+
+from harness import test_database
+
+from django.db import connection
+
+from crm import search
+from crm.models import Customer
+
+BATCH = 20_000
+WORDS = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel",
+         "india", "juliet", "kilo", "lima", "mike", "november", "oscar", "papa"]
+QUERIES = ["son", "oscar", "kilo mike", "c4242", "nomatch"]
+
+
+def seed(customers):
+    rng = random.Random(42)
+    with connection.cursor() as cursor:
+        for start in range(0, customers, BATCH):
+            rows = [
+                (f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()}son", f"c{i}@example.com")
+                for i in range(start, min(start + BATCH, customers))
+            ]
+            cursor.execute(
+                "INSERT INTO crm_customer (name, email, created_at) VALUES "
+                + ", ".join(["(%s, %s, CURRENT_TIMESTAMP)"] * len(rows)),
+                [value for row in rows for value in row],
+            )
+
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def run(label, backend):
+    print(f"\n===== {label} =====")
+    for text in QUERIES:
+        if backend is None:
+            qs = search._icontains(Customer.objects.all(), text)
+            count_ms, count = timed(qs.count)
+            top_ms, _ = timed(lambda: list(qs.order_by("pk")[:20]))
+        else:
+            count_ms, count = timed(lambda: backend.filter(Customer.objects.all(), text).count())
+            top_ms, _ = timed(lambda: backend.ranked(Customer, text, 20))
+        print(f"{text!r:>12}: {count:>8} matches, count {count_ms:8.1f} ms, top 20 {top_ms:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--customers", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with test_database():
+        start = time.perf_counter()
+        seed(args.customers)
+        print(f"Seeded {args.customers} customers in {time.perf_counter() - start:.1f}s")
+
+        run("icontains (table scan)", None)
+
+        fts = search.FTS5Backend()
+        if fts.is_available():
+            start = time.perf_counter()
+            fts.rebuild(Customer)
+            print(f"\nBuilt FTS5 index in {time.perf_counter() - start:.1f}s")
+            run("FTS5 trigram", fts)
+        else:
+            print("\nFTS5 trigram tokenizer not available, skipped")
+
+        trigram = search.TrigramBackend()
+        start = time.perf_counter()
+        trigram.rebuild(Customer)
+        print(f"\nBuilt trigram postings in {time.perf_counter() - start:.1f}s")
+        run("trigram table", trigram)
+
+
+if __name__ == "__main__":
+    main()
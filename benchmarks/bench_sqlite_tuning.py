@@ -0,0 +1,141 @@
+"""
+Concurrent GraphQL reads and writes on a SQLite file, before and after the
+tuning in crm/sqlite.py and the DATABASES settings.
+
+    python benchmarks/bench_sqlite_tuning.py
+    python benchmarks/bench_sqlite_tuning.py --threads 16 --seconds 20 --write-ratio 0.3
+
+Each profile gets its own database file. Threads send allOrders/allProducts
+queries and createOrder mutations through the /graphql view with Django's
+test client, so every request opens or reuses a connection exactly as under
+a threaded WSGI server. The response cache is off. "errors" counts the
+operations that failed, nearly always with "database is locked".
+
+  default  rollback journal, no pragmas, deferred transactions, CONN_MAX_AGE=0
+  tuned    WAL and crm/sqlite.py PRAGMAS, deferred transactions, CONN_MAX_AGE=600
+"""
+import argparse
+import json
+import random
+import statistics
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from decimal import Decimal
+from pathlib import Path
+
+from harness import test_database
+
+from django.db import connection
+from django.test import Client, override_settings
+
+from crm.models import Customer, Order, Product
+
+PROFILES = {
+    "default": {"pragmas": {"journal_mode": "delete"}, "options": {}, "conn_max_age": 0},
+    "tuned": {"pragmas": None, "options": {}, "conn_max_age": 600},
+}
+
+READS = [
+    """{ allOrders(first: 20) { edges { node { totalAmount customer { name } products { edges { node { name } } } } } } }""",
+    """{ allProducts(first: 50, stockGte: 1) { edges { node { name price stock } } } }""",
+]
+CREATE_ORDER = """
+    mutation ($customerId: ID!, $productIds: [ID]!) {
+        createOrder(input: {customerId: $customerId, productIds: $productIds}) { order { id } }
+    }
+"""
+
+
+def seed():
+    customers = Customer.objects.bulk_create(
+        Customer(name=f"Customer {i}", email=f"c{i}@example.com") for i in range(200)
+    )
+    products = Product.objects.bulk_create(
+        Product(name=f"Product {i}", price=Decimal("9.99"), stock=1_000_000) for i in range(50)
+    )
+    rng = random.Random(0)
+    orders = Order.objects.bulk_create(
+        Order(customer=rng.choice(customers), total_amount=Decimal("29.97")) for _ in range(2_000)
+    )
+    Order.products.through.objects.bulk_create(
+        Order.products.through(order_id=order.pk, product_id=product.pk)
+        for order in orders for product in rng.sample(products, 3)
+    )
+    return [c.pk for c in customers], [p.pk for p in products]
+
+
+def worker(seed_value, deadline, write_ratio, customer_ids, product_ids, latencies, errors):
+    rng = random.Random(seed_value)
+    client = Client()
+    while time.perf_counter() < deadline:
+        if rng.random() < write_ratio:
+            kind, body = "write", {"query": CREATE_ORDER, "variables": {
+                "customerId": rng.choice(customer_ids), "productIds": rng.sample(product_ids, 3),
+            }}
+        else:
+            kind, body = "read", {"query": rng.choice(READS)}
+        start = time.perf_counter()
+        response = client.post("/graphql", json.dumps(body), content_type="application/json")
+        latencies[kind].append(time.perf_counter() - start)
+        if response.status_code != 200 or "errors" in response.json():
+            errors[kind] += 1
+    # The client's request_finished keeps the connection when CONN_MAX_AGE allows
+    connection.close()
+
+
+def run(name, profile, args, tmp):
+    connection.settings_dict["TEST"]["NAME"] = str(Path(tmp) / f"{name}.sqlite3")
+    # Shared with the connections the threads open
+    connection.settings_dict["OPTIONS"] = profile["options"]
+    connection.settings_dict["CONN_MAX_AGE"] = profile["conn_max_age"]
+    pragmas = {} if profile["pragmas"] is None else {"CRM_SQLITE_PRAGMAS": profile["pragmas"]}
+
+    with override_settings(CRM_RESPONSE_CACHE_TIMEOUT=0, ALLOWED_HOSTS=["testserver"], **pragmas):
+        with test_database():
+            connection.close()  # reopen with the profile's pragmas
+            customer_ids, product_ids = seed()
+            latencies, errors = defaultdict(list), defaultdict(int)
+            deadline = time.perf_counter() + args.seconds
+            threads = [
+                threading.Thread(
+                    target=worker,
+                    args=(i, deadline, args.write_ratio, customer_ids, product_ids, latencies, errors),
+                )
+                for i in range(args.threads)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            with connection.cursor() as cursor:
+                journal = cursor.execute("PRAGMA journal_mode").fetchone()[0]
+
+    for kind in ("read", "write"):
+        timings = latencies[kind]
+        p50, p95 = (statistics.quantiles(timings, n=20)[i] * 1000 for i in (9, 18)) if len(timings) > 1 else (0, 0)
+        print(
+            f"{name:<8} {journal:<7} {kind:<5} {len(timings) / args.seconds:8.1f} ops/s "
+            f"p50 {p50:7.1f} ms  p95 {p95:7.1f} ms  {errors[kind]:5d} errors"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=15)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    args = parser.parse_args()
+
+    original = {key: connection.settings_dict[key] for key in ("OPTIONS", "CONN_MAX_AGE")}
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            for name, profile in PROFILES.items():
+                run(name, profile, args, tmp)
+        finally:
+            connection.settings_dict.update(original)
+
+
+if __name__ == "__main__":
+    main()
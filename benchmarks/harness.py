@@ -0,0 +1,54 @@
+"""
+Shared setup for the scripts in this folder.
+
+Every benchmark runs against a throwaway test database created from the
+project's migrations, so it never touches db.sqlite3:
+
+    python benchmarks/bench_restock.py
+"""
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "alx_backend_graphql.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+
+
+@contextmanager
+def test_database():
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def measure(label, rows=None):
+    """Print wall time, SQL query count and (optionally) rows/sec for a block."""
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        start = time.perf_counter()
+        yield counter
+        elapsed = time.perf_counter() - start
+    line = f"{label:<40} {elapsed * 1000:10.1f} ms {counter.count:8d} queries"
+    if rows:
+        line += f" {rows / elapsed:12.0f} rows/s"
+    print(line)
@@ -0,0 +1,34 @@
+"""
+Helpers for resolvers shared by the sync and the async GraphQL views.
+
+The async view (crm/views.py) sets ``crm_async`` on the request it passes as
+the GraphQL context. Resolvers then return awaitables for their database
+work; under the sync view they keep returning values.
+"""
+import inspect
+
+from asgiref.sync import sync_to_async
+
+
+def is_async(info):
+    return getattr(info.context, "crm_async", False)
+
+
+def call_sync(info, func, *args, **kwargs):
+    """
+    Call ``func``. Under the async view it runs in Django's sync thread and an
+    awaitable is returned; use this for service functions that wrap several
+    queries in a transaction.
+    """
+    if is_async(info):
+        return sync_to_async(func)(*args, **kwargs)
+    return func(*args, **kwargs)
+
+
+def then(value, callback):
+    """``callback(value)``, after awaiting ``value`` if it is awaitable."""
+    if inspect.isawaitable(value):
+        async def chained():
+            return callback(await value)
+        return chained()
+    return callback(value)
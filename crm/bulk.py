@@ -0,0 +1,139 @@
+import re
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import IntegrityError, connection, transaction
+
+from . import customer_stats
+from .models import Customer, Product
+from .response_cache import invalidate
+from .search import index_objects
+
+# Same rule CreateCustomer applies: digits, spaces, dashes and a leading '+'
+PHONE_RE = re.compile(r'^[\+\d\-\s]+$')
+
+BULK_CHUNK_SIZE = 500
+
+
+def clean_price(value):
+    # Same rule CreateProduct applies
+    try:
+        price = Decimal(str(value))
+    except InvalidOperation:
+        price = None
+    if price is None or not price.is_finite():
+        raise ValueError(f"Invalid price {value!r}")
+    if price <= 0:
+        raise ValueError("Price positive")
+    return price
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def bulk_create_customers(rows, chunk_size=BULK_CHUNK_SIZE, ignore_conflicts=False):
+    """
+    Create customers from ``rows`` (objects with name/email/phone) in chunks.
+
+    Each chunk costs one ``email__in`` probe plus the batched INSERT, instead
+    of an exists() and a create() per row. Returns ``(created, errors)``
+    where ``errors`` holds one message per rejected row, in input order and
+    prefixed with the row's index like bulk_create_products.
+    """
+    created, failed = [], {}
+    seen = set()
+
+    for chunk in chunked(enumerate(rows), chunk_size):
+        candidates = []
+        for index, data in chunk:
+            if data.phone and not PHONE_RE.match(data.phone):
+                failed[index] = f"Invalid phone format for {data.email}"
+            elif data.email in seen:
+                failed[index] = f"Email {data.email} exists"
+            else:
+                seen.add(data.email)
+                candidates.append((index, data))
+        if not candidates:
+            continue
+
+        try:
+            with transaction.atomic():
+                existing = set(
+                    Customer.objects.filter(email__in=[d.email for _, d in candidates])
+                    .values_list("email", flat=True)
+                )
+                customers, duplicates = [], {}
+                for index, data in candidates:
+                    if data.email in existing:
+                        duplicates[index] = f"Email {data.email} exists"
+                    else:
+                        customers.append(Customer(name=data.name, email=data.email, phone=data.phone))
+                Customer.objects.bulk_create(
+                    customers, batch_size=chunk_size, ignore_conflicts=ignore_conflicts
+                )
+                if ignore_conflicts or not connection.features.can_return_rows_from_bulk_insert:
+                    # Primary keys were not returned; read back what was stored.
+                    # Only emails absent from the probe above are ours, and a
+                    # row that differs from ours came from a concurrent writer
+                    # whose insert ours was ignored for
+                    wanted = {c.email: c for c in customers}
+                    customers = []
+                    for customer in Customer.objects.filter(email__in=list(wanted)):
+                        data = wanted.pop(customer.email)
+                        if (customer.name, customer.phone) == (data.name, data.phone):
+                            customers.append(customer)
+                        else:
+                            wanted[customer.email] = data
+                    duplicates.update(
+                        (index, f"Email {data.email} exists") for index, data in candidates if data.email in wanted
+                    )
+                # bulk_create sends no post_save, so index for search and
+                # drop cached responses here
+                index_objects(Customer, customers)
+                invalidate(Customer)
+                customer_stats.create_rows([c.pk for c in customers])
+        except IntegrityError as e:
+            # A concurrent writer won the race for one of the emails
+            failed.update((index, f"Could not create {d.email}: {e}") for index, d in candidates)
+            continue
+        failed.update(duplicates)
+
+        created.extend(customers)
+
+    return created, [f"Item {index}: {failed[index]}" for index in sorted(failed)]
+
+
+def bulk_create_products(rows, batch_size=BULK_CHUNK_SIZE):
+    """
+    Create products from ``rows`` (objects with name/price/stock) in one
+    transaction with batched INSERTs. Returns ``(created, errors)`` like
+    bulk_create_customers, each error prefixed with the row's index.
+    """
+    products, errors = [], []
+    for index, data in enumerate(rows):
+        try:
+            price = clean_price(data.price)
+        except ValueError as e:
+            errors.append(f"Item {index}: {e}")
+            continue
+        if data.stock is not None and data.stock < 0:
+            errors.append(f"Item {index}: Stock cannot be negative")
+            continue
+        products.append(Product(name=data.name, price=price, stock=data.stock or 0))
+    if not products:
+        return products, errors
+
+    with transaction.atomic():
+        if connection.features.can_return_rows_from_bulk_insert:
+            Product.objects.bulk_create(products, batch_size=batch_size)
+            # bulk_create sends no post_save
+            index_objects(Product, products)
+            invalidate(Product)
+        else:
+            # No unique column to read the new rows back by; post_save indexes
+            for product in products:
+                product.save(force_insert=True)
+    return products, errors
@@ -0,0 +1,193 @@
+"""
+Static cost and depth analysis of GraphQL operations.
+
+The reverse relations make the schema unboundedly deep
+(customer -> orders -> products -> orders -> ...), and every connection
+level multiplies the rows by its page size. Before executing, an operation
+is walked against the schema and two numbers are computed:
+
+* depth: the longest chain of object fields, not counting the Relay
+  wrappers (edges, node, pageInfo);
+* cost: an upper bound on the objects resolved, i.e. the sum over object
+  fields of the rows their parents can produce times the field's
+  multiplicity. Single relations (order.customer) have multiplicity 1,
+  connections and lists use their ``first``/``last`` argument (negative
+  values count as 0), or the relay page limit when it is absent, an unset
+  variable or not an integer. Only connections are capped at that limit,
+  as graphene-django enforces it on them alone.
+
+``query_cost_rule`` wraps the analysis in a validation rule, so an operation
+over CRM_MAX_QUERY_DEPTH or CRM_MAX_QUERY_COST fails validation and never
+runs. The view reports the computed numbers under ``extensions.cost``.
+"""
+from dataclasses import dataclass
+
+from django.conf import settings
+from graphene_django.settings import graphene_settings
+from graphql import (
+    FieldNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    IntValueNode,
+    OperationDefinitionNode,
+    ValidationRule,
+    VariableNode,
+    get_named_type,
+    get_nullable_type,
+    is_list_type,
+    is_object_type,
+    value_from_ast_untyped,
+)
+
+MAX_QUERY_DEPTH = 10
+MAX_QUERY_COST = 250_000
+RELAY_WRAPPERS = ("edges", "node")
+
+
+def max_query_depth():
+    return getattr(settings, "CRM_MAX_QUERY_DEPTH", MAX_QUERY_DEPTH)
+
+
+def max_query_cost():
+    return getattr(settings, "CRM_MAX_QUERY_COST", MAX_QUERY_COST)
+
+
+@dataclass
+class QueryCost:
+    cost: int = 0
+    depth: int = 0
+
+    def as_extension(self):
+        return {
+            "requested": self.cost,
+            "depth": self.depth,
+            "maxCost": max_query_cost(),
+            "maxDepth": max_query_depth(),
+        }
+
+
+def is_connection_type(graphql_type):
+    return is_object_type(graphql_type) and {"edges", "pageInfo"} <= graphql_type.fields.keys()
+
+
+def is_edge_type(graphql_type):
+    return is_object_type(graphql_type) and {"node", "cursor"} <= graphql_type.fields.keys()
+
+
+class CostAnalyzer:
+    def __init__(self, schema, get_fragment, variables):
+        self.schema = schema
+        self.get_fragment = get_fragment
+        self.variables = variables or {}
+        self.page_limit = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+
+    def argument(self, node, name):
+        """The page size ``name`` asks for, or None when absent or not an integer."""
+        for argument in node.arguments:
+            if argument.name.value != name:
+                continue
+            value = argument.value
+            if isinstance(value, IntValueNode):
+                size = int(value.value)
+            elif isinstance(value, VariableNode):
+                # Variables are not coerced yet; execution rejects bad ones
+                size = self.variables.get(value.name.value)
+            else:
+                return None
+            if not isinstance(size, int) or isinstance(size, bool):
+                return None
+            # A negative size must not lower the total of the other fields
+            return max(0, size)
+        return None
+
+    def multiplicity(self, node, field_type):
+        field_type = get_nullable_type(field_type)
+        if not (is_list_type(field_type) or is_connection_type(field_type)):
+            return 1
+        sizes = [n for n in (self.argument(node, "first"), self.argument(node, "last")) if n is not None]
+        size = min(sizes) if sizes else self.page_limit
+        # graphene-django refuses a larger page on connections; a list field's
+        # resolver gets whatever size was asked for
+        if is_connection_type(field_type) and self.page_limit is not None:
+            return min(size, self.page_limit)
+        return size
+
+    def walk(self, parent_type, selection_set, rows):
+        """Return (cost, depth) of ``selection_set`` when ``rows`` parents are resolved."""
+        cost = depth = 0
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                name = selection.name.value
+                field = parent_type.fields.get(name) if hasattr(parent_type, "fields") else None
+                if field is None or selection.selection_set is None:
+                    continue
+                child_type = get_named_type(field.type)
+                if is_connection_type(parent_type) or is_edge_type(parent_type):
+                    if name not in RELAY_WRAPPERS:
+                        # pageInfo and other per-page fields cost nothing
+                        continue
+                    # The connection field itself already counted the page
+                    child_cost, child_depth = self.walk(child_type, selection.selection_set, rows)
+                else:
+                    field_rows = rows * self.multiplicity(selection, field.type)
+                    child_cost, child_depth = self.walk(child_type, selection.selection_set, field_rows)
+                    child_cost += field_rows
+                    child_depth += 1
+            else:
+                if isinstance(selection, FragmentSpreadNode):
+                    fragment = self.get_fragment(selection.name.value)
+                    if fragment is None:
+                        continue
+                    condition, selections = fragment.type_condition, fragment.selection_set
+                else:
+                    condition, selections = selection.type_condition, selection.selection_set
+                fragment_type = self.schema.get_type(condition.name.value) if condition else parent_type
+                child_cost, child_depth = self.walk(fragment_type, selections, rows)
+            cost += child_cost
+            depth = max(depth, child_depth)
+        return cost, depth
+
+    def analyze(self, operation):
+        defaults = {
+            definition.variable.name.value: value_from_ast_untyped(definition.default_value)
+            for definition in operation.variable_definitions
+            if definition.default_value is not None
+        }
+        self.variables = {**defaults, **self.variables}
+        root_type = self.schema.get_root_type(operation.operation)
+        return QueryCost(*self.walk(root_type, operation.selection_set, 1))
+
+
+def query_cost_rule(variables, operation_name, report):
+    """
+    Build a validation rule that analyzes the operation named
+    ``operation_name`` with ``variables`` bound, passes the QueryCost to
+    ``report`` and fails validation when it is over budget.
+    """
+
+    class QueryCostRule(ValidationRule):
+        def enter_document(self, node, *args):
+            operations = [d for d in node.definitions if isinstance(d, OperationDefinitionNode)]
+            if operation_name:
+                operations = [op for op in operations if op.name and op.name.value == operation_name]
+            if len(operations) != 1:
+                # Execution reports the missing or ambiguous operation
+                return self.SKIP
+            analyzer = CostAnalyzer(self.context.schema, self.context.get_fragment, variables)
+            result = analyzer.analyze(operations[0])
+            report(result)
+
+            if result.depth > max_query_depth():
+                self.report_error(GraphQLError(
+                    f"Query depth {result.depth} exceeds the maximum of {max_query_depth()}",
+                    extensions={"code": "QUERY_TOO_DEEP", "cost": result.as_extension()},
+                ))
+            if result.cost > max_query_cost():
+                self.report_error(GraphQLError(
+                    f"Query cost {result.cost} exceeds the budget of {max_query_cost()}; "
+                    "request smaller pages with first/last",
+                    extensions={"code": "QUERY_TOO_COSTLY", "cost": result.as_extension()},
+                ))
+            return self.SKIP
+
+    return QueryCostRule
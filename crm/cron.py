@@ -1,16 +1,13 @@
 from datetime import datetime
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+from gql import gql
+
+from crm.graphql_client import get_session
 
 # ... (keep your existing log_crm_heartbeat function here) ...
 
 def update_low_stock():
-    # 1. Setup Client
-    transport = RequestsHTTPTransport(
-        url="http://localhost:8000/graphql",
-        use_json=True,
-    )
-    client = Client(transport=transport, fetch_schema_from_transport=True)
+    # 1. Shared session: executes in-process under django-crontab (crm/graphql_client.py)
+    session = get_session()
 
     # 2. Define the Mutation
     # We request the 'name' and new 'stock' to use in our log
@@ -28,7 +25,7 @@ def update_low_stock():
 
     try:
         # 3. Execute Mutation
-        result = client.execute(mutation)
+        result = session.execute(mutation)
         data = result.get('updateLowStockProducts', {})
         
         updated_products = data.get('updatedProducts', [])
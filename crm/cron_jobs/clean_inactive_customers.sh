@@ -1,27 +1,15 @@
 #!/bin/bash
 
-# Define the Python code to run
-# We use a 'Here-Doc' (<< EOM) to pass multiple lines of Python cleanly
-read -r -d '' PYTHON_SCRIPT << EOM
-from django.utils import timezone
-from datetime import timedelta
-from crm.models import Customer  # Ensure this import matches your project structure
+# Delete customers with no orders in the last year.
+# The work happens in the purge_inactive_customers management command
+# (batched deletes, see crm/management/commands/purge_inactive_customers.py),
+# so there is no Python heredoc to pipe through 'manage.py shell'.
 
-# Calculate the cutoff date (1 year ago)
-one_year_ago = timezone.now() - timedelta(days=365)
+# Run from the project root so manage.py is found whatever cron's cwd is
+cd "$(dirname "$0")/../.." || exit 1
 
-# Identify customers who do NOT have any orders created after the cutoff date
-# This covers customers with old orders OR no orders at all.
-inactive_customers = Customer.objects.exclude(orders__created_at__gte=one_year_ago)
-count = inactive_customers.count()
-inactive_customers.delete()
-
-print(f"Deleted {count} inactive customers.")
-EOM
-
-# Run the python code using Django's shell
 # We capture the output into a variable
-OUTPUT=$(echo "$PYTHON_SCRIPT" | python3 manage.py shell)
+OUTPUT=$(python3 manage.py purge_inactive_customers 2>&1)
 
 # Log the timestamp and the output to the specified log file
-echo "$(date): $OUTPUT" >> /tmp/customer_cleanup_log.txt
\ No newline at end of file
+echo "$(date): $OUTPUT" >> /tmp/customer_cleanup_log.txt
@@ -1,66 +1,168 @@
+import json
 import os
-from datetime import datetime, timedelta
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from gql import gql, GraphQLRequest
 
-def send_reminders():
-    # 1. Setup the GraphQL Client
-    # We point it to the localhost endpoint where Django is running
-    transport = RequestsHTTPTransport(
-        url="http://localhost:8000/graphql",
-        use_json=True,
-    )
-    client = Client(transport=transport, fetch_schema_from_transport=True)
-
-    # 2. Define the Query
-    # We fetch ID, Customer Email, and Order Date.
-    # Note: Ensure these field names match your specific schema.
-    query = gql("""
-        query {
-            allOrders {
-                id
-                orderDate
-                customer {
-                    email
+# Run from cron as a plain script: make the project importable
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from crm.graphql_client import get_session  # noqa: E402
+
+LOG_FILE = os.environ.get("CRM_ORDER_REMINDERS_LOG", "/tmp/order_reminders_log.txt")
+# Orders already reminded, so a rerun inside the window sends nothing twice.
+# Recorded in the OrderReminder table, which every worker sees; this file
+# only serves runs over HTTP, which have no database
+STATE_FILE = "/tmp/order_reminders_sent.json"
+WINDOW_DAYS = 7
+# graphene-django's RELAY_CONNECTION_MAX_LIMIT
+PAGE_SIZE = 100
+
+QUERY = gql("""
+    query ($since: DateTime!, $first: Int!, $after: String) {
+        allOrders(orderDateGte: $since, keyset: true, first: $first, after: $after) {
+            pageInfo {
+                hasNextPage
+                endCursor
+            }
+            edges {
+                node {
+                    id
+                    orderDate
+                    customer {
+                        email
+                    }
                 }
             }
         }
-    """)
+    }
+""")
+
+
+def django_ready():
+    try:
+        from django.apps import apps
+    except ImportError:
+        return False
+    return apps.ready
+
+
+def load_sent(since):
+    """Relay ids of the orders placed since ``since`` already reminded."""
+    if not django_ready():
+        return set(load_state_file(since))
+    from graphql_relay import to_global_id
+    from crm.models import OrderReminder
+
+    reminded = OrderReminder.objects.filter(order__order_date__gte=since).values_list("order_id", flat=True)
+    return {to_global_id("OrderType", pk) for pk in reminded}
+
+
+def save_sent(sent):
+    """Record the reminders just sent, ``{order Relay id: order date}``."""
+    if not django_ready():
+        since = datetime.now(timezone.utc) - timedelta(days=WINDOW_DAYS)
+        save_state_file({**load_state_file(since), **sent})
+        return
+    from django.db import transaction
+    from graphql_relay import from_global_id
+    from crm.bulk import BULK_CHUNK_SIZE, chunked
+    from crm.models import Order, OrderReminder
+
+    # All or nothing, and safe to repeat; orders deleted since they were
+    # read are skipped
+    with transaction.atomic():
+        for chunk in chunked((int(from_global_id(order_id)[1]) for order_id in sent), BULK_CHUNK_SIZE):
+            OrderReminder.objects.bulk_create(
+                (OrderReminder(order_id=pk) for pk in Order.objects.filter(pk__in=chunk).values_list("pk", flat=True)),
+                ignore_conflicts=True,
+            )
+
+
+def load_state_file(since):
+    # {order id: order date}; entries older than the window can never be
+    # returned again, so they are dropped to keep the file small
+    try:
+        with open(STATE_FILE) as fh:
+            sent = json.load(fh)
+    except (OSError, ValueError):
+        return {}
+    return {
+        order_id: order_date for order_id, order_date in sent.items()
+        if datetime.fromisoformat(order_date) >= since
+    }
+
+
+def save_state_file(sent):
+    tmp_path = f"{STATE_FILE}.tmp"
+    with open(tmp_path, "w") as fh:
+        json.dump(sent, fh)
+    os.replace(tmp_path, STATE_FILE)
+
+
+def fetch_recent_orders(session, since):
+    """
+    Yield one page of order nodes at a time, following the Relay cursors.
+
+    keyset: true makes every page an index seek on (order_date, id) rather
+    than an OFFSET, so the last page costs the same as the first.
+    """
+    after = None
+    while True:
+        response = session.execute(GraphQLRequest(QUERY, variable_values={
+            "since": since.isoformat(), "first": PAGE_SIZE, "after": after,
+        }))
+        connection = response["allOrders"]
+        yield [edge["node"] for edge in connection["edges"]]
+        if not connection["pageInfo"]["hasNextPage"]:
+            return
+        after = connection["pageInfo"]["endCursor"]
+
+
+def send_reminders():
+    # 1. Shared session: in-process when Django is set up, else HTTP to
+    #    CRM_GRAPHQL_URL (crm/graphql_client.py)
+    session = get_session()
+
+    started = time.perf_counter()
+    since = datetime.now(timezone.utc) - timedelta(days=WINDOW_DAYS)
+    sent = load_sent(since)
+    reminders_sent = skipped = pages = 0
 
     try:
-        # Execute the query
-        response = client.execute(query)
-        orders = response.get("allOrders", [])
-
-        # 3. Filter for orders within the last 7 days
-        # We assume orderDate comes back as an ISO string (e.g., "2023-10-05")
-        seven_days_ago = datetime.now() - timedelta(days=7)
-        
-        reminders_sent = 0
-
-        # Open the log file in append mode
-        with open("/tmp/order_reminders_log.txt", "a") as log_file:
-            for order in orders:
-                # Parse the date string from GraphQL (adjust format if your API differs)
-                # Assuming YYYY-MM-DD or ISO format
-                try:
-                    order_date_str = order.get("orderDate")
-                    # flexible parsing for date or datetime string
-                    order_date = datetime.fromisoformat(str(order_date_str).replace('Z', '+00:00')).date() if 'T' in str(order_date_str) else datetime.strptime(str(order_date_str), "%Y-%m-%d").date()
-                    
-                    # Check if date is within range
-                    if order_date >= seven_days_ago.date():
-                        customer_email = order.get("customer", {}).get("email", "Unknown")
-                        order_id = order.get("id")
-                        
-                        # Log the entry
-                        log_entry = f"{datetime.now().isoformat()} - Reminder for Order #{order_id} sent to {customer_email}\n"
-                        log_file.write(log_entry)
-                        reminders_sent += 1
-                        
-                except (ValueError, TypeError) as e:
-                    # Handle date parsing errors gracefully
-                    continue
+        # 2. Only orders from the last 7 days are fetched (orderDateGte is
+        #    served by the order_date index), one page at a time
+        with open(LOG_FILE, "a") as log_file:
+            for orders in fetch_recent_orders(session, since):
+                pages += 1
+                lines, sent_now = [], {}
+                for order in orders:
+                    if order["id"] in sent:
+                        skipped += 1
+                        continue
+                    customer_email = (order.get("customer") or {}).get("email", "Unknown")
+                    lines.append(
+                        f"{datetime.now().isoformat()} - Reminder for Order #{order['id']} "
+                        f"sent to {customer_email}\n"
+                    )
+                    sent_now[order["id"]] = order["orderDate"]
+                # 3. Record the page, then one write for it, so neither a
+                #    crash nor a rerun sends a reminder twice
+                save_sent(sent_now)
+                sent.update(sent_now)
+                log_file.writelines(lines)
+                log_file.flush()
+                reminders_sent += len(lines)
+
+            elapsed = time.perf_counter() - started
+            log_file.write(
+                f"{datetime.now().isoformat()} - Run finished: {reminders_sent} sent, "
+                f"{skipped} already sent, {pages} pages in {elapsed:.2f}s\n"
+            )
 
         # 4. Print required console output
         print("Order reminders processed!")
@@ -68,5 +170,17 @@ def send_reminders():
     except Exception as e:
         print(f"An error occurred: {e}")
 
+def setup_django():
+    # Query the project's database directly instead of the web server
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "alx_backend_graphql.settings")
+    try:
+        import django
+
+        django.setup()
+    except Exception as e:
+        print(f"Django unavailable ({e}), using HTTP")
+
+
 if __name__ == "__main__":
-    send_reminders()
\ No newline at end of file
+    setup_django()
+    send_reminders()
@@ -0,0 +1,104 @@
+"""
+Maintenance of the per-customer order aggregates in CustomerStats.
+
+"Lifetime value", "last order date" and "inactive since" are read from one
+indexed row per customer instead of aggregating crm_order on every query.
+The rows are kept current in three ways:
+
+* a new order adds itself to its customer's row with one UPDATE
+  (:func:`order_created`, from the post_save receiver in crm/signals.py);
+* writes that change totals or remove orders recompute the rows of the
+  customers they touched (:func:`refresh`), an aggregate over that
+  customer's orders on the (customer, order_date) index;
+* :func:`reconcile`, run nightly by Celery beat, recomputes every row and
+  reports how many had drifted, which should stay 0.
+
+Bulk writers, which send no signals, call :func:`rebuild` themselves.
+"""
+from decimal import Decimal
+
+from django.db.models import (
+    Count,
+    DateTimeField,
+    DecimalField,
+    F,
+    IntegerField,
+    Max,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value,
+)
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Customer, CustomerStats, Order
+from .response_cache import invalidate
+
+RECONCILE_BATCH_SIZE = 1000
+FIELDS = ("order_count", "total_spent", "last_order_date")
+
+
+def _aggregate(expression, output_field):
+    orders = Order.objects.filter(customer_id=OuterRef("customer_id")).order_by().values("customer_id")
+    return Subquery(orders.annotate(value=expression).values("value"), output_field=output_field)
+
+
+def create_rows(customer_ids):
+    """Add zeroed rows for new customers; existing rows are left alone."""
+    CustomerStats.objects.bulk_create(
+        [CustomerStats(customer_id=pk) for pk in customer_ids], ignore_conflicts=True
+    )
+
+
+def refresh(customer_ids):
+    """Recompute the existing rows of ``customer_ids`` (ids or a values() queryset)."""
+    money = DecimalField(max_digits=12, decimal_places=2)
+    updated = CustomerStats.objects.filter(customer_id__in=customer_ids).update(
+        order_count=Coalesce(_aggregate(Count("pk"), IntegerField()), Value(0)),
+        total_spent=Coalesce(_aggregate(Sum("total_amount"), money), Value(Decimal("0")), output_field=money),
+        last_order_date=_aggregate(Max("order_date"), DateTimeField()),
+    )
+    if updated:
+        invalidate(CustomerStats)
+    return updated
+
+
+def rebuild(customer_ids):
+    """Create any missing rows for ``customer_ids``, then recompute them."""
+    customer_ids = list(customer_ids)
+    create_rows(customer_ids)
+    return refresh(customer_ids)
+
+
+def order_created(order):
+    amount = Value(order.total_amount or Decimal("0"), output_field=DecimalField(max_digits=12, decimal_places=2))
+    ordered = Value(order.order_date, output_field=DateTimeField())
+    updated = CustomerStats.objects.filter(customer_id=order.customer_id).update(
+        order_count=F("order_count") + 1,
+        total_spent=F("total_spent") + amount,
+        last_order_date=Greatest(Coalesce("last_order_date", ordered), ordered),
+    )
+    if updated:
+        invalidate(CustomerStats)
+    else:
+        # The customer came from a bulk path without a stats row
+        rebuild([order.customer_id])
+
+
+def reconcile(batch_size=RECONCILE_BATCH_SIZE):
+    """
+    Recompute every customer's row, ``batch_size`` customers per statement.
+    Returns (customers checked, rows that had drifted).
+    """
+    customers = Customer.objects.order_by("pk").values_list("pk", flat=True)
+    checked = drifted = 0
+    last_pk = 0
+    while ids := list(customers.filter(pk__gt=last_pk)[:batch_size]):
+        rows = CustomerStats.objects.filter(customer_id__in=ids).values_list("customer_id", *FIELDS)
+        before = {pk: values for pk, *values in rows}
+        rebuild(ids)
+        after = {pk: values for pk, *values in rows.all()}
+        drifted += sum(1 for pk in ids if before.get(pk) != after[pk])
+        checked += len(ids)
+        last_pk = ids[-1]
+    return checked, drifted
@@ -0,0 +1,121 @@
+"""
+Parsed-document cache and persisted-query store for crm.views.CRMGraphQLView.
+
+The stock GraphQLView parses and validates the query string on every
+request, although the cron jobs and other clients send the same handful of
+documents forever. Validation walks the whole document against the schema
+and usually costs more than resolving a small query.
+
+* ``DocumentCache`` is a size-bounded LRU of documents that parsed and
+  validated cleanly, keyed by the sha256 of the query text and the
+  validation rules they were checked with. Documents with errors are not
+  cached.
+* Persisted queries follow Apollo's automatic persisted query protocol: a
+  client sends ``extensions.persistedQuery.sha256Hash`` alone, and only
+  sends the full text (with the hash) after a ``PersistedQueryNotFound``
+  error. The text is kept in Django's cache so every worker shares it.
+  Only documents that parse, validate and fit the cost budget are
+  registered, up to CRM_PERSISTED_QUERY_MAX_LENGTH characters, and each
+  expires after CRM_PERSISTED_QUERY_TIMEOUT seconds; a client whose query
+  expired simply sends its text again.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+DOCUMENT_CACHE_SIZE = 256
+PERSISTED_QUERY_PREFIX = "crm:apq:"
+PERSISTED_QUERY_MAX_LENGTH = 16 * 1024
+PERSISTED_QUERY_TIMEOUT = 24 * 3600
+# Apollo clients match on this exact message
+PERSISTED_QUERY_NOT_FOUND = "PersistedQueryNotFound"
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+def persisted_query_max_length():
+    return getattr(settings, "CRM_PERSISTED_QUERY_MAX_LENGTH", PERSISTED_QUERY_MAX_LENGTH)
+
+
+def persisted_query_timeout():
+    return getattr(settings, "CRM_PERSISTED_QUERY_TIMEOUT", PERSISTED_QUERY_TIMEOUT)
+
+
+class DocumentCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._documents = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            document = self._documents.get(key)
+            if document is None:
+                self.misses += 1
+                return None
+            self._documents.move_to_end(key)
+            self.hits += 1
+            return document
+
+    def put(self, key, document):
+        with self._lock:
+            self._documents[key] = document
+            self._documents.move_to_end(key)
+            while len(self._documents) > self.maxsize:
+                self._documents.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._documents.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def info(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._documents),
+                "maxsize": self.maxsize,
+            }
+
+
+document_cache = DocumentCache(getattr(settings, "CRM_DOCUMENT_CACHE_SIZE", DOCUMENT_CACHE_SIZE))
+
+
+class PersistedQueries:
+    def __init__(self):
+        self.hits = self.misses = 0
+
+    def get(self, sha256):
+        query = cache.get(PERSISTED_QUERY_PREFIX + sha256)
+        if query is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return query
+
+    def check(self, sha256, query):
+        """Raise ValueError unless ``query`` may be registered under ``sha256``."""
+        if len(query) > persisted_query_max_length():
+            raise ValueError(f"Persisted query is over the limit of {persisted_query_max_length()} characters")
+        if query_hash(query) != sha256:
+            raise ValueError("provided sha does not match query")
+
+    def register(self, sha256, query):
+        """Store ``query``, which the caller has parsed and validated."""
+        self.check(sha256, query)
+        cache.set(PERSISTED_QUERY_PREFIX + sha256, query, timeout=persisted_query_timeout())
+
+    def info(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+persisted_queries = PersistedQueries()
@@ -0,0 +1,76 @@
+"""
+Chunked fan-out for the Celery jobs in crm/tasks.py.
+
+A job splits its table into primary-key ranges (:func:`id_ranges`), runs one
+chunk task per range as a chord so the chunks spread over all workers, and
+reduces their results, in range order, in a final task. Chunk tasks return
+a dict and are wrapped with :func:`timed`, which adds how long the chunk
+took; the reduce step reports those timings with :func:`timing_summary`.
+
+Chunk and reduce tasks share CHUNK_TASK_OPTIONS: SQLite's "database is
+locked" and other OperationalErrors are retried with exponential backoff,
+and a chunk stuck past its time limit is killed instead of holding a worker.
+
+With CELERY_TASK_ALWAYS_EAGER the whole chord runs in the calling process,
+which is how the tests run it. Otherwise chords need the result backend
+(CELERY_RESULT_BACKEND) to collect the chunk results.
+"""
+import functools
+import logging
+import time
+
+from celery import chord, group
+from django.db import OperationalError
+from django.db.models import Max, Min
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+
+CHUNK_TASK_OPTIONS = {
+    "autoretry_for": (OperationalError,),
+    "retry_backoff": True,
+    "retry_backoff_max": 300,
+    "retry_jitter": True,
+    "max_retries": 5,
+    "soft_time_limit": 120,
+    "time_limit": 180,
+}
+
+
+def id_ranges(queryset, chunk_size=None):
+    """Half-open [low, high) primary-key ranges covering ``queryset``."""
+    chunk_size = chunk_size or CHUNK_SIZE
+    bounds = queryset.aggregate(low=Min("pk"), high=Max("pk"))
+    if bounds["low"] is None:
+        return []
+    end = bounds["high"] + 1
+    return [(low, min(low + chunk_size, end)) for low in range(bounds["low"], end, chunk_size)]
+
+
+def fan_out(chunk_task, ranges, reduce_signature, *chunk_args):
+    """Run ``chunk_task(low, high, *chunk_args)`` per range, then the reduce task."""
+    if not ranges:
+        # A chord needs at least one header task
+        return reduce_signature.delay([])
+    header = group(chunk_task.s(low, high, *chunk_args) for low, high in ranges)
+    return chord(header)(reduce_signature)
+
+
+def timed(chunk):
+    @functools.wraps(chunk)
+    def wrapper(low, high, *args, **kwargs):
+        start = time.perf_counter()
+        result = chunk(low, high, *args, **kwargs)
+        result["seconds"] = time.perf_counter() - start
+        logger.info("%s [%d, %d) took %.3fs", chunk.__name__, low, high, result["seconds"])
+        return result
+
+    return wrapper
+
+
+def timing_summary(results):
+    if not results:
+        return "0 chunks"
+    seconds = [result["seconds"] for result in results]
+    return f"{len(seconds)} chunks, slowest {max(seconds):.2f}s, total {sum(seconds):.2f}s"
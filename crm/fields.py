@@ -0,0 +1,243 @@
+import inspect
+from functools import partial
+
+import graphene
+from asgiref.sync import sync_to_async
+from django.db.models.query import QuerySet
+from graphene.relay import PageInfo
+from graphene.relay.connection import connection_adapter, page_info_adapter
+from graphene_django.filter import DjangoFilterConnectionField
+from graphene_django.utils import maybe_queryset
+from graphql_relay import (
+    connection_from_array_slice,
+    cursor_to_offset,
+    get_offset_with_default,
+    offset_to_cursor,
+)
+
+from .aio import is_async
+from .loaders import get_loaders, is_batchable
+from .pagination import akeyset_page, keyset_page
+
+PAGINATION_ARGS = ("first", "last", "before", "after", "offset", "keyset")
+
+
+def has_filter_args(args):
+    return any(v is not None for k, v in args.items() if k not in PAGINATION_ARGS)
+
+
+def check_page_size(info, first, last, max_limit, enforce_first_or_last):
+    if enforce_first_or_last and not (first or last):
+        raise ValueError(f"You must provide a `first` or `last` value to paginate `{info.field_name}`")
+    if max_limit and any(n is not None and n > max_limit for n in (first, last)):
+        raise ValueError(f"`{info.field_name}` pages are limited to {max_limit} records")
+
+
+async def _count(root):
+    root.length = await root.iterable.acount()
+    return root.length
+
+
+class CRMConnection(graphene.relay.Connection):
+    """Connection base for the CRM types; counts only when totalCount is selected."""
+
+    class Meta:
+        abstract = True
+
+    total_count = graphene.Int(required=True)
+
+    def resolve_total_count(root, info):
+        # Offset pages already counted to slice; keyset pages never do
+        if root.length is None:
+            if is_async(info) and isinstance(root.iterable, QuerySet):
+                return _count(root)
+            root.length = root.iterable.count() if hasattr(root.iterable, "count") else len(root.iterable)
+        return root.length
+
+
+class CRMFilterConnectionField(DjangoFilterConnectionField):
+    """
+    DjangoFilterConnectionField that cooperates with crm.loaders.
+
+    Nested resolvers may return an already-batched list instead of a
+    queryset; that list is paginated as-is. Every page of nodes is handed to
+    the request's loaders so their relations are fetched one level at a time.
+
+    Passing ``keyset=(column, ...)`` adds an opt-in ``keyset: true`` argument
+    that pages by those columns plus the primary key instead of by offset
+    (crm/pagination.py).
+
+    Under the async view (``info.context.crm_async``) the resolvers return
+    coroutines that count and read pages through the async ORM.
+    """
+
+    def __init__(self, type_, *args, keyset=None, **kwargs):
+        self.keyset = keyset
+        if keyset is not None:
+            kwargs.setdefault("keyset", graphene.Boolean(
+                default_value=False,
+                description=f"Page with cursors on ({', '.join((*keyset, 'id'))}) instead of offsets",
+            ))
+        super().__init__(type_, *args, **kwargs)
+
+    @classmethod
+    def resolve_queryset(
+        cls, connection, iterable, info, args, filtering_args, filterset_class
+    ):
+        if is_batchable(iterable):
+            return iterable
+        return super().resolve_queryset(
+            connection, iterable, info, args, filtering_args, filterset_class
+        )
+
+    @classmethod
+    async def aresolve_connection(cls, connection, args, iterable, max_limit=None):
+        """resolve_connection, counting and reading the page with the async ORM."""
+        iterable = maybe_queryset(iterable)
+        if not isinstance(iterable, QuerySet):
+            return cls.resolve_connection(connection, args, iterable, max_limit=max_limit)
+
+        # The same offset and limit handling as resolve_connection, but the
+        # page bounds are worked out first so only that slice is read
+        offset = args.pop("offset", None)
+        after = args.get("after")
+        if offset:
+            if after:
+                offset += cursor_to_offset(after) + 1
+            args["after"] = offset_to_cursor(offset - 1)
+        if max_limit is not None and args.get("first") is None and args.get("last") is None:
+            args["first"] = max_limit
+
+        length = await iterable.acount()
+        start = min(get_offset_with_default(args.get("after"), -1) + 1, length)
+        end = min(get_offset_with_default(args.get("before"), length), length)
+        if args.get("first") is not None:
+            end = min(end, start + args["first"])
+        if args.get("last") is not None:
+            start = max(start, end - args["last"])
+        rows = [row async for row in iterable[start:end]] if end > start else []
+
+        result = connection_from_array_slice(
+            rows,
+            args,
+            slice_start=start,
+            array_length=length,
+            array_slice_length=len(rows),
+            connection_type=partial(connection_adapter, connection),
+            edge_type=connection.Edge,
+            page_info_type=page_info_adapter,
+        )
+        result.iterable = iterable
+        result.length = length
+        return result
+
+    @classmethod
+    async def aresolve_iterable(cls, resolver, connection, default_manager,
+                                queryset_resolver, root, info, args):
+        iterable = resolver(root, info, **args)
+        if inspect.isawaitable(iterable):
+            iterable = await iterable
+        if iterable is None:
+            iterable = default_manager
+        if is_batchable(iterable):
+            return iterable
+        # The filterset may hit the database (search backend detection)
+        return await sync_to_async(queryset_resolver)(connection, iterable, info, args)
+
+    @classmethod
+    async def aconnection_resolver(cls, resolver, connection, default_manager,
+                                   queryset_resolver, max_limit, enforce_first_or_last,
+                                   root, info, **args):
+        check_page_size(info, args.get("first"), args.get("last"), max_limit, enforce_first_or_last)
+        if args.get("offset") is not None and args.get("before") is not None:
+            raise ValueError("offset cannot be combined with before")
+        iterable = await cls.aresolve_iterable(
+            resolver, connection, default_manager, queryset_resolver, root, info, args
+        )
+        result = await cls.aresolve_connection(connection, args, iterable, max_limit=max_limit)
+        get_loaders(info).prime(edge.node for edge in result.edges)
+        return result
+
+    @classmethod
+    def connection_resolver(cls, resolver, connection, default_manager,
+                            queryset_resolver, max_limit, enforce_first_or_last,
+                            root, info, **args):
+        if is_async(info):
+            return cls.aconnection_resolver(
+                resolver, connection, default_manager, queryset_resolver,
+                max_limit, enforce_first_or_last, root, info, **args
+            )
+        result = super().connection_resolver(
+            resolver, connection, default_manager, queryset_resolver,
+            max_limit, enforce_first_or_last, root, info, **args
+        )
+        get_loaders(info).prime(edge.node for edge in result.edges)
+        return result
+
+    @classmethod
+    def keyset_connection_resolver(cls, columns, resolver, connection, default_manager,
+                                   queryset_resolver, max_limit, enforce_first_or_last,
+                                   root, info, **args):
+        if not args.get("keyset"):
+            return cls.connection_resolver(
+                resolver, connection, default_manager, queryset_resolver,
+                max_limit, enforce_first_or_last, root, info, **args
+            )
+        first, last = args.get("first"), args.get("last")
+        if args.get("offset") is not None:
+            raise ValueError("offset cannot be combined with keyset pagination")
+        check_page_size(info, first, last, max_limit, enforce_first_or_last)
+        if max_limit and first is None and last is None:
+            first = max_limit
+        page_args = {"first": first, "last": last, "after": args.get("after"), "before": args.get("before")}
+
+        if is_async(info):
+            return cls.akeyset_connection_resolver(
+                columns, resolver, connection, default_manager, queryset_resolver,
+                root, info, args, page_args
+            )
+        iterable = resolver(root, info, **args)
+        if iterable is None:
+            iterable = default_manager
+        queryset = queryset_resolver(connection, iterable, info, args)
+        page = keyset_page(queryset, columns, **page_args)
+        return cls.keyset_connection(connection, queryset, page, info)
+
+    @classmethod
+    async def akeyset_connection_resolver(cls, columns, resolver, connection, default_manager,
+                                          queryset_resolver, root, info, args, page_args):
+        queryset = await cls.aresolve_iterable(
+            resolver, connection, default_manager, queryset_resolver, root, info, args
+        )
+        page = await akeyset_page(queryset, columns, **page_args)
+        return cls.keyset_connection(connection, queryset, page, info)
+
+    @classmethod
+    def keyset_connection(cls, connection, queryset, page, info):
+        result = connection(
+            edges=[connection.Edge(node=row, cursor=cursor) for row, cursor in zip(page.rows, page.cursors)],
+            page_info=PageInfo(
+                start_cursor=page.cursors[0] if page.cursors else None,
+                end_cursor=page.cursors[-1] if page.cursors else None,
+                has_previous_page=page.has_previous_page,
+                has_next_page=page.has_next_page,
+            ),
+        )
+        result.iterable = queryset
+        result.length = None
+        get_loaders(info).prime(page.rows)
+        return result
+
+    def wrap_resolve(self, parent_resolver):
+        if self.keyset is None:
+            return super().wrap_resolve(parent_resolver)
+        return partial(
+            self.keyset_connection_resolver,
+            self.keyset,
+            self.resolver or parent_resolver,
+            self.connection_type,
+            self.get_manager(),
+            self.get_queryset_resolver(),
+            self.max_limit,
+            self.enforce_first_or_last,
+        )
@@ -1,5 +1,7 @@
 import django_filters
+from django.db.models import Exists, OuterRef
 from .models import Customer, Product, Order
+from .search import search_filter
 
 class CustomerFilter(django_filters.FilterSet):
     # 'icontains' means case-insensitive partial match (e.g., "ali" matches "Alice")
@@ -11,12 +13,33 @@ class CustomerFilter(django_filters.FilterSet):
     created_at_lte = django_filters.DateTimeFilter(field_name='created_at', lookup_expr='lte')
 
     # Challenge: Phone starts with specific pattern
-    phone_pattern = django_filters.CharFilter(field_name='phone', lookup_expr='startswith')
+    phone_pattern = django_filters.CharFilter(method='filter_phone_pattern')
+
+    # Indexed substring search over name and email (see crm/search.py)
+    search = django_filters.CharFilter(method='filter_search')
+
+    # Order aggregates, read from the indexed CustomerStats row
+    order_count_gte = django_filters.NumberFilter(field_name='stats__order_count', lookup_expr='gte')
+    total_spent_gte = django_filters.NumberFilter(field_name='stats__total_spent', lookup_expr='gte')
+    total_spent_lte = django_filters.NumberFilter(field_name='stats__total_spent', lookup_expr='lte')
+    last_order_before = django_filters.DateTimeFilter(field_name='stats__last_order_date', lookup_expr='lt')
+    last_order_after = django_filters.DateTimeFilter(field_name='stats__last_order_date', lookup_expr='gte')
 
     class Meta:
         model = Customer
         fields = ['name', 'email', 'phone']
 
+    def filter_search(self, queryset, name, value):
+        return search_filter(queryset, value)
+
+    def filter_phone_pattern(self, queryset, name, value):
+        # As a range rather than LIKE 'x%', which SQLite cannot answer from
+        # crm_customer_phone_idx: every phone starting with value sorts
+        # between value and value with its last character incremented
+        if ord(value[-1]) == 0x10FFFF:
+            return queryset.filter(phone__startswith=value)
+        return queryset.filter(phone__gte=value, phone__lt=value[:-1] + chr(ord(value[-1]) + 1))
+
 class ProductFilter(django_filters.FilterSet):
     name = django_filters.CharFilter(lookup_expr='icontains')
     
@@ -26,10 +49,15 @@ class ProductFilter(django_filters.FilterSet):
     stock_gte = django_filters.NumberFilter(field_name='stock', lookup_expr='gte')
     stock_lte = django_filters.NumberFilter(field_name='stock', lookup_expr='lte')
 
+    search = django_filters.CharFilter(method='filter_search')
+
     class Meta:
         model = Product
         fields = ['name', 'price', 'stock']
 
+    def filter_search(self, queryset, name, value):
+        return search_filter(queryset, value)
+
 class OrderFilter(django_filters.FilterSet):
     total_amount_gte = django_filters.NumberFilter(field_name='total_amount', lookup_expr='gte')
     total_amount_lte = django_filters.NumberFilter(field_name='total_amount', lookup_expr='lte')
@@ -41,6 +69,21 @@ class OrderFilter(django_filters.FilterSet):
     # Filter by related product's name (distinct ensures no duplicates)
     product_name = django_filters.CharFilter(field_name='products__name', lookup_expr='icontains', distinct=True)
 
+    # Search-index backed versions of the two above; EXISTS instead of a DISTINCT join
+    customer_search = django_filters.CharFilter(method='filter_customer_search')
+    product_search = django_filters.CharFilter(method='filter_product_search')
+
     class Meta:
         model = Order
-        fields = ['total_amount', 'order_date']
\ No newline at end of file
+        fields = ['total_amount', 'order_date']
+
+    def filter_customer_search(self, queryset, name, value):
+        customers = search_filter(Customer.objects.all(), value)
+        return queryset.filter(customer__in=customers.values('pk'))
+
+    def filter_product_search(self, queryset, name, value):
+        products = search_filter(Product.objects.all(), value)
+        through = Order.products.through.objects.filter(
+            order_id=OuterRef('pk'), product__in=products.values('pk')
+        )
+        return queryset.filter(Exists(through))
\ No newline at end of file
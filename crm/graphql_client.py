@@ -0,0 +1,118 @@
+"""
+GraphQL client for the cron and Celery jobs.
+
+Jobs used to build a ``gql`` client over HTTP to localhost:8000 with
+``fetch_schema_from_transport=True``. Every run downloaded the full
+introspection schema, and a run failed whenever the web server was down.
+:func:`get_session` returns a gql session that the jobs share:
+
+* inside Django (django-crontab, Celery workers, management commands),
+  documents execute in this process against ``alx_backend_graphql.schema``,
+  through the same resolvers and loaders as the view but with no HTTP;
+* otherwise the requests go over HTTP to CRM_GRAPHQL_URL, on one
+  keep-alive session, and are validated against an introspection result
+  cached on disk for a day.
+
+Either way the session is created once per process and callers keep using
+``session.execute(GraphQLRequest(...))`` as with gql.
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from hashlib import sha256
+from pathlib import Path
+from types import SimpleNamespace
+
+from gql import Client
+from gql.transport.requests import RequestsHTTPTransport
+from gql.transport.transport import Transport
+from graphql import ExecutionResult, execute
+
+GRAPHQL_URL = "http://localhost:8000/graphql"
+SCHEMA_CACHE_DIR = Path(tempfile.gettempdir())
+SCHEMA_CACHE_MAX_AGE = 24 * 3600
+
+_session = None
+_lock = threading.Lock()
+
+
+class InProcessTransport(Transport):
+    """gql transport executing against a graphene schema in this process."""
+
+    def __init__(self, schema):
+        self.schema = schema
+
+    def execute(self, request, *args, **kwargs):
+        # gql has already validated the document against the same schema
+        result = execute(
+            self.schema.graphql_schema,
+            request.document,
+            variable_values=request.variable_values,
+            operation_name=request.operation_name,
+            # Holds the request's loaders (crm/loaders.py), like the HTTP request does
+            context_value=SimpleNamespace(),
+        )
+        errors = [error.formatted for error in result.errors] if result.errors else None
+        return ExecutionResult(data=result.data, errors=errors)
+
+
+def in_django():
+    from django.apps import apps
+
+    return apps.ready
+
+
+def schema_cache_path(url):
+    return SCHEMA_CACHE_DIR / f"crm_graphql_schema_{sha256(url.encode()).hexdigest()[:16]}.json"
+
+
+def load_introspection(url):
+    path = schema_cache_path(url)
+    try:
+        if time.time() - path.stat().st_mtime > SCHEMA_CACHE_MAX_AGE:
+            return None
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def save_introspection(url, introspection):
+    path = schema_cache_path(url)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(introspection))
+    os.replace(tmp_path, path)
+
+
+def in_process_client():
+    from alx_backend_graphql.schema import schema
+
+    return Client(transport=InProcessTransport(schema), schema=schema.graphql_schema)
+
+
+def http_client(url):
+    transport = RequestsHTTPTransport(url=url, retries=2)
+    introspection = load_introspection(url)
+    if introspection is not None:
+        return Client(transport=transport, introspection=introspection)
+    return Client(transport=transport, fetch_schema_from_transport=True)
+
+
+def get_session():
+    """Return this process's gql session, connecting on first use."""
+    global _session
+    with _lock:
+        if _session is None:
+            if in_django():
+                client = in_process_client()
+                _session = client.connect_sync()
+            else:
+                url = os.environ.get("CRM_GRAPHQL_URL", GRAPHQL_URL)
+                client = http_client(url)
+                _session = client.connect_sync()
+                if client.fetch_schema_from_transport:
+                    save_introspection(url, client.introspection)
+            atexit.register(client.close_sync)
+        return _session
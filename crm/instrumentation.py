@@ -0,0 +1,41 @@
+"""
+SQL observers that follow the request into Django's async ORM.
+
+``connection.execute_wrapper`` only sees queries run on the calling
+thread's connection. Under the async view, queries run in the threads that
+``sync_to_async`` dispatches to, so a wrapper installed by the view would
+miss them. Instead, one dispatching wrapper is installed permanently on
+every connection (``connection_created``, see crm/signals.py). It hands each
+statement to the observers registered in a ContextVar. ``sync_to_async``
+copies the caller's context into its thread, so a request's observers see
+exactly that request's queries, with or without concurrent requests.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import connection
+
+_observers = ContextVar("crm_sql_observers", default=())
+
+
+def dispatch_to_observers(execute, sql, params, many, context):
+    for observer in _observers.get():
+        observer(sql)
+    return execute(sql, params, many, context)
+
+
+def install(connection, **kwargs):
+    if dispatch_to_observers not in connection.execute_wrappers:
+        connection.execute_wrappers.append(dispatch_to_observers)
+
+
+@contextmanager
+def observe_sql(observer):
+    """Call ``observer(sql)`` for every statement run in this context."""
+    # The connection may predate the connection_created receiver
+    install(connection)
+    token = _observers.set((*_observers.get(), observer))
+    try:
+        yield observer
+    finally:
+        _observers.reset(token)
@@ -0,0 +1,74 @@
+from django.db import connection, transaction
+from django.db.models import F
+
+from .models import Product
+from .response_cache import invalidate
+
+LOW_STOCK_THRESHOLD = 10
+RESTOCK_INCREMENT = 10
+RESTOCK_CHUNK_SIZE = 500
+
+
+def supports_update_returning():
+    # SQLite added UPDATE ... RETURNING in 3.35, together with INSERT ... RETURNING
+    if connection.vendor == "postgresql":
+        return True
+    return connection.vendor == "sqlite" and connection.features.can_return_columns_from_insert
+
+
+def restock_low_stock(threshold=LOW_STOCK_THRESHOLD, increment=RESTOCK_INCREMENT,
+                      chunk_size=RESTOCK_CHUNK_SIZE, id_range=None):
+    """
+    Add ``increment`` to every product with ``stock < threshold`` and return
+    the updated products. ``id_range`` ([low, high) primary keys) restricts
+    the products considered, for the chunked Celery job in crm/tasks.py.
+
+    The increment is an F() expression evaluated by the database, so orders
+    written concurrently are never overwritten with a stale stock value.
+    Neither path sends post_save, so cached responses are invalidated here.
+    """
+    low, high = id_range or (0, None)
+    if supports_update_returning():
+        updated = _restock_returning(threshold, increment, low, high)
+    else:
+        updated = _restock_chunked(threshold, increment, chunk_size, low, high)
+    if updated:
+        invalidate(Product)
+    return updated
+
+
+def _restock_returning(threshold, increment, low, high):
+    # One statement: the rows come back from the UPDATE itself
+    qn = connection.ops.quote_name
+    table = qn(Product._meta.db_table)
+    stock = qn(Product._meta.get_field("stock").column)
+    pk = qn(Product._meta.pk.column)
+    columns = ", ".join(qn(f.column) for f in Product._meta.concrete_fields)
+    where, params = f"{stock} < %s AND {pk} >= %s", [threshold, low]
+    if high is not None:
+        where, params = f"{where} AND {pk} < %s", [*params, high]
+    sql = f"UPDATE {table} SET {stock} = {stock} + %s WHERE {where} RETURNING {columns}"
+    with transaction.atomic():
+        return list(Product.objects.raw(sql, [increment, *params]))
+
+
+def _restock_chunked(threshold, increment, chunk_size, low, high):
+    # Backends without UPDATE ... RETURNING: keyset over the ids, one bulk
+    # UPDATE and one re-read per chunk, all in a single transaction
+    updated = []
+    last_pk = low - 1
+    products = Product.objects.filter(pk__lt=high) if high is not None else Product.objects.all()
+    with transaction.atomic():
+        while True:
+            ids = list(
+                products.select_for_update()
+                .filter(stock__lt=threshold, pk__gt=last_pk)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:chunk_size]
+            )
+            if not ids:
+                break
+            Product.objects.filter(pk__in=ids).update(stock=F("stock") + increment)
+            updated.extend(Product.objects.filter(pk__in=ids).order_by("pk"))
+            last_pk = ids[-1]
+    return updated
@@ -0,0 +1,197 @@
+import asyncio
+from collections import defaultdict
+from functools import partial
+from operator import attrgetter
+
+from .aio import is_async
+from .models import Customer, CustomerStats, Order, Product
+
+
+class BatchLoader:
+    """
+    Synchronous DataLoader.
+
+    graphql-core resolves a list depth-first, so there is no tick to wait on
+    before dispatching a batch. Instead every parent that reaches the client
+    (a connection page, or the result of another loader) queues its key, and
+    the first load() miss fetches all queued keys with one IN (...) query.
+    """
+
+    def __init__(self, batch_load_fn, default=None):
+        self.batch_load_fn = batch_load_fn
+        self.default = default
+        self._cache = {}
+        self._queue = {}
+
+    def queue(self, key):
+        if key is not None and key not in self._cache:
+            self._queue[key] = None
+
+    def load(self, key):
+        if key not in self._cache:
+            self.queue(key)
+            keys = list(self._queue)
+            self._queue.clear()
+            results = self.batch_load_fn(keys)
+            for k in keys:
+                self._cache[k] = results.get(k, self.default() if self.default else None)
+        return self._cache[key]
+
+
+class AsyncBatchLoader:
+    """
+    asyncio DataLoader for the async view.
+
+    load() returns a future. Sibling resolvers run as tasks of one gather(),
+    so every key requested before the loop gets back to the dispatch task,
+    together with the keys queued by ``queue()``, is fetched in one batch.
+    """
+
+    def __init__(self, batch_load_fn, default=None):
+        self.batch_load_fn = batch_load_fn
+        self.default = default
+        self._cache = {}
+        self._queue = {}
+        self._pending = {}
+        self._dispatch = None
+
+    def queue(self, key):
+        if key is not None and key not in self._cache:
+            self._queue[key] = None
+
+    def load(self, key):
+        future = self._cache.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._cache[key] = self._pending[key] = loop.create_future()
+            if self._dispatch is None:
+                self._dispatch = loop.create_task(self._dispatch_batch())
+        return future
+
+    async def _dispatch_batch(self):
+        pending, self._pending, self._dispatch = self._pending, {}, None
+        keys = [*pending, *(k for k in self._queue if k not in self._cache)]
+        self._queue.clear()
+        try:
+            results = await self.batch_load_fn(keys)
+        except Exception as e:
+            for future in pending.values():
+                future.set_exception(e)
+            return
+        loop = asyncio.get_running_loop()
+        for k in keys:
+            future = pending.get(k)
+            if future is None:
+                future = self._cache[k] = loop.create_future()
+            future.set_result(results.get(k, self.default() if self.default else None))
+
+
+class Relation:
+    """How one loader fetches and groups its rows; shared by both loader kinds."""
+
+    def __init__(self, query, key, value=None, many=False):
+        self.query = query
+        self.key = key
+        self.value = value or (lambda row: row)
+        self.many = many
+
+    def group(self, rows):
+        if not self.many:
+            return {self.key(row): self.value(row) for row in rows}
+        grouped = defaultdict(list)
+        for row in rows:
+            grouped[self.key(row)].append(self.value(row))
+        return grouped
+
+    def instances(self, grouped):
+        return (obj for objs in grouped.values() for obj in objs) if self.many else grouped.values()
+
+
+OrderProducts = Order.products.through
+
+RELATIONS = {
+    "customer": Relation(lambda keys: Customer.objects.filter(pk__in=keys), key=attrgetter("pk")),
+    "product": Relation(lambda keys: Product.objects.filter(pk__in=keys), key=attrgetter("pk")),
+    "customer_stats": Relation(
+        lambda keys: CustomerStats.objects.filter(customer_id__in=keys), key=attrgetter("customer_id"),
+    ),
+    "customer_orders": Relation(
+        lambda keys: Order.objects.filter(customer_id__in=keys).order_by("pk"),
+        key=attrgetter("customer_id"), many=True,
+    ),
+    "order_products": Relation(
+        lambda keys: OrderProducts.objects.filter(order_id__in=keys).select_related("product").order_by("product_id"),
+        key=attrgetter("order_id"), value=attrgetter("product"), many=True,
+    ),
+    "product_orders": Relation(
+        lambda keys: OrderProducts.objects.filter(product_id__in=keys).select_related("order").order_by("order_id"),
+        key=attrgetter("product_id"), value=attrgetter("order"), many=True,
+    ),
+}
+
+
+class Loaders:
+    """
+    All loaders for one request, stored on ``info.context``. With
+    ``asynchronous`` the loaders return futures and read through the async
+    ORM.
+    """
+
+    def __init__(self, asynchronous=False):
+        for name, relation in RELATIONS.items():
+            default = list if relation.many else None
+            if asynchronous:
+                loader = AsyncBatchLoader(partial(self._aload, relation), default=default)
+            else:
+                loader = BatchLoader(partial(self._load, relation), default=default)
+            setattr(self, name, loader)
+
+    def prime(self, instances):
+        # Queue the relations of every instance the client is about to see
+        for obj in instances:
+            if isinstance(obj, Order):
+                if not Order.customer.is_cached(obj):
+                    self.customer.queue(obj.customer_id)
+                self.order_products.queue(obj.pk)
+            elif isinstance(obj, Customer):
+                self.customer_orders.queue(obj.pk)
+                if not Customer.stats.is_cached(obj):
+                    self.customer_stats.queue(obj.pk)
+            else:
+                self.product_orders.queue(obj.pk)
+        return instances
+
+    def _load(self, relation, keys):
+        grouped = relation.group(relation.query(keys))
+        self.prime(relation.instances(grouped))
+        return grouped
+
+    async def _aload(self, relation, keys):
+        grouped = relation.group([row async for row in relation.query(keys)])
+        self.prime(relation.instances(grouped))
+        return grouped
+
+
+def get_loaders(info):
+    context = info.context
+    loaders = getattr(context, "crm_loaders", None)
+    if loaders is None:
+        loaders = Loaders(asynchronous=is_async(info))
+        if context is not None:
+            context.crm_loaders = loaders
+    return loaders
+
+
+def is_batchable(iterable):
+    # Loader and prefetch results are plain lists; querysets and managers
+    # still go through the filterset
+    return isinstance(iterable, list)
+
+
+def load_related(obj, name, loader_name, info):
+    """Serve ``obj.<name>`` from the prefetch cache if the optimizer filled it."""
+    loaders = get_loaders(info)
+    cache = getattr(obj, "_prefetched_objects_cache", {})
+    if name in cache:
+        return loaders.prime(list(cache[name]))
+    return getattr(loaders, loader_name).load(obj.pk)
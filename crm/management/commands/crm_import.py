@@ -0,0 +1,285 @@
+"""
+Stream customers, products or orders from a CSV or NDJSON file into the CRM.
+
+    python manage.py crm_import customers customers.csv
+    python manage.py crm_import orders orders.ndjson --chunk-size 2000 --resume
+
+Expected columns / keys:
+
+    customers  name, email, phone
+    products   name, price, stock
+    orders     customer_email, product_names ("|"-separated in CSV, a list in NDJSON)
+
+Rows are validated with the same rules as the createCustomer, createProduct
+and createOrder mutations, and orders take one unit of stock per product as
+createOrder does; an order needing a sold-out product is rejected. The file is read one record at a time and
+written in chunked bulk_create transactions; after every committed chunk the
+number of records consumed is stored in a checkpoint file so an interrupted
+run can continue with --resume.
+"""
+import csv
+import json
+import resource
+import sys
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from crm import customer_stats
+from crm.bulk import BULK_CHUNK_SIZE, PHONE_RE, chunked, clean_price
+from crm.models import Customer, Order, Product
+from crm.orders import take_stock
+from crm.response_cache import invalidate
+from crm.search import index_objects
+
+FORMATS = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson"}
+
+
+def read_records(path, fmt, skip=0):
+    """
+    Yield (record number, dict or None) without loading the whole file. The
+    first ``skip`` records are counted but not parsed.
+    """
+    with open(path, newline="", encoding="utf-8") as fh:
+        if fmt == "csv":
+            # csv.reader rather than DictReader, so skipped rows build no dict
+            reader = csv.reader(fh)
+            header = next(reader, [])
+            number = 0
+            for row in reader:
+                if not row:
+                    continue  # blank lines, as DictReader skips them
+                number += 1
+                if number > skip:
+                    yield number, dict(zip(header, row))
+            return
+        number = 0
+        for line in fh:
+            if not line.strip():
+                continue
+            number += 1
+            if number <= skip:
+                continue
+            try:
+                yield number, json.loads(line)
+            except ValueError:
+                yield number, None
+
+
+def text(record, key):
+    value = record.get(key)
+    return "" if value is None else str(value).strip()
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class Command(BaseCommand):
+    help = "Stream-import customers, products or orders from CSV/NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("model", choices=["customers", "products", "orders"])
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=["csv", "ndjson"],
+                            help="Defaults to the file extension")
+        parser.add_argument("--chunk-size", type=int, default=BULK_CHUNK_SIZE)
+        parser.add_argument("--checkpoint",
+                            help="Checkpoint file (default: <path>.checkpoint)")
+        parser.add_argument("--resume", action="store_true",
+                            help="Skip the records committed by a previous run")
+
+    def handle(self, *args, model, path, format, chunk_size, checkpoint, resume, **options):
+        path = Path(path).resolve()
+        if not path.exists():
+            raise CommandError(f"{path} does not exist")
+        fmt = format or FORMATS.get(path.suffix.lower())
+        if fmt is None:
+            raise CommandError("Cannot infer the format; pass --format csv|ndjson")
+        if chunk_size <= 0:
+            raise CommandError("--chunk-size must be positive")
+
+        self.verbosity = options["verbosity"]
+        self.checkpoint = Path(checkpoint) if checkpoint else path.with_name(path.name + ".checkpoint")
+        self.model = model
+        self.path = path
+        self.position = self.skip = self.read_checkpoint() if resume else 0
+        self.created = self.rejected = 0
+
+        clean = getattr(self, f"clean_{model}")
+        write = getattr(self, f"write_{model}")
+        records = read_records(path, fmt, skip=self.skip)
+
+        start = time.perf_counter()
+        for chunk in chunked(clean(records), chunk_size):
+            with transaction.atomic():
+                self.created += write(chunk)
+            self.write_checkpoint()
+            if self.verbosity >= 2:
+                self.report(start, prefix="  ... ")
+        self.checkpoint.unlink(missing_ok=True)
+        self.report(start)
+
+    # --- checkpoints -------------------------------------------------------
+
+    def read_checkpoint(self):
+        if not self.checkpoint.exists():
+            return 0
+        state = json.loads(self.checkpoint.read_text())
+        if state.get("model") != self.model or state.get("path") != str(self.path):
+            raise CommandError(f"{self.checkpoint} belongs to a different import")
+        return state["records"]
+
+    def write_checkpoint(self):
+        state = {"model": self.model, "path": str(self.path), "records": self.position}
+        self.checkpoint.write_text(json.dumps(state))
+
+    def report(self, start, prefix=""):
+        elapsed = time.perf_counter() - start
+        processed = self.position - self.skip
+        rate = processed / elapsed if elapsed else 0
+        self.stdout.write(
+            f"{prefix}{self.created} created, {self.rejected} rejected, "
+            f"{processed} records in {elapsed:.1f}s ({rate:.0f} rows/sec), "
+            f"peak RSS {peak_rss_mb():.1f} MB"
+        )
+
+    # --- validation --------------------------------------------------------
+
+    def validated(self, records, clean_one):
+        # Record the position before yielding: once the chunk holding this
+        # row commits, everything up to it is done
+        for number, record in records:
+            self.position = number
+            try:
+                if not isinstance(record, dict):
+                    raise ValueError("Malformed record")
+                yield clean_one(record)
+            except ValueError as e:
+                self.reject(number, e)
+
+    def reject(self, number, error):
+        self.rejected += 1
+        if self.verbosity >= 1:
+            self.stderr.write(f"record {number}: {error}")
+
+    def clean_customers(self, records):
+        emails = set(Customer.objects.values_list("email", flat=True).iterator())
+
+        def clean_one(record):
+            name, email, phone = text(record, "name"), text(record, "email"), text(record, "phone")
+            if not name or not email:
+                raise ValueError("name and email are required")
+            if phone and not PHONE_RE.match(phone):
+                raise ValueError("Invalid phone format")
+            if email in emails:
+                raise ValueError(f"Email {email} exists")
+            emails.add(email)
+            return Customer(name=name, email=email, phone=phone or None)
+
+        return self.validated(records, clean_one)
+
+    def clean_products(self, records):
+        def clean_one(record):
+            name = text(record, "name")
+            if not name:
+                raise ValueError("name is required")
+            stock = int(text(record, "stock") or 0)
+            if stock < 0:
+                raise ValueError("stock must not be negative")
+            return Product(name=name, price=clean_price(record.get("price")), stock=stock)
+
+        return self.validated(records, clean_one)
+
+    def clean_orders(self, records):
+        customer_ids = dict(Customer.objects.values_list("email", "pk").iterator())
+        products = {}
+        for name, pk, price in Product.objects.order_by("pk").values_list("name", "pk", "price").iterator():
+            products.setdefault(name, (pk, price))
+
+        def clean_one(record):
+            customer_id = customer_ids.get(text(record, "customer_email"))
+            if customer_id is None:
+                raise ValueError("Invalid Customer email")
+            names = record.get("product_names") or []
+            if isinstance(names, str):
+                names = names.split("|")
+            elif not isinstance(names, list):
+                raise ValueError("product_names must be a list or a \"|\"-separated string")
+            product_ids = {}
+            for name in (str(n).strip() for n in names):
+                if name not in products:
+                    raise ValueError(f"Unknown product {name!r}")
+                pk, price = products[name]
+                product_ids[pk] = price
+            if not product_ids:
+                raise ValueError("No products")
+            order = Order(customer_id=customer_id, total_amount=sum(product_ids.values()))
+            # The record number, for the stock errors write_orders reports
+            return self.position, order, list(product_ids)
+
+        return self.validated(records, clean_one)
+
+    # --- writers -----------------------------------------------------------
+
+    # Each writer returns how many rows it stored. bulk_create sends no
+    # post_save, so the search index is fed, cached GraphQL responses are
+    # invalidated and CustomerStats is updated directly
+
+    def write_customers(self, customers):
+        created = Customer.objects.bulk_create(customers)
+        index_objects(Customer, created)
+        invalidate(Customer)
+        customer_stats.create_rows([c.pk for c in created])
+        return len(created)
+
+    def write_products(self, products):
+        created = Product.objects.bulk_create(products)
+        index_objects(Product, created)
+        invalidate(Product)
+        return len(created)
+
+    def write_orders(self, rows):
+        products = {
+            p.pk: p
+            for p in Product.objects.select_for_update()
+            .filter(pk__in={pk for _, _, product_ids in rows for pk in product_ids})
+            .only("pk", "name", "stock")
+        }
+        # Products deleted since clean_orders read the names
+        placeable = []
+        for number, order, product_ids in rows:
+            if all(pk in products for pk in product_ids):
+                placeable.append((number, order, product_ids))
+            else:
+                self.reject(number, "Unknown product")
+        sold_out = take_stock([[products[pk] for pk in product_ids] for _, _, product_ids in placeable])
+
+        orders, lines = [], []
+        for (number, order, product_ids), out_of_stock in zip(placeable, sold_out):
+            if out_of_stock:
+                self.reject(number, f"Out of stock: {', '.join(out_of_stock)}")
+                continue
+            orders.append(order)
+            lines.append(product_ids)
+        if not orders:
+            return 0
+        if connection.features.can_return_rows_from_bulk_insert:
+            Order.objects.bulk_create(orders)
+        else:
+            for order in orders:
+                order.save()
+        Through = Order.products.through
+        Through.objects.bulk_create(
+            Through(order_id=order.pk, product_id=product_id)
+            for order, product_ids in zip(orders, lines)
+            for product_id in product_ids
+        )
+        invalidate(Product)
+        invalidate(Order)
+        customer_stats.rebuild({order.customer_id for order in orders})
+        return len(orders)
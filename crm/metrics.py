@@ -0,0 +1,163 @@
+"""
+In-process metrics rendered in the Prometheus text format on /metrics.
+
+Histograms are cumulative since the process started, as Prometheus
+expects; rates and percentiles over a window come from the scraper
+(rate(), histogram_quantile()). Each worker process exposes its own
+numbers.
+"""
+import bisect
+import threading
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+# Operation names come from clients; past this many label values new ones
+# are folded into "other" so a misbehaving client cannot grow the registry
+MAX_LABEL_VALUES = 200
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                if len(self._series) >= MAX_LABEL_VALUES:
+                    labelvalues = ("other",) * len(self.labelnames)
+                series = self._series.setdefault(labelvalues, [[0] * len(self.buckets), 0, 0.0])
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += 1
+            series[2] += value
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: (list(counts), count, total) for labels, (counts, count, total) in self._series.items()}
+        for labelvalues, (counts, count, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                labels = _labels(self.labelnames, labelvalues, [("le", bound)])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.labelnames, labelvalues, [("le", "+Inf")])
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *labelvalues):
+        with self._lock:
+            if labelvalues not in self._values and len(self._values) >= MAX_LABEL_VALUES:
+                labelvalues = ("other",) * len(self.labelnames)
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f"{self.name}{_labels(self.labelnames, labels)} {value}" for labels, value in values)
+        return lines
+
+
+class CallbackMetric:
+    """Counters or gauges read from somewhere else at scrape time."""
+
+    def __init__(self, name, help_text, kind, read):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.read = read
+
+    def collect(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", f"{self.name} {self.read()}"]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        return "\n".join(line for metric in self.metrics for line in metric.collect()) + "\n"
+
+
+registry = Registry()
+
+operation_duration = registry.register(Histogram(
+    "crm_graphql_operation_duration_seconds", "Time to execute a GraphQL operation",
+    labelnames=("operation", "type"),
+))
+operation_sql_queries = registry.register(Histogram(
+    "crm_graphql_operation_sql_queries", "SQL queries issued by one GraphQL operation",
+    labelnames=("operation", "type"), buckets=COUNT_BUCKETS,
+))
+duplicate_sql = registry.register(Counter(
+    "crm_graphql_duplicate_sql_total",
+    "SQL statements repeated within one operation (likely N+1), counted beyond the first run",
+    labelnames=("operation",),
+))
+field_duration = registry.register(Histogram(
+    "crm_graphql_root_field_resolve_seconds", "Resolver time of root Query/Mutation fields",
+    labelnames=("field",),
+))
+
+# Cache counters kept by crm/documents.py and crm/response_cache.py
+from .documents import document_cache, persisted_queries  # noqa: E402
+from .response_cache import stats as response_cache_stats  # noqa: E402
+
+for _name, _help, _read in (
+    ("crm_graphql_document_cache_hits_total", "Validated document cache hits",
+     lambda: document_cache.info()["hits"]),
+    ("crm_graphql_document_cache_misses_total", "Validated document cache misses",
+     lambda: document_cache.info()["misses"]),
+    ("crm_graphql_document_cache_evictions_total", "Validated document cache evictions",
+     lambda: document_cache.info()["evictions"]),
+    ("crm_graphql_persisted_query_hits_total", "Persisted query lookups found",
+     lambda: persisted_queries.info()["hits"]),
+    ("crm_graphql_persisted_query_misses_total", "Persisted query lookups not found",
+     lambda: persisted_queries.info()["misses"]),
+    ("crm_graphql_response_cache_hits_total", "Response cache hits",
+     lambda: response_cache_stats.info()["hits"]),
+    ("crm_graphql_response_cache_misses_total", "Response cache misses",
+     lambda: response_cache_stats.info()["misses"]),
+    ("crm_graphql_response_cache_invalidations_total", "Response cache tag bumps",
+     lambda: response_cache_stats.info()["invalidations"]),
+):
+    registry.register(CallbackMetric(_name, _help, "counter", _read))
+registry.register(CallbackMetric(
+    "crm_graphql_document_cache_size", "Documents in the validated document cache", "gauge",
+    lambda: document_cache.info()["size"],
+))
@@ -0,0 +1,48 @@
+from django.db import OperationalError, migrations
+
+# (table, indexed columns) for the FTS5 search backend in crm/search.py
+FTS_TABLES = [
+    ('crm_customer', ('name', 'email')),
+    ('crm_product', ('name',)),
+]
+
+
+def create_fts_tables(apps, schema_editor):
+    # SQLite only; elsewhere crm.search falls back to its trigram index
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for table, columns in FTS_TABLES:
+            cols = ', '.join(columns)
+            try:
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE {table}_fts USING fts5({cols}, tokenize='trigram')"
+                )
+            except OperationalError as e:
+                # FTS5 or its trigram tokenizer (SQLite < 3.34) is missing;
+                # anything else is a real failure
+                if 'no such module' not in str(e) and 'no such tokenizer' not in str(e):
+                    raise
+                return
+            cursor.execute(
+                f"INSERT INTO {table}_fts (rowid, {cols}) SELECT id, {cols} FROM {table}"
+            )
+
+
+def drop_fts_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for table, _ in FTS_TABLES:
+            cursor.execute(f"DROP TABLE IF EXISTS {table}_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0004_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_tables, drop_fts_tables),
+    ]
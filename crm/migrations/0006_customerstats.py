@@ -0,0 +1,56 @@
+# Generated by Django 6.0 on 2026-10-18 04:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+
+BATCH_SIZE = 1000
+
+
+def backfill_customer_stats(apps, schema_editor):
+    Customer = apps.get_model('crm', 'Customer')
+    Order = apps.get_model('crm', 'Order')
+    CustomerStats = apps.get_model('crm', 'CustomerStats')
+    customers = Customer.objects.order_by('pk').values_list('pk', flat=True)
+    last_pk = 0
+    while ids := list(customers.filter(pk__gt=last_pk)[:BATCH_SIZE]):
+        totals = {
+            row['customer_id']: row
+            for row in Order.objects.filter(customer_id__in=ids).values('customer_id').annotate(
+                order_count=Count('pk'), total_spent=Sum('total_amount'), last_order_date=Max('order_date'),
+            )
+        }
+        stats = []
+        for pk in ids:
+            row = totals.get(pk, {})
+            stats.append(CustomerStats(
+                customer_id=pk,
+                order_count=row.get('order_count', 0),
+                total_spent=row.get('total_spent') or 0,
+                last_order_date=row.get('last_order_date'),
+            ))
+        CustomerStats.objects.bulk_create(stats)
+        last_pk = ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0005_search_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerStats',
+            fields=[
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='crm.customer')),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('total_spent', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('last_order_date', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['last_order_date'], name='crm_stats_last_order_idx'), models.Index(fields=['total_spent'], name='crm_stats_total_spent_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_customer_stats, migrations.RunPython.noop),
+    ]
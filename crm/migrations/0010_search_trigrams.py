@@ -0,0 +1,59 @@
+# Generated by Django 6.0 on 2026-10-18 10:20
+
+from itertools import islice
+
+from django.db import migrations, models
+
+# (model, indexed fields) for the trigram search backend in crm/search.py
+SEARCH_FIELDS = [
+    ('Customer', ('name', 'email')),
+    ('Product', ('name',)),
+]
+
+
+def index_existing_rows(apps, schema_editor):
+    # Only the trigram backend reads the postings; with the FTS5 tables of
+    # 0005 in place they are left empty
+    tables = set(schema_editor.connection.introspection.table_names())
+    if {'crm_customer_fts', 'crm_product_fts'} <= tables:
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for model_name, fields in SEARCH_FIELDS:
+            model = apps.get_model('crm', model_name)
+            rows = model.objects.values_list('pk', *fields).iterator(chunk_size=2000)
+            postings = (
+                (model._meta.db_table, pk, gram)
+                for pk, *values in rows
+                for gram in {
+                    value.lower()[i:i + 3]
+                    for value in values if value
+                    for i in range(len(value) - 2)
+                }
+            )
+            while chunk := list(islice(postings, 3000)):
+                cursor.executemany(
+                    'INSERT INTO crm_searchtrigram ("table", object_id, gram) VALUES (%s, %s, %s)', chunk
+                )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0008_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table', models.CharField(max_length=64)),
+                ('object_id', models.BigIntegerField()),
+                ('gram', models.CharField(max_length=3)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['table', 'gram', 'object_id'], name='crm_trigram_gram_idx'), models.Index(fields=['object_id', 'table'], name='crm_trigram_object_idx')],
+            },
+        ),
+        migrations.RunPython(index_existing_rows, migrations.RunPython.noop),
+    ]
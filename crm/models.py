@@ -1,29 +1,171 @@
-from django.db import models
+from django.db import models, transaction
+from django.dispatch import Signal
 
-class Customer(models.Model):
+# Sent once per delete() of an instance or queryset of the models below,
+# with ``queryset`` holding the rows about to be deleted; a receiver may
+# return a callable to run once they are gone, in the same transaction.
+# Unlike pre_delete/post_delete it costs nothing per row, and rows deleted by
+# cascade keep Django's fast path (crm/signals.py)
+bulk_delete = Signal()
+
+
+def _send_bulk_delete(model, queryset, delete):
+    with transaction.atomic():
+        callbacks = [response for _, response in bulk_delete.send(sender=model, queryset=queryset) if callable(response)]
+        result = delete()
+        for callback in callbacks:
+            callback()
+    return result
+
+
+class BulkDeleteQuerySet(models.QuerySet):
+    def delete(self):
+        return _send_bulk_delete(self.model, self, super().delete)
+
+
+class BulkDeleteModel(models.Model):
+    objects = BulkDeleteQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def delete(self, using=None, keep_parents=False):
+        queryset = type(self)._default_manager.filter(pk=self.pk)
+        return _send_bulk_delete(type(self), queryset, lambda: super(BulkDeleteModel, self).delete(using, keep_parents))
+
+class Customer(BulkDeleteModel):
     name = models.CharField(max_length=255)
     #models.CharField(max_length=100)
     email = models.EmailField(unique=True)
     phone = models.CharField(max_length=20, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # CustomerFilter: created_at_gte/lte
+            models.Index(fields=['created_at'], name='crm_customer_created_at_idx'),
+            # CustomerFilter: phone and phone_pattern (as a range)
+            models.Index(fields=['phone'], name='crm_customer_phone_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
-class Product(models.Model):
+class Product(BulkDeleteModel):
     name = models.CharField(max_length=255)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            # ProductFilter price/stock ranges and the low-stock restock scan
+            models.Index(fields=['price'], name='crm_product_price_idx'),
+            models.Index(fields=['stock'], name='crm_product_stock_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
-class Order(models.Model):
+class Order(BulkDeleteModel):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='orders')
     products = models.ManyToManyField(Product, related_name='orders')
     order_date = models.DateTimeField(auto_now_add=True)
     # We allow total_amount to be blank initially because we calculate it after adding products
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Date-window scans (order reminders, orderDateGte/Lte filters)
+            models.Index(fields=['order_date'], name='crm_order_order_date_idx'),
+            # A customer's orders by date (purge NOT EXISTS, customer.orders filters)
+            models.Index(fields=['customer', 'order_date'], name='crm_order_cust_date_idx'),
+            models.Index(fields=['total_amount'], name='crm_order_total_idx'),
+        ]
+
+    def __str__(self):
+        return f"Order {self.id} by {self.customer.name}"
+
+class CustomerStats(models.Model):
+    # Order aggregates per customer, kept current by crm/customer_stats.py
+    customer = models.OneToOneField(Customer, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    order_count = models.PositiveIntegerField(default=0)
+    total_spent = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    last_order_date = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # CustomerFilter lastOrderBefore/After, totalSpentGte/Lte and the purge
+            models.Index(fields=['last_order_date'], name='crm_stats_last_order_idx'),
+            models.Index(fields=['total_spent'], name='crm_stats_total_spent_idx'),
+        ]
+
+    def __str__(self):
+        return f"Stats for customer {self.customer_id}"
+
+class SalesRollup(models.Model):
+    # Signed per-product sales deltas per day/week/month bucket, appended by
+    # crm/sales_rollups.py and merged into one row per bucket by compaction
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='sales_rollups')
+    granularity = models.CharField(max_length=5)
+    period = models.DateTimeField()
+    order_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            # salesTimeseries range scans and compaction grouping
+            models.Index(fields=['product', 'granularity', 'period'], name='crm_rollup_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.granularity} {self.period:%Y-%m-%d} for product {self.product_id}"
+
+class SalesRollupState(models.Model):
+    # Single row: the highest Order.products through-row id folded so far
+    last_line_id = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Sales rollups folded through line {self.last_line_id}"
+
+class StockReservation(models.Model):
+    # Units taken from Product.stock and held for a client until an order
+    # consumes them, they are released, or expires_at passes (crm/reservations.py)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # The expiry sweep
+            models.Index(fields=['expires_at'], name='crm_reservation_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x product {self.product_id} until {self.expires_at:%Y-%m-%d %H:%M}"
+
+class OrderReminder(models.Model):
+    # Orders the reminder jobs have already sent a reminder for, shared by
+    # the cron script and every Celery worker (crm/cron_jobs/send_order_reminders.py)
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, primary_key=True, related_name='reminder')
+    sent_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Reminder for order {self.order_id} at {self.sent_at:%Y-%m-%d %H:%M}"
+
+class SearchTrigram(models.Model):
+    # Trigram postings of the search fields, used by crm/search.py when
+    # SQLite's FTS5 trigram tokenizer is not available
+    table = models.CharField(max_length=64)
+    object_id = models.BigIntegerField()
+    gram = models.CharField(max_length=3)
+
+    class Meta:
+        indexes = [
+            # Candidate lookup by trigram, and re-indexing/removal by row
+            models.Index(fields=['table', 'gram', 'object_id'], name='crm_trigram_gram_idx'),
+            models.Index(fields=['object_id', 'table'], name='crm_trigram_object_idx'),
+        ]
+
     def __str__(self):
-        return f"Order {self.id} by {self.customer.name}"
\ No newline at end of file
+        return f"{self.gram!r} in {self.table} {self.object_id}"
@@ -0,0 +1,109 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Manager, Prefetch
+from graphene.utils.str_converters import to_snake_case
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode
+
+from .fields import PAGINATION_ARGS
+
+
+def _iter_fields(selection_set, fragments):
+    # Flatten inline fragments and named fragment spreads into plain fields
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            yield selection
+        elif isinstance(selection, InlineFragmentNode):
+            yield from _iter_fields(selection.selection_set, fragments)
+        elif isinstance(selection, FragmentSpreadNode):
+            fragment = fragments[selection.name.value]
+            yield from _iter_fields(fragment.selection_set, fragments)
+
+
+def _children(field_nodes, fragments, name=None):
+    children = {}
+    for node in field_nodes:
+        if node.selection_set is None:
+            continue
+        for child in _iter_fields(node.selection_set, fragments):
+            key = to_snake_case(child.name.value)
+            if name is None or key == name:
+                children.setdefault(key, []).append(child)
+    return children
+
+
+def get_selected_fields(field_nodes, fragments):
+    """
+    Return {snake_case field name: [FieldNode, ...]} for the object level of
+    a selection, unwrapping ``edges { node { ... } }`` when it is a connection.
+    """
+    selected = _children(field_nodes, fragments)
+    if "edges" in selected:
+        edges = selected["edges"]
+        nodes = _children(edges, fragments, name="node").get("node", [])
+        return _children(nodes, fragments)
+    return selected
+
+
+def _is_filtered(field_nodes):
+    return any(
+        arg.name.value not in PAGINATION_ARGS
+        for node in field_nodes
+        for arg in node.arguments
+    )
+
+
+def _plan(model, selected, fragments, prefix=""):
+    opts = model._meta
+    columns = {prefix + opts.pk.attname}
+    # Foreign keys are cheap and the loaders read them off every node
+    columns.update(prefix + f.attname for f in opts.concrete_fields if f.is_relation)
+    select, prefetch = [], []
+
+    for name, nodes in selected.items():
+        try:
+            field = opts.get_field(name)
+        except FieldDoesNotExist:
+            continue
+
+        if (field.concrete and field.many_to_one) or field.one_to_one:
+            # Forward foreign keys and one-to-ones in either direction join
+            select.append(prefix + name)
+            sub_columns, sub_select, sub_prefetch = _plan(
+                field.related_model, get_selected_fields(nodes, fragments),
+                fragments, prefix=f"{prefix}{name}__",
+            )
+            columns.update(sub_columns)
+            select.extend(sub_select)
+            prefetch.extend(sub_prefetch)
+        elif field.many_to_many or field.one_to_many:
+            # A filtered nested connection builds its own queryset anyway
+            if _is_filtered(nodes):
+                continue
+            queryset = optimize(
+                field.related_model._default_manager.all(), nodes, fragments
+            )
+            prefetch.append(Prefetch(prefix + name, queryset=queryset))
+        elif field.concrete:
+            columns.add(prefix + field.attname)
+
+    return columns, select, prefetch
+
+
+def optimize(queryset, field_nodes, fragments):
+    """
+    Apply select_related, prefetch_related and only() to ``queryset`` so it
+    loads exactly what the GraphQL selection in ``field_nodes`` asks for.
+    """
+    if isinstance(queryset, Manager):
+        queryset = queryset.get_queryset()
+    columns, select, prefetch = _plan(
+        queryset.model, get_selected_fields(field_nodes, fragments), fragments
+    )
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset.only(*columns)
+
+
+def optimize_queryset(queryset, info):
+    return optimize(queryset, info.field_nodes, info.fragments)
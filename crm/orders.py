@@ -0,0 +1,192 @@
+from collections import Counter
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Case, DecimalField, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from . import customer_stats, reservations
+from .bulk import BULK_CHUNK_SIZE, chunked
+from .models import Customer, Order, Product
+from .response_cache import invalidate
+
+
+def place_order(customer_id, product_ids, reservation_ids=()):
+    """
+    Create an order for ``customer_id`` containing ``product_ids`` and take
+    one unit of stock from each product. A product with one of
+    ``reservation_ids`` has its unit taken from that reservation instead
+    (see crm/reservations.py).
+
+    Runs a fixed number of queries however many products are passed: the
+    customer check, one locked read of the products, one conditional stock
+    UPDATE, the order INSERT with its CustomerStats UPDATE (a signal) and
+    one bulk INSERT of the through-rows.
+    Unknown product ids are ignored, as createOrder always did.
+    """
+    try:
+        customer_exists = Customer.objects.filter(pk=customer_id).exists()
+    except (TypeError, ValueError):
+        customer_exists = False
+    if not customer_exists:
+        raise ValueError("Invalid Customer ID")
+    try:
+        requested = list(dict.fromkeys(int(pk) for pk in product_ids))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid product ID")
+
+    with transaction.atomic():
+        products = list(
+            Product.objects.select_for_update()
+            .filter(pk__in=requested)
+            .only("pk", "name", "price", "stock")
+        )
+        if not products:
+            raise ValueError("No products")
+        ids = [p.pk for p in products]
+        reserved = reservations.consume(reservation_ids, ids) if reservation_ids else set()
+        out_of_stock = [p.name for p in products if p.pk not in reserved and p.stock < 1]
+        if out_of_stock:
+            raise ValueError(f"Out of stock: {', '.join(out_of_stock)}")
+
+        unreserved = [pk for pk in ids if pk not in reserved]
+        # The stock__gte guard keeps this safe on backends that ignore
+        # select_for_update (SQLite)
+        decremented = Product.objects.filter(pk__in=unreserved, stock__gte=1).update(stock=F("stock") - 1)
+        if decremented != len(unreserved):
+            raise ValueError("Stock changed while placing the order, please retry")
+        # update() sends no post_save; the Order side is covered by create()
+        invalidate(Product)
+
+        order = Order.objects.create(
+            customer_id=customer_id, total_amount=sum(p.price for p in products)
+        )
+        Through = Order.products.through
+        Through.objects.bulk_create(Through(order_id=order.pk, product_id=pk) for pk in ids)
+    return order
+
+
+def place_orders(items, batch_size=BULK_CHUNK_SIZE):
+    """
+    Place many orders (objects with customer_id/product_ids) in one transaction.
+
+    Unlike calling place_order per item, the customers and the products are
+    read with one query each, totals are summed from the product prices in
+    memory, and orders and through-rows are inserted with bulk_create. Stock
+    is taken in input order; an item whose customer is unknown, or that
+    needs a product already sold out, is skipped. Returns ``(orders,
+    errors)``: the created orders in input order and one message per
+    skipped item, prefixed with its index.
+    """
+    errors, wanted = [], []
+    for index, item in enumerate(items):
+        try:
+            customer_id = int(item.customer_id)
+        except (TypeError, ValueError):
+            errors.append(f"Item {index}: Invalid Customer ID")
+            continue
+        try:
+            product_ids = list(dict.fromkeys(int(pk) for pk in item.product_ids))
+        except (TypeError, ValueError):
+            errors.append(f"Item {index}: Invalid product ID")
+            continue
+        if getattr(item, "reservation_ids", None):
+            errors.append(f"Item {index}: reservationIds are only accepted by createOrder")
+            continue
+        wanted.append((index, customer_id, product_ids))
+
+    with transaction.atomic():
+        customers = set(
+            Customer.objects.filter(pk__in={customer_id for _, customer_id, _ in wanted})
+            .values_list("pk", flat=True)
+        )
+        products = {
+            p.pk: p
+            for p in Product.objects.select_for_update()
+            .filter(pk__in={pk for _, _, product_ids in wanted for pk in product_ids})
+            .only("pk", "name", "price", "stock")
+        }
+
+        candidates, failed = [], {}
+        for index, customer_id, product_ids in wanted:
+            if customer_id not in customers:
+                failed[index] = "Invalid Customer ID"
+                continue
+            # Unknown product ids are ignored, as in place_order
+            chosen = [products[pk] for pk in product_ids if pk in products]
+            if not chosen:
+                failed[index] = "No products"
+                continue
+            candidates.append((index, customer_id, chosen))
+
+        orders, lines = [], []
+        sold_out = take_stock([chosen for _, _, chosen in candidates], batch_size)
+        for (index, customer_id, chosen), out_of_stock in zip(candidates, sold_out):
+            if out_of_stock:
+                failed[index] = f"Out of stock: {', '.join(out_of_stock)}"
+                continue
+            orders.append(Order(customer_id=customer_id, total_amount=sum(p.price for p in chosen)))
+            lines.append(chosen)
+        errors.extend(f"Item {index}: {failed[index]}" for index in sorted(failed))
+
+        if not orders:
+            return orders, errors
+        if connection.features.can_return_rows_from_bulk_insert:
+            Order.objects.bulk_create(orders, batch_size=batch_size)
+        else:
+            # The through-rows need the primary keys
+            for order in orders:
+                order.save(force_insert=True)
+        Through = Order.products.through
+        Through.objects.bulk_create(
+            (Through(order_id=order.pk, product_id=p.pk) for order, chosen in zip(orders, lines) for p in chosen),
+            batch_size=batch_size,
+        )
+        # bulk_create sends no post_save: drop cached responses and update
+        # CustomerStats here. The sales rollups fold the new lines by id.
+        invalidate(Product)
+        invalidate(Order)
+        customer_stats.rebuild({order.customer_id for order in orders})
+    return orders, errors
+
+
+def take_stock(lines, batch_size=BULK_CHUNK_SIZE):
+    """
+    Take one unit of every product of each of ``lines`` (lists of products
+    read with select_for_update) in order, inside the caller's transaction.
+    A line needing a product that earlier lines sold out takes nothing.
+    Returns the out-of-stock product names of each line, empty for the
+    lines that got their units.
+    """
+    taken, sold_out = Counter(), []
+    for chosen in lines:
+        out_of_stock = [p.name for p in chosen if p.stock - taken[p.pk] < 1]
+        if not out_of_stock:
+            taken.update(p.pk for p in chosen)
+        sold_out.append(out_of_stock)
+
+    # One guarded UPDATE per chunk of products, each taking its own quantity
+    for chunk in chunked(taken.items(), batch_size):
+        quantity = Case(*(When(pk=pk, then=Value(n)) for pk, n in chunk), output_field=IntegerField())
+        decremented = Product.objects.filter(pk__in=[pk for pk, _ in chunk], stock__gte=quantity).update(
+            stock=F("stock") - quantity
+        )
+        if decremented != len(chunk):
+            raise ValueError("Stock changed while placing the orders, please retry")
+    return sold_out
+
+
+def recompute_totals(order_ids):
+    """Set total_amount to the sum of its product prices for each order, in SQL."""
+    price_sum = (
+        Order.products.through.objects.filter(order_id=OuterRef("pk"))
+        .values("order_id")
+        .annotate(total=Sum("product__price"))
+        .values("total")
+    )
+    output = DecimalField(max_digits=10, decimal_places=2)
+    Order.objects.filter(pk__in=order_ids).update(
+        total_amount=Coalesce(Subquery(price_sum, output_field=output), Value(Decimal("0")), output_field=output)
+    )
+    invalidate(Order)
+    customer_stats.refresh(Order.objects.filter(pk__in=order_ids).values("customer_id"))
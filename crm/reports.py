@@ -0,0 +1,44 @@
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, Sum, Value
+from django.db.models.functions import Coalesce, TruncDay, TruncMonth, TruncWeek
+
+from .models import Customer, Order
+
+BUCKETS = {"day": TruncDay, "week": TruncWeek, "month": TruncMonth}
+CENT = Decimal("0.01")
+
+
+def crm_stats(date_from=None, date_to=None, group_by=None):
+    """
+    Customer/order/revenue totals computed with COUNT and SUM in the database.
+
+    ``date_from``/``date_to`` restrict the orders by order_date; the customer
+    count is always the whole table. ``group_by`` ("day", "week" or "month")
+    also returns one bucket per period that has orders.
+    """
+    orders = Order.objects.all()
+    if date_from is not None:
+        orders = orders.filter(order_date__gte=date_from)
+    if date_to is not None:
+        orders = orders.filter(order_date__lte=date_to)
+
+    revenue = Coalesce(
+        Sum("total_amount"), Value(Decimal("0")),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+    stats = orders.aggregate(order_count=Count("pk"), total_revenue=revenue)
+    # SQLite hands SUM() back as a float; round to cents like the column
+    stats["total_revenue"] = stats["total_revenue"].quantize(CENT)
+    stats["customer_count"] = Customer.objects.count()
+
+    if group_by is not None:
+        stats["buckets"] = list(
+            orders.annotate(period=BUCKETS[group_by]("order_date"))
+            .values("period")
+            .annotate(order_count=Count("pk"), revenue=revenue)
+            .order_by("period")
+        )
+        for bucket in stats["buckets"]:
+            bucket["revenue"] = bucket["revenue"].quantize(CENT)
+    return stats
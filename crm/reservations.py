@@ -0,0 +1,189 @@
+"""
+Stock reservations: units taken from Product.stock ahead of an order.
+
+:func:`reserve` moves units from a product's stock into a StockReservation
+with one conditional ``UPDATE ... SET stock = stock - n WHERE stock >= n``.
+Two clients therefore never hold the same units and stock never goes below
+zero, with or without row locks. A reservation ends in one of three ways:
+
+* createOrder with ``reservationIds`` takes the order's unit of that
+  product from the reservation instead of from stock (:func:`consume`);
+* releaseStock puts the units back (:func:`release`);
+* :func:`expire` (Celery beat, every minute) puts back the units of the
+  reservations whose expires_at has passed.
+
+Each path first claims the reservation row with a DELETE or a guarded
+UPDATE and touches Product.stock only for what it claimed, so a release
+racing the expiry sweep returns the units once.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .bulk import chunked
+from .inventory import supports_update_returning
+from .models import Product, StockReservation
+from .response_cache import invalidate
+
+RESERVATION_TTL = 15 * 60
+# Upper bounds on what one client can hold, and for how long
+RESERVATION_MAX_TTL = 24 * 3600
+RESERVATION_MAX_QUANTITY = 1000
+EXPIRE_BATCH_SIZE = 500
+
+
+def reservation_ttl():
+    return getattr(settings, "CRM_RESERVATION_TTL", RESERVATION_TTL)
+
+
+def reservation_max_ttl():
+    return getattr(settings, "CRM_RESERVATION_MAX_TTL", RESERVATION_MAX_TTL)
+
+
+def reservation_max_quantity():
+    return getattr(settings, "CRM_RESERVATION_MAX_QUANTITY", RESERVATION_MAX_QUANTITY)
+
+
+def _return_stock(quantities, batch_size=EXPIRE_BATCH_SIZE):
+    # One UPDATE per chunk of products, each getting its own quantity back
+    for chunk in chunked(quantities.items(), batch_size):
+        quantity = Case(*(When(pk=pk, then=Value(n)) for pk, n in chunk), output_field=IntegerField())
+        Product.objects.filter(pk__in=[pk for pk, _ in chunk]).update(stock=F("stock") + quantity)
+    invalidate(Product)
+
+
+def reserve(product_id, quantity=1, ttl=None):
+    """Take ``quantity`` units of ``product_id`` from stock for ``ttl`` seconds."""
+    try:
+        product_id = int(product_id)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid product ID")
+    if quantity < 1:
+        raise ValueError("Quantity must be positive")
+    if quantity > reservation_max_quantity():
+        raise ValueError(f"Quantity must be at most {reservation_max_quantity()}")
+    ttl = reservation_ttl() if ttl is None else ttl
+    if ttl <= 0:
+        raise ValueError("TTL must be positive")
+    # Checked before timedelta, which overflows on huge values
+    if ttl > reservation_max_ttl():
+        raise ValueError(f"TTL must be at most {reservation_max_ttl()} seconds")
+
+    with transaction.atomic():
+        taken = Product.objects.filter(pk=product_id, stock__gte=quantity).update(stock=F("stock") - quantity)
+        if not taken:
+            product = Product.objects.filter(pk=product_id).only("name", "stock").first()
+            if product is None:
+                raise ValueError("Invalid product ID")
+            raise ValueError(f"Out of stock: {product.name} has {product.stock} left")
+        reservation = StockReservation.objects.create(
+            product_id=product_id, quantity=quantity, expires_at=timezone.now() + timedelta(seconds=ttl)
+        )
+        invalidate(Product)
+    return reservation
+
+
+def release(reservation_id):
+    """Return a reservation's units to stock; returns it with its updated product."""
+    try:
+        reservation_id = int(reservation_id)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid reservation ID")
+    with transaction.atomic():
+        reservation = StockReservation.objects.select_for_update().filter(pk=reservation_id).first()
+        # The DELETE is the claim: an expiry sweep that got there first
+        # already returned the units
+        if reservation is None or not StockReservation.objects.filter(pk=reservation_id).delete()[0]:
+            raise ValueError("Unknown or expired reservation")
+        _return_stock({reservation.product_id: reservation.quantity})
+        reservation.product = Product.objects.get(pk=reservation.product_id)
+    return reservation
+
+
+def consume(reservation_ids, product_ids):
+    """
+    Take one unit from each of ``reservation_ids`` for an order of
+    ``product_ids``, inside the caller's transaction. Each reservation must
+    be live and for a different product of the order. Returns the product
+    ids whose unit was covered, which the caller must not take from stock.
+    """
+    try:
+        ids = {int(pk) for pk in reservation_ids}
+    except (TypeError, ValueError):
+        raise ValueError("Invalid reservation ID")
+    live = dict(
+        StockReservation.objects.select_for_update()
+        .filter(pk__in=ids, product_id__in=product_ids, expires_at__gt=timezone.now())
+        .values_list("pk", "product_id")
+    )
+    if len(live) != len(ids):
+        raise ValueError("Unknown or expired reservation, or one not for a product of this order")
+    if len(set(live.values())) != len(live):
+        raise ValueError("Only one reservation per product can be used")
+
+    used = StockReservation.objects.filter(pk__in=ids, quantity=1).delete()[0]
+    used += StockReservation.objects.filter(pk__in=ids, quantity__gt=1).update(quantity=F("quantity") - 1)
+    if used != len(ids):
+        raise ValueError("Reservation changed while placing the order, please retry")
+    return set(live.values())
+
+
+def _claim(rows):
+    """
+    Delete the reservations ``rows`` ((pk, product_id, quantity), read
+    earlier) and return ``(count, {product_id: units})`` for those this call
+    deleted. A row that a release or an order claimed or changed since it
+    was read is not counted, so its units are not returned twice.
+    """
+    quantities = Counter()
+    if supports_update_returning():
+        # Same SQLite release as DELETE ... RETURNING: the units come back
+        # from the rows actually deleted, as they were at that moment
+        qn = connection.ops.quote_name
+        meta = StockReservation._meta
+        columns = ", ".join(qn(meta.get_field(name).column) for name in ("product", "quantity"))
+        sql = (
+            f"DELETE FROM {qn(meta.db_table)} WHERE {qn(meta.pk.column)} IN ({', '.join(['%s'] * len(rows))}) "
+            f"RETURNING {columns}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [pk for pk, _, _ in rows])
+            deleted = cursor.fetchall()
+    else:
+        # One guarded DELETE per row instead
+        deleted = [
+            (product_id, quantity)
+            for pk, product_id, quantity in rows
+            if StockReservation.objects.filter(pk=pk, quantity=quantity).delete()[0]
+        ]
+    for product_id, quantity in deleted:
+        quantities[product_id] += quantity
+    return len(deleted), quantities
+
+
+def expire(now=None, batch_size=EXPIRE_BATCH_SIZE):
+    """Return the units of every reservation expired at ``now``; returns how many expired."""
+    now = now or timezone.now()
+    expired = 0
+    while True:
+        with transaction.atomic():
+            # Rows a concurrent release holds are left for it (or the next
+            # sweep); where row locks are ignored (SQLite), _claim leaves
+            # out the rows it lost
+            rows = list(
+                StockReservation.objects.select_for_update(skip_locked=True)
+                .filter(expires_at__lte=now)
+                .order_by("pk")
+                .values_list("pk", "product_id", "quantity")[:batch_size]
+            )
+            if not rows:
+                break
+            claimed, quantities = _claim(rows)
+            if quantities:
+                _return_stock(quantities)
+        expired += claimed
+    return expired
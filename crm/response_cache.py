@@ -0,0 +1,172 @@
+"""
+Cache of GraphQL query results, invalidated per model.
+
+Entries are keyed on the normalized document (crm/documents.py), the
+variables, the operation name and the viewer, and live in the Django cache
+named by CRM_RESPONSE_CACHE_ALIAS (local memory unless settings point it at
+Redis).
+
+Every entry is tagged with the models whose tables its execution actually
+read. The tags come from the SQL that ran, so filters on related models and
+search index lookups count as well. Each tag has a version counter in the
+cache. An entry records the versions it was computed under and is stale as
+soon as one of them moves. Invalidation is one ``incr`` per model and never
+has to find the entries.
+
+Versions are bumped by the signal receivers in crm/signals.py and, for
+writes that send no signals (bulk_create, queryset.update, raw SQL), by an
+explicit :func:`invalidate` call. A bump happens right away and again when
+the transaction commits. Without the second bump, a request that read the
+old rows before the commit could cache them under the new version.
+"""
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+
+from .instrumentation import observe_sql
+from .models import Customer, CustomerStats, Order, Product, SalesRollup
+
+RESPONSE_CACHE_TIMEOUT = 300
+ENTRY_PREFIX = "crm:rc:entry:"
+TAG_PREFIX = "crm:rc:tag:"
+# crm_order also matches the crm_order_products through table and
+# crm_customer the crm_customer_fts search table, which is intended.
+# crm_customer matches crm_customerstats too and crm_salesrollup its state
+# table, which only over-tags
+TAGGED_MODELS = {
+    model._meta.label: re.compile(rf"\b{model._meta.db_table}", re.IGNORECASE)
+    for model in (Customer, Product, Order, CustomerStats, SalesRollup)
+}
+
+
+def get_cache():
+    return caches[getattr(settings, "CRM_RESPONSE_CACHE_ALIAS", "default")]
+
+
+def get_timeout():
+    return getattr(settings, "CRM_RESPONSE_CACHE_TIMEOUT", RESPONSE_CACHE_TIMEOUT)
+
+
+class Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.stores = self.invalidations = 0
+
+    def count(self, name, n=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def info(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+stats = Stats()
+
+
+def cache_key(document_hash, variables, operation_name, viewer):
+    raw = json.dumps([document_hash, variables or {}, operation_name, viewer], sort_keys=True, default=str)
+    return ENTRY_PREFIX + sha256(raw.encode()).hexdigest()
+
+
+def viewer_key(request):
+    user = getattr(request, "user", None)
+    return str(user.pk) if user is not None and user.is_authenticated else "anonymous"
+
+
+def _initial_version():
+    # A tag evicted from the cache must not come back at a version an old
+    # entry was stored under, so new counters start from the clock
+    return time.time_ns()
+
+
+def tag_versions(tags=TAGGED_MODELS):
+    cache = get_cache()
+    keys = {TAG_PREFIX + tag: tag for tag in tags}
+    found = cache.get_many(keys)
+    for key in keys.keys() - found.keys():
+        cache.add(key, _initial_version(), timeout=None)
+        found[key] = cache.get(key)
+    return {tag: found[key] for key, tag in keys.items()}
+
+
+def lookup(key):
+    """Return the cached data for ``key`` if none of its tags moved since."""
+    entry = get_cache().get(key)
+    if entry is not None and tag_versions(entry["tags"]) == entry["tags"]:
+        stats.count("hits")
+        return entry["data"]
+    stats.count("misses")
+    return None
+
+
+def store(key, data, versions, tables):
+    entry = {"data": data, "tags": {tag: versions[tag] for tag in tables}}
+    get_cache().set(key, entry, get_timeout())
+    stats.count("stores")
+
+
+class TableRecorder:
+    """SQL observer that notes which tagged models' tables a block read."""
+
+    def __init__(self):
+        self.tags = set()
+
+    def __call__(self, sql):
+        for tag, pattern in TAGGED_MODELS.items():
+            if tag not in self.tags and pattern.search(sql):
+                self.tags.add(tag)
+
+
+@contextmanager
+def record_tables():
+    with observe_sql(TableRecorder()) as recorder:
+        yield recorder.tags
+
+
+def _bump(labels):
+    cache = get_cache()
+    for label in labels:
+        key = TAG_PREFIX + label
+        # add() is a no-op when the key exists, so incr() always has a base
+        cache.add(key, _initial_version(), timeout=None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Evicted between add() and incr()
+            cache.set(key, _initial_version(), timeout=None)
+    stats.count("invalidations", len(labels))
+
+
+class _CommitBump:
+    def __init__(self, label):
+        self.label = label
+
+    def __call__(self):
+        _bump([self.label])
+
+
+def invalidate(*models):
+    labels = [model._meta.label for model in models]
+    _bump(labels)
+    # One commit-time bump per model and transaction is enough; a purge
+    # deleting thousands of rows would otherwise queue one per row. Callbacks
+    # of rolled back savepoints are dropped by Django, so are these
+    pending = {func.label for _, func, _ in connection.run_on_commit if isinstance(func, _CommitBump)}
+    for label in labels:
+        if label not in pending:
+            transaction.on_commit(_CommitBump(label))
@@ -0,0 +1,48 @@
+"""
+Optional read replica for GraphQL query operations.
+
+When CRM_SQLITE_REPLICA names a replicated copy of the database (LiteFS,
+Litestream or similar), the settings add it as the "replica" database and
+install :class:`ReadReplicaRouter`. The views run query operations inside
+:func:`replica_reads`, so their resolvers read from the replica. Everything
+else reads the primary. That covers mutations, batched requests (they run
+in a transaction on the primary, so a query after a mutation sees its
+writes), Celery jobs and exports.
+
+The replica can lag behind the primary, and a query cached in that window
+keeps the lagging result until its models change again.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA = "replica"
+
+_replica_reads = ContextVar("crm_replica_reads", default=False)
+
+
+@contextmanager
+def replica_reads():
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both databases hold the same rows
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
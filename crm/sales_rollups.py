@@ -0,0 +1,232 @@
+"""
+Per-product sales by day, week and month for the salesTimeseries query.
+
+A sale is one Order.products line: it counts one order for the product and
+the product's price as revenue. Rather than scanning orders per query, the
+lines are folded into SalesRollup buckets:
+
+* :func:`fold` (Celery beat, every minute) aggregates the lines added since
+  the watermark in SalesRollupState and appends one signed delta row per
+  (product, granularity, bucket). Lines only ever get new ids, so this sees
+  createOrder, ``products.add()`` and the bulk paths without any signal;
+* removing lines that were already folded (``products.remove()/clear()``,
+  deleting an order or its customer) appends the matching negative deltas
+  through :func:`retract`, from the receivers in crm/signals.py;
+* :func:`compact` (hourly) merges each bucket's deltas into a single row;
+* :func:`backfill` recomputes the buckets of a date range from the lines.
+  It runs nightly over the last days to absorb what deltas cannot see: a
+  product's price changing between fold and retraction, an order_date
+  edited after folding, or (on backends with concurrent writers) a line
+  committed after a higher id was folded.
+
+:func:`timeseries` reads the bucket rows of one product plus the lines not
+folded yet, so its cost follows the number of buckets, not of orders.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Count, Max, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .bulk import chunked
+from .models import Order, SalesRollup, SalesRollupState
+from .response_cache import invalidate
+
+FOLD_BATCH_SIZE = 10000
+COMPACT_BATCH_SIZE = 200
+CENT = Decimal("0.01")
+
+Line = Order.products.through
+
+
+def _day(moment):
+    return timezone.localtime(moment).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(start):
+    return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+# Bucket start for a moment, and the start of the bucket after it, in the
+# current time zone like the Trunc* functions
+BUCKETS = {
+    "day": _day,
+    "week": lambda moment: _day(moment) - timedelta(days=_day(moment).weekday()),
+    "month": lambda moment: _day(moment).replace(day=1),
+}
+NEXT_BUCKET = {
+    "day": lambda start: start + timedelta(days=1),
+    "week": lambda start: start + timedelta(days=7),
+    "month": _next_month,
+}
+
+
+def _state(for_update=False):
+    states = SalesRollupState.objects.select_for_update() if for_update else SalesRollupState.objects
+    state, _ = states.get_or_create(pk=1)
+    return state
+
+
+def _lines(queryset):
+    return queryset.values_list("pk", "product_id", "product__price", "order__order_date")
+
+
+def _aggregate(lines, granularities=BUCKETS):
+    """{(product_id, granularity, bucket): [order_count, revenue]} for ``lines``."""
+    totals = defaultdict(lambda: [0, Decimal("0")])
+    for _, product_id, price, ordered in lines:
+        for granularity in granularities:
+            total = totals[product_id, granularity, BUCKETS[granularity](ordered)]
+            total[0] += 1
+            total[1] += price
+    return totals
+
+
+def _rows(totals, sign=1):
+    return [
+        SalesRollup(
+            product_id=product_id, granularity=granularity, period=period,
+            order_count=sign * count, revenue=sign * revenue,
+        )
+        for (product_id, granularity, period), (count, revenue) in totals.items()
+    ]
+
+
+def fold(batch_size=FOLD_BATCH_SIZE):
+    """Fold the lines added since the last run; returns how many were folded."""
+    folded = 0
+    while True:
+        with transaction.atomic():
+            state = _state(for_update=True)
+            lines = list(_lines(Line.objects.filter(pk__gt=state.last_line_id).order_by("pk")[:batch_size]))
+            if not lines:
+                break
+            SalesRollup.objects.bulk_create(_rows(_aggregate(lines)))
+            state.last_line_id = lines[-1][0]
+            state.save(update_fields=["last_line_id"])
+        folded += len(lines)
+    if folded:
+        invalidate(SalesRollup)
+    return folded
+
+
+def retract(lines):
+    """Append negative deltas for the folded rows among ``lines`` (a Line queryset)."""
+    watermark = SalesRollupState.objects.filter(pk=1).values("last_line_id")
+    folded = list(_lines(lines.filter(pk__lte=Subquery(watermark))))
+    if folded:
+        SalesRollup.objects.bulk_create(_rows(_aggregate(folded), sign=-1))
+        invalidate(SalesRollup)
+
+
+def compact(batch_size=COMPACT_BATCH_SIZE):
+    """Merge every bucket's delta rows into one; returns how many buckets were merged."""
+    keys = ("product_id", "granularity", "period")
+    # Only rows up to here are merged: deltas fold() and retract() append
+    # meanwhile get higher ids and are left for the next run
+    high = SalesRollup.objects.aggregate(high=Max("pk"))["high"]
+    if high is None:
+        return 0
+    rows = SalesRollup.objects.filter(pk__lte=high)
+    buckets = list(rows.values(*keys).annotate(rows=Count("pk")).filter(rows__gt=1).order_by())
+    for batch in chunked(buckets, batch_size):
+        # A bucket's rows are summed and replaced in one transaction, so
+        # readers see either the deltas or their sum
+        with transaction.atomic():
+            deltas = rows.filter(reduce(or_, (Q(**{k: b[k] for k in keys}) for b in batch)))
+            groups = list(
+                deltas.values(*keys)
+                .annotate(total_orders=Sum("order_count"), total_revenue=Sum("revenue"))
+                .order_by()
+            )
+            deltas.delete()
+            SalesRollup.objects.bulk_create(
+                SalesRollup(
+                    product_id=g["product_id"], granularity=g["granularity"], period=g["period"],
+                    order_count=g["total_orders"], revenue=Decimal(g["total_revenue"]).quantize(CENT),
+                )
+                # Buckets whose sales were all retracted are dropped
+                for g in groups if g["total_orders"]
+            )
+    if buckets:
+        invalidate(SalesRollup)
+    return len(buckets)
+
+
+def backfill(date_from=None, date_to=None):
+    """
+    Recompute every bucket overlapping [date_from, date_to] from the folded
+    lines (all buckets when both are None). Returns how many rows were written.
+    """
+    with transaction.atomic():
+        state = _state(for_update=True)
+        lines = Line.objects.filter(pk__lte=state.last_line_id)
+        ranges = {}
+        for granularity, bucket in BUCKETS.items():
+            start = bucket(date_from) if date_from is not None else None
+            end = NEXT_BUCKET[granularity](bucket(date_to)) if date_to is not None else None
+            ranges[granularity] = (start, end)
+            stale = SalesRollup.objects.filter(granularity=granularity)
+            if start is not None:
+                stale = stale.filter(period__gte=start)
+            if end is not None:
+                stale = stale.filter(period__lt=end)
+            stale.delete()
+        # The widest range covers the others; each bucket keeps its own
+        starts = [start for start, _ in ranges.values() if start is not None]
+        ends = [end for _, end in ranges.values() if end is not None]
+        if starts:
+            lines = lines.filter(order__order_date__gte=min(starts))
+        if ends:
+            lines = lines.filter(order__order_date__lt=max(ends))
+
+        totals = _aggregate(_lines(lines.order_by()).iterator(chunk_size=FOLD_BATCH_SIZE))
+        for key in list(totals):
+            start, end = ranges[key[1]]
+            if (start is not None and key[2] < start) or (end is not None and key[2] >= end):
+                del totals[key]
+        rows = SalesRollup.objects.bulk_create(_rows(totals), batch_size=FOLD_BATCH_SIZE)
+    invalidate(SalesRollup)
+    return len(rows)
+
+
+def timeseries(product_id, granularity, date_from=None, date_to=None):
+    """
+    [{"period", "order_count", "revenue"}] for each ``granularity`` bucket of
+    ``product_id`` overlapping [date_from, date_to] that has sales, oldest first.
+    """
+    buckets = SalesRollup.objects.filter(product_id=product_id, granularity=granularity)
+    unfolded = Line.objects.filter(product_id=product_id)
+    if date_from is not None:
+        buckets = buckets.filter(period__gte=BUCKETS[granularity](date_from))
+        unfolded = unfolded.filter(order__order_date__gte=BUCKETS[granularity](date_from))
+    if date_to is not None:
+        buckets = buckets.filter(period__lte=date_to)
+        unfolded = unfolded.filter(order__order_date__lt=NEXT_BUCKET[granularity](BUCKETS[granularity](date_to)))
+
+    # One snapshot for the rollups and the tail, so a concurrent fold is
+    # counted once (SQLite transactions read from a single snapshot)
+    with transaction.atomic():
+        totals = {
+            row["period"]: [row["total_orders"], row["total_revenue"]]
+            for row in buckets.values("period")
+            .annotate(total_orders=Sum("order_count"), total_revenue=Sum("revenue"))
+            .order_by()
+        }
+        watermark = SalesRollupState.objects.filter(pk=1).values("last_line_id")
+        tail = unfolded.filter(pk__gt=Coalesce(Subquery(watermark), 0))
+        for (_, _, period), (count, revenue) in _aggregate(_lines(tail), [granularity]).items():
+            total = totals.setdefault(period, [0, Decimal("0")])
+            total[0] += count
+            total[1] = Decimal(total[1]) + revenue
+
+    return [
+        {"period": period, "order_count": count, "revenue": Decimal(revenue).quantize(CENT)}
+        for period, (count, revenue) in sorted(totals.items())
+        if count
+    ]
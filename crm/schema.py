@@ -1,59 +1,165 @@
 import graphene
 from graphene_django import DjangoObjectType
-from graphene_django.filter import DjangoFilterConnectionField
-from .models import Customer, Product, Order
+from graphene_django.utils import bypass_get_queryset
+from .models import Customer, CustomerStats, Product, Order, StockReservation
+from .aio import call_sync, is_async, then
 from .filters import CustomerFilter, ProductFilter, OrderFilter  # Import our new filters
-import re
-from decimal import Decimal
+from .bulk import BULK_CHUNK_SIZE, PHONE_RE, bulk_create_customers, bulk_create_products, clean_price
+from .fields import CRMConnection, CRMFilterConnectionField, has_filter_args
+from .inventory import LOW_STOCK_THRESHOLD, RESTOCK_INCREMENT, restock_low_stock
+from .loaders import get_loaders, load_related
+from .optimizer import optimize_queryset
+from .orders import place_order, place_orders
+from .reports import crm_stats
+from .reservations import release, reserve
+from .sales_rollups import timeseries
+from .search import ranked_search
 from crm.models import Product
-class UpdateLowStockProducts(graphene.Mutation):
-    # Output fields
-    success = graphene.Boolean()
-    message = graphene.String()
-    updated_products = graphene.List(ProductType)
+# --- 1. OUTPUT TYPES (Updated for Relay/Filtering) ---
+# get_queryset shapes every connection/node queryset to the GraphQL selection
+# (crm/optimizer.py). Relations it could not prefetch fall back to the
+# per-request loaders in crm/loaders.py, so a page of N nodes costs one extra
+# query per relation instead of N.
+# Under the async view (crm/views.py) the same resolvers return awaitables
+# that go through the async ORM (crm/aio.py).
 
-    def mutate(self, info):
-        # 1. Query products with stock < 10
-        low_stock_items = Product.objects.filter(stock__lt=10)
-        updated_list = []
-        
-        # 2. Increment stock by 10
-        for product in low_stock_items:
-            product.stock += 10
-            product.save()
-            updated_list.append(product)
-
-        # 3. Return results
-        return UpdateLowStockProducts(
-            success=True,
-            message=f"Successfully restocked {len(updated_list)} products.",
-            updated_products=updated_list
-        )
+class CRMObjectType(DjangoObjectType):
+    class Meta:
+        abstract = True
 
-# --- 1. OUTPUT TYPES (Updated for Relay/Filtering) ---
+    @classmethod
+    def get_queryset(cls, queryset, info):
+        return optimize_queryset(queryset, info)
+
+    @classmethod
+    def get_node(cls, info, id):
+        if not is_async(info):
+            return super().get_node(info, id)
+        return cls.aget_node(info, id)
+
+    @classmethod
+    async def aget_node(cls, info, id):
+        queryset = cls.get_queryset(cls._meta.model._default_manager, info)
+        try:
+            return await queryset.aget(pk=id)
+        except cls._meta.model.DoesNotExist:
+            return None
+
+class CustomerStatsType(DjangoObjectType):
+    # Maintained incrementally from order writes (crm/customer_stats.py)
+    class Meta:
+        model = CustomerStats
+        fields = ("order_count", "total_spent", "last_order_date")
+
+class StockReservationType(DjangoObjectType):
+    # Units held out of the product's stock (crm/reservations.py)
+    class Meta:
+        model = StockReservation
+        fields = ("id", "product", "quantity", "created_at", "expires_at")
+
+    def resolve_product(self, info):
+        if StockReservation.product.is_cached(self):
+            return self.product
+        return get_loaders(info).product.load(self.product_id)
+
+class CustomerType(CRMObjectType):
+    orders = CRMFilterConnectionField(lambda: OrderType, required=True)
 
-class CustomerType(DjangoObjectType):
     class Meta:
         model = Customer
         # 'interfaces' tells Graphene this is a Relay Node (supports edges/pagination)
         interfaces = (graphene.relay.Node, )
-        fields = ("id", "name", "email", "phone", "orders", "created_at")
+        connection_class = CRMConnection
+        fields = ("id", "name", "email", "phone", "orders", "created_at", "stats")
         filterset_class = CustomerFilter
 
-class ProductType(DjangoObjectType):
+    def resolve_orders(self, info, **kwargs):
+        if has_filter_args(kwargs):
+            return self.orders.all()
+        return load_related(self, "orders", "customer_orders", info)
+
+    @bypass_get_queryset
+    def resolve_stats(self, info):
+        if Customer.stats.is_cached(self):
+            return getattr(self, "stats", None)
+        return get_loaders(info).customer_stats.load(self.pk)
+
+class ProductType(CRMObjectType):
+    orders = CRMFilterConnectionField(lambda: OrderType, required=True)
+
     class Meta:
         model = Product
         interfaces = (graphene.relay.Node, )
+        connection_class = CRMConnection
         fields = ("id", "name", "price", "stock", "orders")
         filterset_class = ProductFilter
 
-class OrderType(DjangoObjectType):
+    def resolve_orders(self, info, **kwargs):
+        if has_filter_args(kwargs):
+            return self.orders.all()
+        return load_related(self, "orders", "product_orders", info)
+
+class OrderType(CRMObjectType):
+    products = CRMFilterConnectionField(ProductType, required=True)
+
     class Meta:
         model = Order
         interfaces = (graphene.relay.Node, )
+        connection_class = CRMConnection
         fields = ("id", "customer", "products", "order_date", "total_amount")
         filterset_class = OrderFilter
 
+    @bypass_get_queryset
+    def resolve_customer(self, info):
+        if Order.customer.is_cached(self):
+            return self.customer
+        return get_loaders(info).customer.load(self.customer_id)
+
+    def resolve_products(self, info, **kwargs):
+        if has_filter_args(kwargs):
+            return self.products.all()
+        return load_related(self, "products", "order_products", info)
+
+class StatsGrouping(graphene.Enum):
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+
+class StatsBucket(graphene.ObjectType):
+    period = graphene.DateTime()
+    order_count = graphene.Int()
+    revenue = graphene.Decimal()
+
+class CrmStats(graphene.ObjectType):
+    # Computed with COUNT/SUM in the database (crm/reports.py)
+    customer_count = graphene.Int()
+    order_count = graphene.Int()
+    total_revenue = graphene.Decimal()
+    buckets = graphene.List(StatsBucket)
+
+class UpdateLowStockProducts(graphene.Mutation):
+    class Arguments:
+        threshold = graphene.Int(default_value=LOW_STOCK_THRESHOLD)
+        increment = graphene.Int(default_value=RESTOCK_INCREMENT)
+
+    # Output fields
+    success = graphene.Boolean()
+    message = graphene.String()
+    updated_products = graphene.List(ProductType)
+
+    def mutate(self, info, threshold, increment):
+        if increment <= 0:
+            raise Exception("Increment must be positive")
+
+        # One set-based UPDATE for every product with stock < threshold
+        updated = call_sync(info, restock_low_stock, threshold=threshold, increment=increment)
+
+        return then(updated, lambda updated_list: UpdateLowStockProducts(
+            success=True,
+            message=f"Successfully restocked {len(updated_list)} products.",
+            updated_products=updated_list
+        ))
+
 # --- 2. INPUT TYPES (Unchanged) ---
 class CustomerInput(graphene.InputObjectType):
     name = graphene.String(required=True)
@@ -68,6 +174,8 @@ class ProductInput(graphene.InputObjectType):
 class OrderInput(graphene.InputObjectType):
     customer_id = graphene.ID(required=True)
     product_ids = graphene.List(graphene.ID, required=True)
+    # Reservations (from reserveStock) that cover a unit of these products
+    reservation_ids = graphene.List(graphene.ID)
 
 # --- 3. MUTATIONS (Unchanged) ---
 class CreateCustomer(graphene.Mutation):
@@ -76,83 +184,171 @@ class CreateCustomer(graphene.Mutation):
     customer = graphene.Field(CustomerType)
     message = graphene.String()
     def mutate(root, info, input):
-        if input.phone and not re.match(r'^[\+\d\-\s]+$', input.phone):
+        if input.phone and not PHONE_RE.match(input.phone):
             raise Exception("Invalid phone format")
+        if is_async(info):
+            return CreateCustomer.amutate(input)
         if Customer.objects.filter(email=input.email).exists():
             raise Exception("Email already exists")
         customer = Customer.objects.create(name=input.name, email=input.email, phone=input.phone)
         return CreateCustomer(customer=customer, message="Customer created")
 
+    @staticmethod
+    async def amutate(input):
+        if await Customer.objects.filter(email=input.email).aexists():
+            raise Exception("Email already exists")
+        customer = await Customer.objects.acreate(name=input.name, email=input.email, phone=input.phone)
+        return CreateCustomer(customer=customer, message="Customer created")
+
 class BulkCreateCustomers(graphene.Mutation):
     class Arguments:
         input = graphene.List(CustomerInput, required=True)
+        chunk_size = graphene.Int(default_value=BULK_CHUNK_SIZE)
+        ignore_conflicts = graphene.Boolean(default_value=False)
     customers = graphene.List(CustomerType) # Note: This returns a simple List, not a Connection
     errors = graphene.List(graphene.String)
-    def mutate(root, info, input):
-        created = []
-        errs = []
-        for data in input:
-            try:
-                if Customer.objects.filter(email=data.email).exists():
-                    raise Exception(f"Email {data.email} exists")
-                c = Customer.objects.create(name=data.name, email=data.email, phone=data.phone)
-                created.append(c)
-            except Exception as e:
-                errs.append(str(e))
-        return BulkCreateCustomers(customers=created, errors=errs)
+    def mutate(root, info, input, chunk_size, ignore_conflicts):
+        if chunk_size <= 0:
+            raise Exception("chunkSize must be positive")
+        # One email__in probe and one batched INSERT per chunk (see crm/bulk.py)
+        result = call_sync(
+            info, bulk_create_customers, input, chunk_size=chunk_size, ignore_conflicts=ignore_conflicts
+        )
+        return then(result, lambda result: BulkCreateCustomers(customers=result[0], errors=result[1]))
 
 class CreateProduct(graphene.Mutation):
     class Arguments:
         input = ProductInput(required=True)
     product = graphene.Field(ProductType)
     def mutate(root, info, input):
-        price = Decimal(str(input.price))
-        if price <= 0: raise Exception("Price positive")
+        price = clean_price(input.price)
+        if is_async(info):
+            return then(
+                Product.objects.acreate(name=input.name, price=price, stock=input.stock),
+                lambda p: CreateProduct(product=p),
+            )
         p = Product.objects.create(name=input.name, price=price, stock=input.stock)
         return CreateProduct(product=p)
 
+class BulkCreateProducts(graphene.Mutation):
+    class Arguments:
+        input = graphene.List(ProductInput, required=True)
+    products = graphene.List(ProductType)
+    errors = graphene.List(graphene.String)
+    def mutate(root, info, input):
+        # One transaction with batched INSERTs (see crm/bulk.py)
+        result = call_sync(info, bulk_create_products, input)
+        return then(result, lambda result: BulkCreateProducts(products=result[0], errors=result[1]))
+
 class CreateOrder(graphene.Mutation):
     class Arguments:
         input = OrderInput(required=True)
     order = graphene.Field(OrderType)
     def mutate(root, info, input):
-        # We must decode the Global ID (Relay ID) if passed, but for now assuming standard ID or handling raw
-        # Note: In a pure Relay app, IDs are base64 strings.
-        # But to keep your previous "ID 1" tests working, we try/except.
-        try:
-            # Try to get by raw ID first (for existing tests)
-            c = Customer.objects.get(pk=input.customer_id)
-        except:
-             raise Exception("Invalid Customer ID")
-
-        # Handle Products
-        products = Product.objects.filter(pk__in=input.product_ids)
-        if not products.exists(): raise Exception("No products")
-        
-        o = Order.objects.create(customer=c)
-        o.products.set(products)
-        o.total_amount = sum(p.price for p in products)
-        o.save()
-        return CreateOrder(order=o)
+        # Customer check, locked product read, stock decrement, order and
+        # through-row inserts: a fixed number of queries (see crm/orders.py)
+        o = call_sync(info, place_order, input.customer_id, input.product_ids, input.reservation_ids or ())
+        return then(o, lambda o: CreateOrder(order=o))
+
+class BulkCreateOrders(graphene.Mutation):
+    class Arguments:
+        input = graphene.List(OrderInput, required=True)
+    orders = graphene.List(OrderType)
+    errors = graphene.List(graphene.String)
+    def mutate(root, info, input):
+        # One read of the customers and of the products, bulk INSERTs, all in
+        # one transaction (see crm/orders.py)
+        result = call_sync(info, place_orders, input)
+        return then(result, lambda result: BulkCreateOrders(orders=result[0], errors=result[1]))
+
+class ReserveStock(graphene.Mutation):
+    class Arguments:
+        product_id = graphene.ID(required=True)
+        quantity = graphene.Int(default_value=1)
+        ttl_seconds = graphene.Int()
+    reservation = graphene.Field(StockReservationType)
+    def mutate(root, info, product_id, quantity, ttl_seconds=None):
+        # One conditional stock UPDATE: fails instead of overselling
+        reservation = call_sync(info, reserve, product_id, quantity, ttl_seconds)
+        return then(reservation, lambda r: ReserveStock(reservation=r))
+
+class ReleaseStock(graphene.Mutation):
+    class Arguments:
+        reservation_id = graphene.ID(required=True)
+    product = graphene.Field(ProductType)
+    released = graphene.Int()
+    def mutate(root, info, reservation_id):
+        reservation = call_sync(info, release, reservation_id)
+        return then(reservation, lambda r: ReleaseStock(product=r.product, released=r.quantity))
 
 class Mutation(graphene.ObjectType):
     create_customer = CreateCustomer.Field()
     bulk_create_customers = BulkCreateCustomers.Field()
     create_product = CreateProduct.Field()
+    bulk_create_products = BulkCreateProducts.Field()
     create_order = CreateOrder.Field()
+    bulk_create_orders = BulkCreateOrders.Field()
+    update_low_stock_products = UpdateLowStockProducts.Field()
+    reserve_stock = ReserveStock.Field()
+    release_stock = ReleaseStock.Field()
 
 # --- 4. QUERY (Updated for Filters) ---
 class Query(graphene.ObjectType):
-    # We explicitly pass filterset_class here to force the connection
-    all_customers = DjangoFilterConnectionField(
+    node = graphene.relay.Node.Field()
+    # We explicitly pass filterset_class here to force the connection.
+    # keyset: true switches a root connection to cursors on (column, id), so
+    # deep pages cost the same as the first (crm/pagination.py)
+    all_customers = CRMFilterConnectionField(
         CustomerType, 
-        filterset_class=CustomerFilter
+        filterset_class=CustomerFilter,
+        keyset=("created_at",),
     )
-    all_products = DjangoFilterConnectionField(
+    all_products = CRMFilterConnectionField(
         ProductType, 
-        filterset_class=ProductFilter
+        filterset_class=ProductFilter,
+        keyset=(),
     )
-    all_orders = DjangoFilterConnectionField(
+    all_orders = CRMFilterConnectionField(
         OrderType, 
-        filterset_class=OrderFilter
-    )
\ No newline at end of file
+        filterset_class=OrderFilter,
+        keyset=("order_date",),
+    )
+    # Ranked substring search, best match first (crm/search.py)
+    search_customers = graphene.List(
+        CustomerType, query=graphene.String(required=True), first=graphene.Int(default_value=20)
+    )
+    search_products = graphene.List(
+        ProductType, query=graphene.String(required=True), first=graphene.Int(default_value=20)
+    )
+    crm_stats = graphene.Field(
+        CrmStats,
+        date_from=graphene.DateTime(),
+        date_to=graphene.DateTime(),
+        group_by=StatsGrouping(),
+    )
+    # One product's sales per bucket, read from the rollups (crm/sales_rollups.py)
+    sales_timeseries = graphene.List(
+        graphene.NonNull(StatsBucket),
+        required=True,
+        product_id=graphene.ID(required=True),
+        granularity=StatsGrouping(required=True),
+        date_from=graphene.DateTime(name="from"),
+        date_to=graphene.DateTime(name="to"),
+    )
+
+    def resolve_search_customers(root, info, query, first):
+        return call_sync(info, ranked_search, Customer, query, first)
+
+    def resolve_search_products(root, info, query, first):
+        return call_sync(info, ranked_search, Product, query, first)
+
+    def resolve_crm_stats(root, info, date_from=None, date_to=None, group_by=None):
+        stats = call_sync(info, crm_stats, date_from, date_to, group_by and group_by.value)
+        return then(stats, lambda stats: CrmStats(**stats))
+
+    def resolve_sales_timeseries(root, info, product_id, granularity, date_from=None, date_to=None):
+        try:
+            product_id = int(product_id)
+        except ValueError:
+            raise Exception("Invalid product ID")
+        return call_sync(info, timeseries, product_id, granularity.value, date_from, date_to)
@@ -0,0 +1,229 @@
+"""
+Substring search for customers and products without LIKE '%x%' table scans.
+
+Two interchangeable backends:
+
+* ``FTS5Backend`` keeps an SQLite FTS5 table with the trigram tokenizer per
+  model (``crm_customer_fts``, ``crm_product_fts``, created by migration
+  0005). Trigram MATCH has the same case-insensitive substring semantics as
+  ``icontains`` but is answered from the index, and ranks with bm25.
+* ``TrigramBackend`` keeps trigram postings in the crm_searchtrigram table
+  (SearchTrigram) and narrows candidates with one GROUP BY over it before
+  confirming them with ``icontains``. It is used when FTS5 is not available
+  (other databases, SQLite builds without the trigram tokenizer).
+
+Both are kept in sync by the signal receivers in crm/signals.py and by the
+bulk write paths, which call :func:`index_objects` directly because
+bulk_create sends no signals; only the active backend is fed, so switching
+CRM_SEARCH_BACKEND on a populated database needs ``rebuild`` per model.
+Queries shorter than three characters have no trigram and fall back to
+``icontains``.
+"""
+from itertools import islice
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Least, Length
+from graphene_django.settings import graphene_settings
+
+from .models import Customer, Product, SearchTrigram
+
+SEARCH_FIELDS = {Customer: ("name", "email"), Product: ("name",)}
+MIN_QUERY_LENGTH = 3
+# Rows per statement when feeding the search tables; keeps the parameter
+# count under SQLite's limit
+FTS_CHUNK_SIZE = 300
+
+
+def _slices(items, size):
+    items = list(items)
+    return (items[i:i + size] for i in range(0, len(items), size))
+
+
+def fts_table(model):
+    return f"{model._meta.db_table}_fts"
+
+
+def _icontains(queryset, text):
+    q = Q()
+    for field in SEARCH_FIELDS[queryset.model]:
+        q |= Q(**{f"{field}__icontains": text})
+    return queryset.filter(q)
+
+
+class FTS5Backend:
+    name = "fts5"
+
+    @staticmethod
+    def is_available():
+        if connection.vendor != "sqlite":
+            return False
+        tables = set(connection.introspection.table_names())
+        return all(fts_table(model) in tables for model in SEARCH_FIELDS)
+
+    def _match(self, text):
+        # Quote the input as one FTS5 string so operators in it are literal
+        return '"' + text.replace('"', '""') + '"'
+
+    def index(self, model, objs):
+        fields = SEARCH_FIELDS[model]
+        table = fts_table(model)
+        rows = [(obj.pk, *(getattr(obj, f) or "" for f in fields)) for obj in objs]
+        placeholders = "(" + ", ".join(["%s"] * (len(fields) + 1)) + ")"
+        with connection.cursor() as cursor:
+            for chunk in _slices(rows, FTS_CHUNK_SIZE):
+                self._delete(cursor, table, [row[0] for row in chunk])
+                cursor.execute(
+                    f"INSERT INTO {table} (rowid, {', '.join(fields)}) "
+                    f"VALUES {', '.join([placeholders] * len(chunk))}",
+                    [value for row in chunk for value in row],
+                )
+
+    def remove(self, model, pks):
+        with connection.cursor() as cursor:
+            for chunk in _slices(pks, FTS_CHUNK_SIZE):
+                self._delete(cursor, fts_table(model), chunk)
+
+    def _delete(self, cursor, table, pks):
+        cursor.execute(
+            f"DELETE FROM {table} WHERE rowid IN ({', '.join(['%s'] * len(pks))})", pks
+        )
+
+    def rebuild(self, model):
+        fields = ", ".join(SEARCH_FIELDS[model])
+        table = fts_table(model)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {table}")
+            cursor.execute(
+                f"INSERT INTO {table} (rowid, {fields}) "
+                f"SELECT id, {fields} FROM {model._meta.db_table}"
+            )
+
+    def filter(self, queryset, text):
+        sql = f"SELECT rowid FROM {fts_table(queryset.model)} WHERE {fts_table(queryset.model)} MATCH %s"
+        return queryset.filter(pk__in=RawSQL(sql, [self._match(text)]))
+
+    def ranked(self, model, text, limit):
+        table = fts_table(model)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {table} WHERE {table} MATCH %s ORDER BY rank LIMIT %s",
+                [self._match(text), limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+def trigrams(text):
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramBackend:
+    name = "trigram"
+
+    def _insert(self, table, rows):
+        # executemany rather than bulk_create: a row has ~30 postings, and
+        # building a model instance for each dominates a rebuild
+        postings = (
+            (table, pk, gram)
+            for pk, *values in rows
+            for gram in set().union(*(trigrams(value or "") for value in values))
+        )
+        with connection.cursor() as cursor:
+            while chunk := list(islice(postings, FTS_CHUNK_SIZE * 10)):
+                cursor.executemany(
+                    f"INSERT INTO {SearchTrigram._meta.db_table} (\"table\", object_id, gram) VALUES (%s, %s, %s)",
+                    chunk,
+                )
+
+    def index(self, model, objs):
+        fields = SEARCH_FIELDS[model]
+        rows = [(obj.pk, *(getattr(obj, f) for f in fields)) for obj in objs]
+        self.remove(model, [row[0] for row in rows])
+        self._insert(model._meta.db_table, rows)
+
+    def remove(self, model, pks):
+        for chunk in _slices(pks, FTS_CHUNK_SIZE):
+            SearchTrigram.objects.filter(table=model._meta.db_table, object_id__in=chunk).delete()
+
+    def rebuild(self, model):
+        table = model._meta.db_table
+        SearchTrigram.objects.filter(table=table).delete()
+        rows = model._default_manager.values_list("pk", *SEARCH_FIELDS[model]).iterator(chunk_size=FTS_CHUNK_SIZE)
+        self._insert(table, rows)
+
+    def filter(self, queryset, text):
+        grams = trigrams(text)
+        # Rows holding every trigram of the text; icontains then confirms
+        # the trigrams are contiguous and in order
+        candidates = (
+            SearchTrigram.objects.filter(table=queryset.model._meta.db_table, gram__in=grams)
+            .values("object_id")
+            .annotate(matched=Count("gram"))
+            .filter(matched=len(grams))
+            .values("object_id")
+        )
+        return _icontains(queryset.filter(pk__in=candidates), text)
+
+    def ranked(self, model, text, limit):
+        # Shortest matching field first, so an exact match outranks a longer
+        # text that merely contains it
+        lengths = [
+            Case(When(**{f"{f}__icontains": text}, then=Length(f)), default=Value(2**31), output_field=IntegerField())
+            for f in SEARCH_FIELDS[model]
+        ]
+        shortest = Least(*lengths) if len(lengths) > 1 else lengths[0]
+        queryset = self.filter(model._default_manager.all(), text).annotate(match_length=shortest)
+        return list(queryset.order_by("match_length", "pk").values_list("pk", flat=True)[:limit])
+
+
+_backends = {"fts5": FTS5Backend(), "trigram": TrigramBackend()}
+_detected = None
+
+
+def get_backend():
+    global _detected
+    name = getattr(settings, "CRM_SEARCH_BACKEND", None)
+    if name is None:
+        # The FTS tables only appear or disappear with migrations
+        if _detected is None:
+            try:
+                _detected = "fts5" if FTS5Backend.is_available() else "trigram"
+            except DatabaseError:
+                return _backends["trigram"]
+        name = _detected
+    return _backends[name]
+
+
+def index_objects(model, objs):
+    get_backend().index(model, objs)
+
+
+def remove_objects(model, pks):
+    get_backend().remove(model, pks)
+
+
+def search_filter(queryset, text):
+    """Filter ``queryset`` to rows whose search fields contain ``text``."""
+    text = text.strip()
+    if len(text) < MIN_QUERY_LENGTH:
+        return _icontains(queryset, text)
+    return get_backend().filter(queryset, text)
+
+
+def ranked_search(model, text, limit):
+    """Return up to ``limit`` instances of ``model`` matching ``text``, best first."""
+    # Bounded like the Relay connections, which reject a larger `first`
+    max_limit = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+    if limit < 1:
+        raise ValueError("first must be positive")
+    if max_limit is not None and limit > max_limit:
+        raise ValueError(f"Requesting {limit} results exceeds the `first` limit of {max_limit}")
+    text = text.strip()
+    if len(text) < MIN_QUERY_LENGTH:
+        return list(_icontains(model._default_manager.order_by("pk"), text)[:limit])
+    pks = get_backend().ranked(model, text, limit)
+    found = model._default_manager.in_bulk(pks)
+    return [found[pk] for pk in pks if pk in found]
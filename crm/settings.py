@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -81,8 +82,27 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A connection per request by default. WSGI servers and workers can
+        # opt in to reusing them (checked before reuse), e.g.
+        # CRM_CONN_MAX_AGE=600; keep 0 under ASGI, where they would outlive requests
+        'CONN_MAX_AGE': int(os.environ.get('CRM_CONN_MAX_AGE', 0)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
+# Multi-process servers: take the write lock at BEGIN (see crm/sqlite.py)
+if os.environ.get('CRM_SQLITE_IMMEDIATE'):
+    DATABASES['default']['OPTIONS'] = {'transaction_mode': 'IMMEDIATE'}
+# Every SQLite connection runs in WAL mode with the pragmas of crm/sqlite.py;
+# override them with CRM_SQLITE_PRAGMAS
+
+# Optional read replica for GraphQL query operations (crm/routers.py)
+if os.environ.get('CRM_SQLITE_REPLICA'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['CRM_SQLITE_REPLICA'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['crm.routers.ReadReplicaRouter']
 
 
 # Password validation
@@ -127,13 +147,14 @@ GRAPHENE = {
 # Cronjob Configuration
 CRONJOBS = [
     ('*/5 * * * *', 'crm.cron.log_crm_heartbeat'),
-    ('0 */12 * * *', 'crm.cron.update_low_stock'),
 ]
 
 # Celery Configuration
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
+# Chords (crm/fanout.py) collect the chunk results here
+CELERY_RESULT_BACKEND = 'redis://localhost:6379/1'
 
 # Celery Beat Schedule
 from celery.schedules import crontab
@@ -144,4 +165,39 @@ CELERY_BEAT_SCHEDULE = {
         # Schedule: Every Monday at 6:00 AM
         'schedule': crontab(day_of_week='mon', hour=6, minute=0),
     },
+    'send-order-reminders': {
+        'task': 'crm.tasks.send_order_reminders',
+        # Schedule: Every day at 8:00 AM
+        'schedule': crontab(hour=8, minute=0),
+    },
+    'update-low-stock': {
+        'task': 'crm.tasks.update_low_stock',
+        # Schedule: Every 12 hours
+        'schedule': crontab(hour='*/12', minute=0),
+    },
+    'reconcile-customer-stats': {
+        'task': 'crm.tasks.reconcile_customer_stats',
+        # Schedule: Every night at 3:00 AM
+        'schedule': crontab(hour=3, minute=0),
+    },
+    'fold-sales-rollups': {
+        'task': 'crm.tasks.fold_sales_rollups',
+        # Schedule: Every minute
+        'schedule': crontab(),
+    },
+    'compact-sales-rollups': {
+        'task': 'crm.tasks.compact_sales_rollups',
+        # Schedule: Every hour at :30
+        'schedule': crontab(minute=30),
+    },
+    'backfill-sales-rollups': {
+        'task': 'crm.tasks.backfill_sales_rollups',
+        # Schedule: Every night at 3:30 AM, over the last 2 days
+        'schedule': crontab(hour=3, minute=30),
+    },
+    'expire-stock-reservations': {
+        'task': 'crm.tasks.expire_stock_reservations',
+        # Schedule: Every minute
+        'schedule': crontab(),
+    },
 }
\ No newline at end of file
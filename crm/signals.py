@@ -0,0 +1,137 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_save, pre_save
+from django.dispatch import receiver
+
+from . import customer_stats, sales_rollups
+from .models import Customer, Order, Product, SalesRollup, bulk_delete
+from .instrumentation import install
+from .orders import recompute_totals
+from .response_cache import invalidate
+from .search import index_objects, remove_objects
+from .sqlite import configure
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def keep_order_totals_in_sync(sender, instance, action, reverse, pk_set, **kwargs):
+    # Only the orders touched by this change are recomputed
+    if action == "pre_clear" and reverse:
+        # pk_set is not sent for clear(); remember the product's orders now
+        instance._cleared_order_ids = list(instance.orders.values_list("pk", flat=True))
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if not reverse:
+        recompute_totals([instance.pk])
+        instance.refresh_from_db(fields=["total_amount"])
+    elif action == "post_clear":
+        recompute_totals(instance.__dict__.pop("_cleared_order_ids", []))
+    elif pk_set:
+        recompute_totals(pk_set)
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def retract_removed_sales(sender, instance, action, reverse, pk_set, **kwargs):
+    # Added lines need nothing here, the next fold picks them up by id
+    if action not in ("pre_remove", "pre_clear"):
+        return
+    own, other = ("product_id", "order_id") if reverse else ("order_id", "product_id")
+    lines = sender.objects.filter(**{own: instance.pk})
+    if action == "pre_remove":
+        lines = lines.filter(**{f"{other}__in": pk_set})
+    sales_rollups.retract(lines)
+
+
+@receiver(bulk_delete, sender=Order)
+@receiver(bulk_delete, sender=Customer)
+def retract_deleted_sales(sender, queryset, **kwargs):
+    # One query for all the lines a delete() removes, including those of
+    # orders deleted with their customer. A deleted product's rollups
+    # cascade with it.
+    lookup = "order__in" if sender is Order else "order__customer__in"
+    sales_rollups.retract(Order.products.through.objects.filter(**{lookup: queryset}))
+
+
+@receiver(post_save, sender=Customer)
+def create_customer_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        customer_stats.create_rows([instance.pk])
+
+
+@receiver(pre_save, sender=Order)
+def remember_stats_customer(sender, instance, raw=False, **kwargs):
+    # An order moved to another customer must leave its old customer's row
+    if not raw and not instance._state.adding:
+        instance._stats_customer_ids = {
+            instance.customer_id,
+            *Order.objects.filter(pk=instance.pk).values_list("customer_id", flat=True),
+        }
+
+
+@receiver(post_save, sender=Order)
+def update_customer_stats(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        customer_stats.order_created(instance)
+    else:
+        customer_stats.refresh(instance.__dict__.pop("_stats_customer_ids", [instance.customer_id]))
+
+
+@receiver(bulk_delete, sender=Order)
+def remove_from_customer_stats(sender, queryset, **kwargs):
+    # Not sent when orders go with their customer; the stats row goes too
+    customer_ids = set(queryset.values_list("customer_id", flat=True))
+    return lambda: customer_stats.refresh(customer_ids)
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Product)
+def index_for_search(sender, instance, update_fields=None, **kwargs):
+    # Stock-only saves (restocking, order placement) don't touch the text
+    if update_fields is not None and not {"name", "email"} & set(update_fields):
+        return
+    index_objects(sender, [instance])
+
+
+@receiver(bulk_delete, sender=Customer)
+@receiver(bulk_delete, sender=Product)
+def unindex_for_search(sender, queryset, **kwargs):
+    # One pass per delete() call, whatever the number of rows
+    remove_objects(sender, list(queryset.values_list("pk", flat=True)))
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Order)
+def invalidate_responses(sender, **kwargs):
+    invalidate(sender)
+
+
+# The models whose rows a delete() of the sender removes, cascades included
+DELETED_WITH = {
+    Customer: (Customer, Order),
+    Product: (Product, Order, SalesRollup),
+    Order: (Order,),
+}
+
+
+@receiver(bulk_delete, sender=Customer)
+@receiver(bulk_delete, sender=Product)
+@receiver(bulk_delete, sender=Order)
+def invalidate_deleted_responses(sender, **kwargs):
+    # Once per delete() call rather than per row
+    invalidate(*DELETED_WITH[sender])
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def invalidate_order_responses(sender, action, **kwargs):
+    # The through table is tagged as Order (crm/response_cache.py)
+    if action.startswith("post_"):
+        invalidate(Order)
+
+
+# WAL and the other SQLite pragmas (crm/sqlite.py)
+connection_created.connect(configure)
+# Route every statement through the request's SQL observers (crm/instrumentation.py)
+connection_created.connect(install)
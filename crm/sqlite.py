@@ -0,0 +1,45 @@
+"""
+SQLite tuning applied to every new connection (``connection_created``, see
+crm/signals.py).
+
+Django opens SQLite in rollback-journal mode, where a writer blocks every
+reader for the length of its transaction. :func:`configure` switches each
+connection to WAL instead. Readers then work from a snapshot while the one
+writer appends to the log. It also applies the rest of CRM_SQLITE_PRAGMAS
+(default PRAGMAS).
+
+With persistent connections (CRM_CONN_MAX_AGE, off by default and best left
+off under ASGI) the pragmas and the page cache also survive between requests.
+
+CRM_SQLITE_IMMEDIATE=1 also sets ``transaction_mode: IMMEDIATE``, so a
+transaction that will write takes the write lock at BEGIN. Without it, a
+transaction that reads first and later tries to write fails with "database
+is locked" if another writer committed in between. It is off by default:
+with many threads of one process waiting at BEGIN, the thread holding the
+lock was seen stalling until the waiters' busy_timeout ran out
+(benchmarks/bench_reservations.py). Turn it on for multi-process servers.
+"""
+from django.conf import settings
+
+PRAGMAS = {
+    "journal_mode": "wal",
+    # With WAL, NORMAL stays consistent; a power loss can only drop the
+    # last commits since the checkpoint
+    "synchronous": "normal",
+    "busy_timeout": 5000,  # ms
+    "cache_size": -64000,  # negative: KiB, so 64 MB per connection
+    "mmap_size": 256 * 2**20,
+    "temp_store": "memory",
+}
+
+
+def sqlite_pragmas():
+    return getattr(settings, "CRM_SQLITE_PRAGMAS", PRAGMAS)
+
+
+def configure(connection, **kwargs):
+    if connection.vendor != "sqlite":
+        return
+    # On the raw connection, so the pragmas are not counted as queries
+    for name, value in sqlite_pragmas().items():
+        connection.connection.execute(f"PRAGMA {name} = {value}")
@@ -1,3 +1,1739 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import gzip
+import json
+import tempfile
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from graphene_django.utils.testing import GraphQLTestCase
+from graphql import introspection_from_schema
+
+from . import (
+    customer_stats, export, graphql_client, inventory, reservations, response_cache, sales_rollups, search, views,
+)
+from .cron import update_low_stock
+from .cron_jobs import send_order_reminders
+from .documents import DocumentCache, document_cache, persisted_queries, query_hash
+from .filters import CustomerFilter
+from .instrumentation import observe_sql
+from .loaders import Loaders
+from .models import Customer, CustomerStats, Product, Order, OrderReminder, SalesRollup, StockReservation
+from .routers import REPLICA, ReadReplicaRouter, replica_reads
+from . import tasks
+from .tasks import generate_crm_report
+
+# The Celery tasks a test sends run in-process, chords included, on the
+# in-memory broker, so the tests need no Redis
+eager_tasks = override_settings(
+    CELERY_TASK_ALWAYS_EAGER=True, CELERY_BROKER_URL="memory://", CELERY_RESULT_BACKEND="cache+memory://",
+)
+
+
+def seed_orders(count, products_per_order=3):
+    products = [
+        Product.objects.create(name=f"Product {i}", price=Decimal("9.99"), stock=50)
+        for i in range(products_per_order)
+    ]
+    for i in range(count):
+        customer = Customer.objects.create(name=f"Customer {i}", email=f"c{i}@example.com")
+        order = Order.objects.create(customer=customer, total_amount=Decimal("29.97"))
+        order.products.set(products)
+
+
+class LoaderBatchingTests(GraphQLTestCase):
+    GRAPHQL_URL = "/graphql"
+
+    ORDERS_QUERY = """
+        query ($first: Int) {
+            allOrders(first: $first) {
+                edges { node { id customer { name } products { edges { node { name } } } } }
+            }
+        }
+    """
+
+    CUSTOMERS_QUERY = """
+        query ($first: Int) {
+            allCustomers(first: $first) {
+                edges { node { name orders { edges { node {
+                    totalAmount products { edges { node { name } } }
+                } } } } }
+            }
+        }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_orders(20)
+
+    def count_queries(self, query, first):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.query(query, variables={"first": first})
+        self.assertResponseNoErrors(response)
+        return len(ctx.captured_queries), response.json()["data"]
+
+    def test_order_page_query_count_is_constant(self):
+        small, _ = self.count_queries(self.ORDERS_QUERY, 2)
+        large, data = self.count_queries(self.ORDERS_QUERY, 20)
+        self.assertEqual(small, large)
+        # COUNT + page joined to customer, then one IN (...) for products
+        self.assertEqual(large, 3)
+
+        edges = data["allOrders"]["edges"]
+        self.assertEqual(len(edges), 20)
+        self.assertEqual(len(edges[0]["node"]["products"]["edges"]), 3)
+
+    def test_nested_levels_batch_once_each(self):
+        small, _ = self.count_queries(self.CUSTOMERS_QUERY, 2)
+        large, data = self.count_queries(self.CUSTOMERS_QUERY, 20)
+        self.assertEqual(small, large)
+        self.assertEqual(large, 4)
+
+        node = data["allCustomers"]["edges"][0]["node"]
+        self.assertEqual(len(node["orders"]["edges"]), 1)
+
+    def test_nested_filters_fall_back_to_queryset(self):
+        response = self.query("""
+            query {
+                allCustomers(first: 1) {
+                    edges { node { orders(totalAmountGte: 100) { edges { node { id } } } } }
+                }
+            }
+        """)
+        self.assertResponseNoErrors(response)
+        node = response.json()["data"]["allCustomers"]["edges"][0]["node"]
+        self.assertEqual(node["orders"]["edges"], [])
+
+    def test_root_filters_still_apply(self):
+        response = self.query('query { allCustomers(name: "Customer 1") { edges { node { name } } } }')
+        self.assertResponseNoErrors(response)
+        names = {e["node"]["name"] for e in response.json()["data"]["allCustomers"]["edges"]}
+        self.assertEqual(names, {"Customer 1"} | {f"Customer 1{i}" for i in range(10)})
+
+
+class QueryOptimizerTests(GraphQLTestCase):
+    GRAPHQL_URL = "/graphql"
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_orders(3)
+
+    def capture(self, query, **variables):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.query(query, variables=variables)
+        self.assertResponseNoErrors(response)
+        return [q["sql"] for q in ctx.captured_queries], response.json()["data"]
+
+    def test_scalar_selection_prunes_relations_and_columns(self):
+        queries, _ = self.capture("query { allOrders { edges { node { id totalAmount } } } }")
+        self.assertFalse(any("crm_customer" in sql for sql in queries))
+        self.assertFalse(any("crm_order_products" in sql for sql in queries))
+        self.assertNotIn("order_date", queries[-1])
+
+    def test_fragments_are_followed(self):
+        queries, data = self.capture("""
+            query { allOrders { edges { node { ...OrderBits } } } }
+            fragment OrderBits on OrderType { customer { ... on CustomerType { email } } }
+        """)
+        self.assertEqual(len(queries), 2)
+        self.assertIn("crm_customer", queries[-1])
+        self.assertNotIn('"crm_customer"."phone"', queries[-1])
+        self.assertEqual(data["allOrders"]["edges"][0]["node"]["customer"]["email"], "c0@example.com")
+
+    def test_node_lookup_uses_optimizer(self):
+        order = Order.objects.first()
+        _, result = self.capture("query { allOrders(first: 1) { edges { node { id } } } }")
+        global_id = result["allOrders"]["edges"][0]["node"]["id"]
+        queries, data = self.capture("""
+            query ($id: ID!) {
+                node(id: $id) { ... on OrderType { customer { name } products { edges { node { name } } } } }
+            }
+        """, id=global_id)
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(data["node"]["customer"]["name"], order.customer.name)
+
+
+class RestockTests(GraphQLTestCase):
+    GRAPHQL_URL = "/graphql"
+
+    MUTATION = """
+        mutation ($threshold: Int, $increment: Int) {
+            updateLowStockProducts(threshold: $threshold, increment: $increment) {
+                success
+                updatedProducts { name stock }
+            }
+        }
+    """
+
+    def seed(self, low, high=2):
+        Product.objects.bulk_create(
+            [Product(name=f"Low {i}", price=Decimal("1.00"), stock=i % 10) for i in range(low)]
+            + [Product(name=f"High {i}", price=Decimal("1.00"), stock=50) for i in range(high)]
+        )
+
+    def restock(self, **variables):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.query(self.MUTATION, variables=variables)
+        self.assertResponseNoErrors(response)
+        return len(ctx.captured_queries), response.json()["data"]["updateLowStockProducts"]
+
+    def test_restocks_only_low_stock_products(self):
+        self.seed(5)
+        _, data = self.restock(threshold=3, increment=20)
+        self.assertEqual(sorted(p["stock"] for p in data["updatedProducts"]), [20, 21, 22])
+        self.assertEqual(Product.objects.filter(stock=50).count(), 2)
+
+    def test_query_count_does_not_grow_with_products(self):
+        self.seed(5)
+        small, _ = self.restock()
+        Product.objects.all().delete()
+        self.seed(200)
+        large, data = self.restock()
+        self.assertEqual(small, large)
+        self.assertEqual(len(data["updatedProducts"]), 200)
+
+    def test_chunked_fallback(self):
+        self.seed(25)
+        with mock.patch.object(inventory, "supports_update_returning", return_value=False):
+            updated = inventory.restock_low_stock(increment=5, chunk_size=10)
+        self.assertEqual(len(updated), 25)
+        self.assertFalse(Product.objects.filter(stock__lt=5).exists())
+
+
+class BulkCreateCustomersTests(GraphQLTestCase):
+    GRAPHQL_URL = "/graphql"
+
+    MUTATION = """
+        mutation ($input: [CustomerInput]!, $chunkSize: Int, $ignoreConflicts: Boolean) {
+            bulkCreateCustomers(input: $input, chunkSize: $chunkSize, ignoreConflicts: $ignoreConflicts) {
+                customers { id email }
+                errors
+            }
+        }
+    """
+
+    def bulk_create(self, rows, **variables):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.query(self.MUTATION, variables={"input": rows, **variables})
+        self.assertResponseNoErrors(response)
+        return len(ctx.captured_queries), response.json()["data"]["bulkCreateCustomers"]
+
+    def test_reports_errors_per_row(self):
+        Customer.objects.create(name="Old", email="old@example.com")
+        _, data = self.bulk_create([
+            {"name": "A", "email": "a@example.com", "phone": "+1 555-0100"},
+            {"name": "B", "email": "a@example.com"},
+            {"name": "C", "email": "old@example.com"},
+            {"name": "D", "email": "d@example.com", "phone": "not a phone"},
+        ], chunkSize=2)
+        self.assertEqual([c["email"] for c in data["customers"]], ["a@example.com"])
+        self.assertEqual(data["errors"], [
+            "Item 1: Email a@example.com exists",
+            "Item 2: Email old@example.com exists",
+            "Item 3: Invalid phone format for d@example.com",
+        ])
+
+    def test_one_probe_and_insert_per_chunk(self):
+        rows = [{"name": f"C{i}", "email": f"c{i}@example.com"} for i in range(50)]
+        queries, data = self.bulk_create(rows, chunkSize=25)
+        self.assertEqual(len(data["customers"]), 50)
+        self.assertTrue(all(c["id"] for c in data["customers"]))
+        # Per chunk: SAVEPOINT, probe, INSERT, search index DELETE + INSERT,
+        # CustomerStats INSERT, RELEASE
+        self.assertEqual(queries, 14)
+
+    def test_ignore_conflicts(self):
+        rows = [{"name": f"C{i}", "email": f"c{i}@example.com"} for i in range(3)]
+        _, data = self.bulk_create(rows, ignoreConflicts=True)
+        self.assertEqual(len(data["customers"]), 3)
+        self.assertEqual(Customer.objects.count(), 3)
+
+    def test_ignore_conflicts_skips_rows_written_concurrently(self):
+        bulk_create = Customer.objects.bulk_create
+
+        def racing_bulk_create(objs, **kwargs):
+            # Another writer stores c1 between the probe and the INSERT
+            Customer.objects.create(name="Other", email="c1@example.com")
+            return bulk_create(objs, **kwargs)
+
+        rows = [{"name": f"C{i}", "email": f"c{i}@example.com"} for i in range(3)]
+        with mock.patch.object(Customer.objects, "bulk_create", racing_bulk_create):
+            _, data = self.bulk_create(rows, ignoreConflicts=True)
+        self.assertEqual([c["email"] for c in data["customers"]], ["c0@example.com", "c2@example.com"])
+        self.assertEqual(data["errors"], ["Item 1: Email c1@example.com exists"])
+        self.assertEqual(Customer.objects.get(email="c1@example.com").name, "Other")
+
+
+class CrmImportCommandTests(TestCase):
+    def write(self, name, text):
+        path = Path(self.tmp.name) / name
+        path.write_text(text)
+        return path
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def run_import(self, *args):
+        out, err = StringIO(), StringIO()
+        call_command("crm_import", *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_imports_customers_products_and_orders(self):
+        Customer.objects.create(name="Old", email="old@example.com")
+        customers = self.write("customers.csv", (
+            "name,email,phone\n"
+            "Alice,alice@example.com,+1 555-0100\n"
+            "Bob,bob@example.com,bad phone\n"
+            "Again,old@example.com,\n"
+        ))
+        products = self.write("products.ndjson", (
+            '{"name": "Laptop", "price": "999.99", "stock": 3}\n'
+            '{"name": "Free", "price": 0}\n'
+            '{"name": "Mouse", "price": 20, "stock": 1}\n'
+        ))
+        orders = self.write("orders.csv", (
+            "customer_email,product_names\n"
+            "alice@example.com,Laptop|Mouse\n"
+            "nobody@example.com,Laptop\n"
+        ))
+
+        out, err = self.run_import("customers", str(customers))
+        self.assertIn("1 created, 2 rejected", out)
+        self.assertIn("record 2: Invalid phone format", err)
+        self.run_import("products", str(products))
+        self.assertEqual(Product.objects.count(), 2)
+        out, _ = self.run_import("orders", str(orders))
+        self.assertIn("1 created, 1 rejected", out)
+
+        order = Order.objects.get()
+        self.assertEqual(order.customer.email, "alice@example.com")
+        self.assertEqual(order.total_amount, Decimal("1019.99"))
+        self.assertEqual(order.products.count(), 2)
+        self.assertEqual(dict(Product.objects.values_list("name", "stock")), {"Laptop": 2, "Mouse": 0})
+
+    def test_orders_take_stock_and_reject_sold_out_lines(self):
+        Customer.objects.create(name="Alice", email="alice@example.com")
+        Product.objects.create(name="Laptop", price=1, stock=2)
+        Product.objects.create(name="Mouse", price=1, stock=5)
+        orders = self.write("orders.csv", "customer_email,product_names\n" + "alice@example.com,Laptop|Mouse\n" * 4)
+
+        out, err = self.run_import("orders", str(orders), "--chunk-size", "3")
+        self.assertIn("2 created, 2 rejected", out)
+        self.assertIn("record 3: Out of stock: Laptop", err)
+        self.assertIn("record 4: Out of stock: Laptop", err)
+        self.assertEqual(dict(Product.objects.values_list("name", "stock")), {"Laptop": 0, "Mouse": 3})
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_resume_skips_committed_records(self):
+        path = self.write("products.csv", "name,price\n" + "".join(f"P{i},1\n" for i in range(5)))
+        checkpoint = Path(self.tmp.name) / "products.csv.checkpoint"
+        checkpoint.write_text(json.dumps({"model": "products", "path": str(path.resolve()), "records": 3}))
+
+        self.run_import("products", str(path), "--resume")
+        self.assertEqual(list(Product.objects.values_list("name", flat=True)), ["P3", "P4"])
+        self.assertFalse(checkpoint.exists())
+
+    def test_resume_does_not_parse_skipped_records(self):
+        path = self.write("products.ndjson", "".join(f'{{"name": "P{i}", "price": 1}}\n' for i in range(5)))
+        checkpoint = Path(self.tmp.name) / "products.ndjson.checkpoint"
+        checkpoint.write_text(json.dumps({"model": "products", "path": str(path.resolve()), "records": 3}))
+
+        with mock.patch("crm.management.commands.crm_import.json.loads", wraps=json.loads) as loads:
+            self.run_import("products", str(path), "--resume")
+        # The checkpoint itself, then records 4 and 5
+        self.assertEqual(loads.call_count, 3)
+        self.assertEqual(list(Product.objects.values_list("name", flat=True)), ["P3", "P4"])
+
+    def test_rejects_product_names_that_are_not_a_list(self):
+        Customer.objects.create(name="Alice", email="alice@example.com")
+        Product.objects.create(name="Laptop", price=1, stock=5)
+        orders = self.write("orders.ndjson", (
+            '{"customer_email": "alice@example.com", "product_names": 5}\n'
+            '{"customer_email": "alice@example.com", "product_names": true}\n'
+            '{"customer_email": "alice@example.com", "product_names": ["Laptop"]}\n'
+        ))
+        out, err = self.run_import("orders", str(orders))
+        self.assertIn("1 created, 2 rejected", out)
+        self.assertIn("record 1: product_names must be a list", err)
+        self.assertIn("record 2: product_names must be a list", err)
+
+
+class CreateOrderTests(GraphQLTestCase):
+    GRAPHQL_URL = "/graphql"
+
+    MUTATION = """
+        mutation ($customerId: ID!, $productIds: [ID]!) {
+            createOrder(input: {customerId: $customerId, productIds: $productIds}) {
+                order { id totalAmount }
+            }
+        }
+    """
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Alice", email="alice@example.com")
+
+    def make_products(self, count, stock=5):
+        return Product.objects.bulk_create(
+            [Product(name=f"P{i}", price=Decimal("1.50"), stock=stock) for i in range(count)]
+        )
+
+    def create_order(self, products):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.query(self.MUTATION, variables={
+                "customerId": self.customer.pk, "productIds": [p.pk for p in products],
+            })
+        return len(ctx.captured_queries), response.json()
+
+    def test_query_count_does_not_depend_on_product_count(self):
+        small, _ = self.create_order(self.make_products(2))
+        large, body = self.create_order(self.make_products(40))
+        self.assertEqual(small, large)
+        self.assertEqual(body["data"]["createOrder"]["order"]["totalAmount"], "60.00")
+        self.assertEqual(set(Product.objects.filter(name="P39").values_list("stock", flat=True)), {4})
+
+    def test_out_of_stock_rolls_back(self):
+        products = self.make_products(1) + self.make_products(1, stock=0)
+        _, body = self.create_order(products)
+        self.assertIn("Out of stock", body["errors"][0]["message"])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Product.objects.get(pk=products[0].pk).stock, 5)
+
+    def test_total_follows_later_product_changes(self):
+        first, second, third = self.make_products(3)
+        order = Order.objects.create(customer=self.customer)
+        order.products.add(first, second)
+        self.assertEqual(order.total_amount, Decimal("3.00"))
+        order.products.remove(first)
+        self.assertEqual(order.total_amount, Decimal("1.50"))
+
+        third.orders.add(order)
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, Decimal("3.00"))
+        third.orders.clear()
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, Decimal("1.50"))
+
+
+@eager_tasks
+class StockReservationTests(GraphQLTestCase):
+    GRAPHQL_URL = "/graphql"
+
+    RESERVE = """
+        mutation ($productId: ID!, $quantity: Int) {
+            reserveStock(productId: $productId, quantity: $quantity) {
+                reservation { id quantity product { stock } }
+            }
+        }
+    """
+    RELEASE = """
+        mutation ($id: ID!) { releaseStock(reservationId: $id) { released product { stock } } }
+    """
+    ORDER = """
+        mutation ($customerId: ID!, $productIds: [ID]!, $reservationIds: [ID]) {
+            createOrder(input: {customerId: $customerId, productIds: $productIds, reservationIds: $reservationIds}) {
+                order { totalAmount }
+            }
+        }
+    """
+
+    def setUp(self):
+        self.product = Product.objects.create(name="Laptop", price=Decimal("10.00"), stock=3)
+
+    def reserve(self, quantity):
+        return self.query(self.RESERVE, variables={"productId": self.product.pk, "quantity": quantity}).json()
+
+    def stock(self):
+        return Product.objects.get(pk=self.product.pk).stock
+
+    def test_reserve_never_oversells_and_release_returns_once(self):
+        reservation = self.reserve(2)["data"]["reserveStock"]["reservation"]
+        self.assertEqual(reservation["product"], {"stock": 1})
+        body = self.reserve(2)
+        self.assertEqual(body["errors"][0]["message"], "Out of stock: Laptop has 1 left")
+        self.assertEqual(self.stock(), 1)
+
+        released = self.query(self.RELEASE, variables={"id": reservation["id"]}).json()
+        self.assertEqual(released["data"]["releaseStock"], {"released": 2, "product": {"stock": 3}})
+        again = self.query(self.RELEASE, variables={"id": reservation["id"]}).json()
+        self.assertEqual(again["errors"][0]["message"], "Unknown or expired reservation")
+        self.assertEqual(self.stock(), 3)
+
+    def test_orders_take_their_unit_from_the_reservation(self):
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        reservation_id = self.reserve(3)["data"]["reserveStock"]["reservation"]["id"]
+        variables = {"customerId": customer.pk, "productIds": [self.product.pk]}
+        # Everything is reserved, so only the reservation's holder can order
+        self.assertIn("Out of stock", self.query(self.ORDER, variables=variables).json()["errors"][0]["message"])
+        for _ in range(3):
+            body = self.query(self.ORDER, variables={**variables, "reservationIds": [reservation_id]}).json()
+            self.assertEqual(body["data"]["createOrder"]["order"]["totalAmount"], "10.00")
+        body = self.query(self.ORDER, variables={**variables, "reservationIds": [reservation_id]}).json()
+        self.assertIn("Unknown or expired reservation", body["errors"][0]["message"])
+        self.assertEqual(Order.objects.count(), 3)
+        self.assertEqual(self.stock(), 0)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_expired_reservations_return_to_stock(self):
+        reservations.reserve(self.product.pk, 2, ttl=60)
+        kept = reservations.reserve(self.product.pk, 1, ttl=3600)
+        self.assertEqual(self.stock(), 0)
+        self.assertEqual(tasks.expire_stock_reservations.delay().get(), 0)
+        with mock.patch("django.utils.timezone.now", return_value=kept.created_at + timedelta(minutes=5)):
+            self.assertEqual(tasks.expire_stock_reservations.delay().get(), 1)
+        self.assertEqual(self.stock(), 2)
+        self.assertEqual(list(StockReservation.objects.values_list("pk", flat=True)), [kept.pk])
+
+    def test_expiry_returns_units_claimed_elsewhere_once(self):
+        for returning in (True, False):
+            with self.subTest(returning=returning):
+                Product.objects.filter(pk=self.product.pk).update(stock=3)
+                released = reservations.reserve(self.product.pk, 2, ttl=60)
+                kept = reservations.reserve(self.product.pk, 1, ttl=60)
+                real_claim = reservations._claim
+
+                def racing_claim(rows):
+                    # release() wins one row between the sweep's read and its DELETE
+                    reservations.release(released.pk)
+                    return real_claim(rows)
+
+                later = kept.created_at + timedelta(minutes=5)
+                with mock.patch.object(reservations, "_claim", racing_claim), \
+                        mock.patch.object(reservations, "supports_update_returning", return_value=returning):
+                    self.assertEqual(reservations.expire(now=later), 1)
+                self.assertEqual(self.stock(), 3)
+                self.assertFalse(StockReservation.objects.exists())
+
+    def test_quantity_and_ttl_are_bounded(self):
+        Product.objects.filter(pk=self.product.pk).update(stock=5000)
+        body = self.reserve(1001)
+        self.assertEqual(body["errors"][0]["message"], "Quantity must be at most 1000")
+        body = self.query(
+            "mutation ($id: ID!, $ttl: Int) { reserveStock(productId: $id, ttlSeconds: $ttl) { reservation { id } } }",
+            variables={"id": self.product.pk, "ttl": 2**31 - 1},
+        ).json()
+        self.assertEqual(body["errors"][0]["message"], "TTL must be at most 86400 seconds")
+        with self.assertRaisesMessage(ValueError, "TTL must be at most 60 seconds"), \
+                self.settings(CRM_RESERVATION_MAX_TTL=60):
+            reservations.reserve(self.product.pk, ttl=61)
+        # Python callers are not limited to GraphQL's 32-bit Int
+        with self.assertRaisesMessage(ValueError, "TTL must be at most"):
+            reservations.reserve(self.product.pk, ttl=10**12)
+        self.assertEqual(self.stock(), 5000)
+        self.assertFalse(StockReservation.objects.exists())
+
+
+class BulkCreateOrdersTests(GraphQLTestCase):
+    GRAPHQL_URL = "/graphql"
+
+    MUTATION = """
+        mutation ($input: [OrderInput]!) {
+            bulkCreateOrders(input: $input) { orders { id totalAmount } errors }
+        }
+    """
+
+    def setUp(self):
+        self.customers = [
+            Customer.objects.create(name=f"C{i}", email=f"c{i}@example.com") for i in range(3)
+        ]
+        self.products = Product.objects.bulk_create(
+            [Product(name=f"P{i}", price=Decimal("1.50"), stock=20) for i in range(5)]
+        )
+
+    def bulk_create(self, items):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.query(self.MUTATION, variables={"input": items})
+        self.assertResponseNoErrors(response)
+        return len(ctx.captured_queries), response.json()["data"]["bulkCreateOrders"]
+
+    def items(self, count):
+        return [
+            {"customerId": self.customers[i % 3].pk, "productIds": [p.pk for p in self.products[: i % 5 + 1]]}
+            for i in range(count)
+        ]
+
+    def test_query_count_does_not_depend_on_item_count(self):
+        small, _ = self.bulk_create(self.items(2))
+        large, data = self.bulk_create(self.items(9))
+        self.assertEqual(small, large)
+        self.assertEqual(data["errors"], [])
+        self.assertEqual(
+            [o["totalAmount"] for o in data["orders"]][:5], ["1.50", "3.00", "4.50", "6.00", "7.50"]
+        )
+        self.assertEqual(Order.products.through.objects.count(), 3 + 25)
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).stock, 20 - 2 - 9)
+        self.assertEqual(CustomerStats.objects.get(customer=self.customers[0]).order_count, 1 + 3)
+
+    def test_reports_errors_per_item(self):
+        sold_out = Product.objects.create(name="Last", price=Decimal("2.00"), stock=1)
+        _, data = self.bulk_create([
+            {"customerId": self.customers[0].pk, "productIds": [sold_out.pk]},
+            {"customerId": self.customers[1].pk, "productIds": [sold_out.pk, self.products[0].pk]},
+            {"customerId": 999, "productIds": [self.products[0].pk]},
+            {"customerId": self.customers[2].pk, "productIds": [999]},
+            {"customerId": self.customers[2].pk, "productIds": ["x"]},
+        ])
+        self.assertEqual([o["totalAmount"] for o in data["orders"]], ["2.00"])
+        self.assertEqual(data["errors"], [
+            "Item 4: Invalid product ID",
+            "Item 1: Out of stock: Last",
+            "Item 2: Invalid Customer ID",
+            "Item 3: No products",
+        ])
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).stock, 20)
+
+
+class BulkCreateProductsTests(GraphQLTestCase):
+    GRAPHQL_URL = "/graphql"
+
+    def test_creates_valid_rows_and_indexes_them(self):
+        response = self.query(
+            """
+            mutation ($input: [ProductInput]!) {
+                bulkCreateProducts(input: $input) { products { name price stock } errors }
+            }
+            """,
+            variables={"input": [
+                {"name": "Laptop", "price": 999.99, "stock": 3},
+                {"name": "Broken", "price": -1},
+                {"name": "Mouse", "price": 20.25},
+            ]},
+        )
+        self.assertResponseNoErrors(response)
+        data = response.json()["data"]["bulkCreateProducts"]
+        self.assertEqual(data["products"], [
+            {"name": "Laptop", "price": "999.99", "stock": 3},
+            {"name": "Mouse", "price": "20.25", "stock": 0},
+        ])
+        self.assertEqual(data["errors"], ["Item 1: Price positive"])
+        self.assertEqual(
+            [p.name for p in search.ranked_search(Product, "mous", 5)], ["Mouse"]
+        )
+
+
+class BatchedRequestTests(TestCase):
+    MUTATION = """
+        mutation ($customerId: ID!, $productIds: [ID]!) {
+            createOrder(input: {customerId: $customerId, productIds: $productIds}) { order { totalAmount } }
+        }
+    """
+
+    def post(self, body):
+        return self.client.post("/graphql", json.dumps(body), content_type="application/json")
+
+    def test_entries_execute_in_order_and_fail_alone(self):
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        product = Product.objects.create(name="P", price=Decimal("2.00"), stock=1)
+        order = {"query": self.MUTATION, "variables": {"customerId": customer.pk, "productIds": [product.pk]}}
+        response = self.post([
+            order,
+            order,
+            {"query": "{ allProducts { edges { node { stock } } } }"},
+        ])
+        self.assertEqual(response.status_code, 200)
+        first, second, products = response.json()
+        self.assertEqual(first["data"]["createOrder"]["order"]["totalAmount"], "2.00")
+        self.assertIn("Out of stock", second["errors"][0]["message"])
+        self.assertEqual(products["data"]["allProducts"]["edges"], [{"node": {"stock": 0}}])
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_single_operations_are_unchanged(self):
+        response = self.post({"query": "{ allProducts { totalCount } }"})
+        self.assertEqual(response.json()["data"], {"allProducts": {"totalCount": 0}})
+
+    def test_batch_size_is_limited(self):
+        with self.settings(CRM_MAX_BATCH_SIZE=2):
+            response = self.post([{"query": "{ allProducts { totalCount } }"}] * 3)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("over the limit of 2", response.json()["errors"][0]["message"])
+
+
+class ExportTests(TestCase):
+    def rows(self, response):
+        body = b"".join(response.streaming_content)
+        if response.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        return body.decode()
+
+    def test_orders_stream_in_chunks_with_joined_columns(self):
+        seed_orders(5)
+        with mock.patch.object(export, "EXPORT_CHUNK_SIZE", 2), CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/export/orders")
+            lines = [json.loads(line) for line in self.rows(response).splitlines()]
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual([line["customer_email"] for line in lines], [f"c{i}@example.com" for i in range(5)])
+        self.assertEqual(lines[0]["product_names"], ["Product 0", "Product 1", "Product 2"])
+        self.assertEqual(lines[0]["total_amount"], "29.97")
+        # One cursor, then the customer and product maps for each of the 3 chunks
+        self.assertEqual(len(queries), 1 + 3 * 2)
+
+    def test_csv_is_filtered_gzipped_and_importable(self):
+        seed_orders(3)
+        response = self.client.get(
+            "/export/orders", {"format": "csv", "customer_name": "Customer 1"}, HTTP_ACCEPT_ENCODING="gzip",
+        )
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        rows = list(csv.DictReader(StringIO(self.rows(response))))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["customer_email"], "c1@example.com")
+        self.assertEqual(rows[0]["product_names"], "Product 0|Product 1|Product 2")
+
+    def test_gzip_follows_accept_encoding_q_values(self):
+        for header, expected in [
+            ("gzip;q=0", None),
+            ("deflate, gzip; q=0.0", None),
+            ("*;q=0", None),
+            ("br, *", "gzip"),
+            ("GZIP;q=0.5, identity", "gzip"),
+            ("gzip;q=0, *", None),
+        ]:
+            with self.subTest(header=header):
+                response = self.client.get("/export/customers", HTTP_ACCEPT_ENCODING=header)
+                self.assertEqual(response.get("Content-Encoding"), expected)
+
+    def test_customers_and_bad_requests(self):
+        Customer.objects.create(name="Alice", email="alice@example.com", phone="+1555")
+        lines = self.rows(self.client.get("/export/customers", {"format": "csv", "name": "ali"})).splitlines()
+        self.assertEqual(lines[0], "id,name,email,phone,created_at")
+        self.assertIn("alice@example.com,+1555", lines[1])
+        self.assertEqual(self.client.get("/export/customers", {"format": "xml"}).status_code, 400)
+        self.assertEqual(self.client.get("/export/orders", {"order_date_gte": "soon"}).status_code, 400)
+        self.assertEqual(self.client.get("/export/products").status_code, 404)
+
+
+@eager_tasks
+class CrmStatsTests(GraphQLTestCase):
+    GRAPHQL_URL = "/graphql"
+
+    QUERY = """
+        query ($from: DateTime, $groupBy: StatsGrouping) {
+            crmStats(dateFrom: $from, groupBy: $groupBy) {
+                customerCount orderCount totalRevenue
+                buckets { period orderCount revenue }
+            }
+        }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        for day, amount in ((1, "0.10"), (1, "0.20"), (9, "10.05")):
+            order = Order.objects.create(customer=customer, total_amount=Decimal(amount))
+            Order.objects.filter(pk=order.pk).update(order_date=datetime(2025, 3, day, tzinfo=timezone.utc))
+
+    def stats(self, **variables):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.query(self.QUERY, variables=variables)
+        self.assertResponseNoErrors(response)
+        return len(ctx.captured_queries), response.json()["data"]["crmStats"]
+
+    def test_totals_keep_decimal_precision(self):
+        queries, stats = self.stats()
+        self.assertEqual(queries, 2)
+        self.assertEqual(stats["customerCount"], 1)
+        self.assertEqual(stats["orderCount"], 3)
+        self.assertEqual(stats["totalRevenue"], "10.35")
+
+    def test_date_range_and_buckets(self):
+        _, stats = self.stats(**{"from": "2025-03-02T00:00:00+00:00", "groupBy": "DAY"})
+        self.assertEqual(stats["orderCount"], 1)
+        self.assertEqual(stats["buckets"], [
+            {"period": "2025-03-09T00:00:00+00:00", "orderCount": 1, "revenue": "10.05"},
+        ])
+
+        _, stats = self.stats(groupBy="WEEK")
+        self.assertEqual([b["orderCount"] for b in stats["buckets"]], [2, 1])
+
+    def test_report_task_runs_in_process(self):
+        with mock.patch("builtins.open", mock.mock_open()) as log:
+            generate_crm_report.delay()
+        written = log().write.call_args[0][0]
+        self.assertIn("1 customers, 3 orders, 10.35 revenue (1 chunks", written)
+
+
+@eager_tasks
+class FanOutJobTests(TestCase):
+    """The Celery jobs, run eagerly (eager_tasks)."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = Path(tmp.name)
+        for patcher in (
+            mock.patch("crm.fanout.CHUNK_SIZE", 2),
+            mock.patch.object(tasks, "REPORT_LOG_FILE", self.tmp / "report.txt"),
+            mock.patch.object(tasks, "LOW_STOCK_LOG_FILE", self.tmp / "stock.txt"),
+            mock.patch.object(send_order_reminders, "LOG_FILE", self.tmp / "reminders.txt"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_report_reduces_chunks(self):
+        seed_orders(5, products_per_order=1)
+        self.assertEqual(generate_crm_report.delay().get(), 3)
+        log = (self.tmp / "report.txt").read_text()
+        self.assertIn("5 customers, 5 orders, 49.95 revenue (3 chunks, slowest", log)
+
+    def test_reminders_are_sent_once(self):
+        seed_orders(3, products_per_order=1)
+        Order.objects.filter(pk=Order.objects.earliest("pk").pk).update(
+            order_date=datetime.now(timezone.utc) - timedelta(days=30)
+        )
+        tasks.send_order_reminders.delay()
+        tasks.send_order_reminders.delay()
+        lines = (self.tmp / "reminders.txt").read_text().splitlines()
+        self.assertEqual(len([line for line in lines if "Reminder for Order" in line]), 2)
+        self.assertIn("sent to c1@example.com", lines[0])
+        self.assertIn("Run finished: 0 sent, 2 already sent, 1 chunks", lines[-1])
+        self.assertEqual(OrderReminder.objects.count(), 2)
+
+    def test_reminders_sent_by_the_script_are_skipped(self):
+        seed_orders(2, products_per_order=1)
+        with mock.patch("builtins.print"):
+            send_order_reminders.send_reminders()
+        tasks.send_order_reminders.delay()
+        lines = (self.tmp / "reminders.txt").read_text().splitlines()
+        self.assertIn("Run finished: 0 sent, 2 already sent, 1 chunks", lines[-1])
+
+    def test_low_stock_restocks_each_range(self):
+        low = Product.objects.bulk_create(
+            [Product(name=f"P{i}", price=Decimal("1.00"), stock=i * 5) for i in range(5)]
+        )
+        self.assertEqual(tasks.update_low_stock.delay().get(), 1)
+        self.assertEqual(sorted(Product.objects.values_list("stock", flat=True)), [10, 10, 15, 15, 20])
+        log = (self.tmp / "stock.txt").read_text()
+        self.assertIn(f"Restocked: {low[1].name} -> New Stock: 15", log)
+        self.assertIn("Restock finished: 2 products", log)
+
+    def test_chunks_retry_database_errors(self):
+        seed_orders(2, products_per_order=1)
+        real_filter, calls = Order.objects.filter, []
+
+        def locked_once(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 1:
+                raise OperationalError("database is locked")
+            return real_filter(*args, **kwargs)
+
+        with mock.patch.object(Order.objects, "filter", locked_once):
+            result = tasks.report_chunk.apply(args=(0, 100), throw=False)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(result.result["order_count"], 2)
+
+    def test_retried_reminders_are_sent_once(self):
+        seed_orders(2, products_per_order=1)
+        real_save, calls = send_order_reminders.save_sent, []
+
+        def locked_once(sent):
+            calls.append(sent)
+            if len(calls) == 1:
+                raise OperationalError("database is locked")
+            return real_save(sent)
+
+        since = (datetime.now(timezone.utc) - timedelta(days=1)).isoformat()
+        chunk = tasks.reminder_chunk.apply(args=(0, 100, since)).get()
+        with mock.patch.object(send_order_reminders, "save_sent", locked_once):
+            tasks.finish_order_reminders.apply(args=([chunk], since), throw=False)
+        self.assertEqual(len(calls), 2)
+        lines = (self.tmp / "reminders.txt").read_text().splitlines()
+        self.assertEqual(len([line for line in lines if "Reminder for Order" in line]), 2)
+        self.assertEqual(OrderReminder.objects.count(), 2)
+
+
+class SqliteTuningTests(TestCase):
+    def test_new_connections_get_wal_and_pragmas(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            fresh = connection.copy()
+            fresh.settings_dict["NAME"] = str(Path(tmp) / "db.sqlite3")
+            try:
+                with fresh.cursor() as cursor:
+                    pragmas = {
+                        name: cursor.execute(f"PRAGMA {name}").fetchone()[0]
+                        for name in ("journal_mode", "synchronous", "busy_timeout")
+                    }
+            finally:
+                fresh.close()
+        self.assertEqual(pragmas, {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 5000})
+
+    def test_phone_pattern_is_an_index_range(self):
+        for phone in ("+1555-0100", "+1556-0100", "+155", "555-0100"):
+            Customer.objects.create(name=phone, email=f"{phone}@example.com", phone=phone)
+        queryset = CustomerFilter({"phone_pattern": "+1555"}).qs
+        self.assertEqual(list(queryset.values_list("phone", flat=True)), ["+1555-0100"])
+        self.assertIn("crm_customer_phone_idx", queryset.explain())
+        # LIKE wildcards are plain characters
+        self.assertFalse(CustomerFilter({"phone_pattern": "+1%"}).qs.exists())
+
+    def test_only_query_operations_outside_transactions_use_the_replica(self):
+        router = ReadReplicaRouter()
+        with mock.patch.object(connection, "in_atomic_block", False):
+            self.assertIsNone(router.db_for_read(Customer))
+            with replica_reads():
+                self.assertEqual(router.db_for_read(Customer), REPLICA)
+        with replica_reads():
+            # Batched requests run in a transaction and read their own writes
+            self.assertIsNone(router.db_for_read(Customer))
+        self.assertEqual(router.db_for_write(Customer), "default")
+        self.assertFalse(router.allow_migrate(REPLICA, "crm"))
+
+
+class PurgeInactiveCustomersTests(TestCase):
+    def setUp(self):
+        long_ago = datetime.now(timezone.utc) - timedelta(days=400)
+        self.stale, self.active, self.new = (
+            Customer.objects.create(name=name, email=f"{name}@example.com")
+            for name in ("stale", "active", "new")
+        )
+        Customer.objects.filter(pk__in=[self.stale.pk, self.active.pk]).update(created_at=long_ago)
+        product = Product.objects.create(name="P", price=Decimal("1.00"))
+        old_order = Order.objects.create(customer=self.stale)
+        old_order.products.add(product)
+        Order.objects.filter(pk=old_order.pk).update(order_date=long_ago)
+        # update() sends no signal; the nightly reconcile would catch this
+        customer_stats.refresh([self.stale.pk])
+        Order.objects.create(customer=self.active)
+
+    def purge(self, *args):
+        out = StringIO()
+        call_command("purge_inactive_customers", *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_only_counts(self):
+        self.assertIn("Would delete 1 inactive customers", self.purge("--dry-run"))
+        self.assertEqual(Customer.objects.count(), 3)
+
+    def test_dry_run_counts_what_the_run_deletes(self):
+        # Stats claiming a recent order keep this customer out of the run
+        ghost = Customer.objects.create(name="ghost", email="ghost@example.com")
+        Customer.objects.filter(pk=ghost.pk).update(created_at=datetime.now(timezone.utc) - timedelta(days=400))
+        CustomerStats.objects.filter(customer=ghost).update(last_order_date=datetime.now(timezone.utc))
+        self.assertIn("Would delete 1 inactive customers", self.purge("--dry-run"))
+        self.assertIn("Deleted 1 inactive customers", self.purge())
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        long_ago = datetime.now(timezone.utc) - timedelta(days=400)
+        product = Product.objects.get()
+
+        def purge_stale(count):
+            customers = Customer.objects.bulk_create(
+                Customer(name=f"gone{count}-{i}", email=f"gone{count}-{i}@example.com") for i in range(count)
+            )
+            Customer.objects.filter(pk__in=[c.pk for c in customers]).update(created_at=long_ago)
+            for customer in customers:
+                for _ in range(3):
+                    Order.objects.create(customer=customer).products.add(product)
+            Order.objects.filter(customer__in=customers).update(order_date=long_ago)
+            customer_stats.rebuild([c.pk for c in customers])
+            # Folded lines make the purge append retractions
+            sales_rollups.fold()
+            with CaptureQueriesContext(connection) as ctx:
+                out = self.purge()
+            self.assertIn(f"Deleted {count} inactive customers ({3 * count} orders)", out)
+            return len(ctx.captured_queries)
+
+        self.purge()  # the stale customer of setUp
+        self.assertEqual(purge_stale(2), purge_stale(10))
+        self.assertTrue(SalesRollup.objects.filter(order_count__lt=0).exists())
+
+    def test_deletes_stale_customers_and_their_orders(self):
+        out = self.purge("--batch-size", "1")
+        self.assertIn("Deleted 1 inactive customers (1 orders)", out)
+        self.assertEqual(set(Customer.objects.values_list("name", flat=True)), {"active", "new"})
+        self.assertFalse(Order.products.through.objects.exists())
+
+
+class CustomerStatsTests(GraphQLTestCase):
+    GRAPHQL_URL = "/graphql"
+
+    def setUp(self):
+        self.alice = Customer.objects.create(name="Alice", email="alice@example.com")
+        self.bob = Customer.objects.create(name="Bob", email="bob@example.com")
+        self.product = Product.objects.create(name="P", price=Decimal("2.50"), stock=10)
+
+    def stats(self, customer):
+        row = CustomerStats.objects.get(customer=customer)
+        return row.order_count, row.total_spent, row.last_order_date
+
+    def test_follows_order_writes(self):
+        self.assertEqual(self.stats(self.alice), (0, Decimal("0"), None))
+        first = Order.objects.create(customer=self.alice, total_amount=Decimal("4.00"))
+        second = Order.objects.create(customer=self.alice)
+        second.products.add(self.product)
+        self.assertEqual(self.stats(self.alice), (2, Decimal("6.50"), second.order_date))
+
+        second.delete()
+        self.assertEqual(self.stats(self.alice), (1, Decimal("4.00"), first.order_date))
+        first.customer = self.bob
+        first.save()
+        self.assertEqual(self.stats(self.alice), (0, Decimal("0"), None))
+        self.assertEqual(self.stats(self.bob)[0], 1)
+
+        self.bob.delete()
+        self.assertFalse(CustomerStats.objects.filter(customer_id=self.bob.pk).exists())
+
+    def test_bulk_order_delete_refreshes_each_customer_once(self):
+        for customer in (self.alice, self.alice, self.bob):
+            Order.objects.create(customer=customer, total_amount=Decimal("1.00"))
+        with mock.patch.object(customer_stats, "refresh", wraps=customer_stats.refresh) as refresh:
+            Order.objects.filter(total_amount=Decimal("1.00")).delete()
+        refresh.assert_called_once_with({self.alice.pk, self.bob.pk})
+        self.assertEqual(self.stats(self.alice)[0], 0)
+        self.assertEqual(self.stats(self.bob)[0], 0)
+
+    def test_reconcile_repairs_drift(self):
+        Order.objects.create(customer=self.alice, total_amount=Decimal("4.00"))
+        CustomerStats.objects.filter(customer=self.alice).update(order_count=7)
+        CustomerStats.objects.filter(customer=self.bob).delete()
+        self.assertEqual(customer_stats.reconcile(batch_size=1), (2, 2))
+        self.assertEqual(self.stats(self.alice)[0], 1)
+        self.assertEqual(self.stats(self.bob)[0], 0)
+        self.assertEqual(customer_stats.reconcile(), (2, 0))
+
+    def test_filters_and_field_are_batched(self):
+        Order.objects.create(customer=self.alice, total_amount=Decimal("40.00"))
+        Order.objects.create(customer=self.bob, total_amount=Decimal("5.00"))
+        query = """
+            query ($min: Decimal) {
+                allCustomers(totalSpentGte: $min, orderCountGte: 1) { edges { node {
+                    name stats { orderCount totalSpent lastOrderDate }
+                } } }
+            }
+        """
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.query(query, variables={"min": "10"})
+        self.assertResponseNoErrors(response)
+        nodes = [e["node"] for e in response.json()["data"]["allCustomers"]["edges"]]
+        self.assertEqual([(n["name"], n["stats"]["totalSpent"]) for n in nodes], [("Alice", "40.00")])
+        # The page and its stats come from one joined SELECT, plus the count
+        self.assertEqual(len(ctx.captured_queries), 2)
+
+    def test_filter_inactive_customers(self):
+        order = Order.objects.create(customer=self.alice)
+        cutoff = order.order_date + timedelta(seconds=1)
+        response = self.query(
+            "query ($before: DateTime) { allCustomers(lastOrderBefore: $before) { edges { node { name } } } }",
+            variables={"before": cutoff.isoformat()},
+        )
+        self.assertResponseNoErrors(response)
+        self.assertEqual(
+            [e["node"]["name"] for e in response.json()["data"]["allCustomers"]["edges"]], ["Alice"]
+        )
+
+
+class SalesRollupTests(GraphQLTestCase):
+    GRAPHQL_URL = "/graphql"
+
+    QUERY = """
+        query ($productId: ID!, $granularity: StatsGrouping!, $from: DateTime, $to: DateTime) {
+            salesTimeseries(productId: $productId, granularity: $granularity, from: $from, to: $to) {
+                period orderCount revenue
+            }
+        }
+    """
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        self.pen = Product.objects.create(name="Pen", price=Decimal("2.50"), stock=10)
+        self.ink = Product.objects.create(name="Ink", price=Decimal("4.00"), stock=10)
+
+    def order(self, day, *products):
+        order = Order.objects.create(customer=self.customer)
+        order.products.add(*products)
+        Order.objects.filter(pk=order.pk).update(order_date=datetime(2026, 3, day, 10, tzinfo=timezone.utc))
+        return order
+
+    def series(self, granularity, product=None, **variables):
+        response = self.query(self.QUERY, variables={
+            "productId": (product or self.pen).pk, "granularity": granularity, **variables,
+        })
+        self.assertResponseNoErrors(response)
+        return [
+            (bucket["period"][:10], bucket["orderCount"], bucket["revenue"])
+            for bucket in response.json()["data"]["salesTimeseries"]
+        ]
+
+    def test_buckets_by_granularity(self):
+        self.order(2, self.pen, self.ink)  # Monday
+        self.order(4, self.pen)
+        self.order(9, self.pen)
+        self.assertEqual(sales_rollups.fold(), 4)
+        self.assertEqual(self.series("DAY"), [
+            ("2026-03-02", 1, "2.50"), ("2026-03-04", 1, "2.50"), ("2026-03-09", 1, "2.50"),
+        ])
+        self.assertEqual(self.series("WEEK"), [("2026-03-02", 2, "5.00"), ("2026-03-09", 1, "2.50")])
+        self.assertEqual(self.series("MONTH", product=self.ink), [("2026-03-01", 1, "4.00")])
+        self.assertEqual(
+            self.series("DAY", **{"from": "2026-03-03T00:00:00Z", "to": "2026-03-05T00:00:00Z"}),
+            [("2026-03-04", 1, "2.50")],
+        )
+
+    def test_reads_buckets_not_orders(self):
+        for day in range(1, 29):
+            self.order(day, self.pen)
+        sales_rollups.fold()
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.series("MONTH"), [("2026-03-01", 28, "70.00")])
+        sql = [q["sql"] for q in ctx.captured_queries if "crm_" in q["sql"]]
+        # The bucket rows, then the lines not folded yet
+        self.assertEqual(len(sql), 2)
+        self.assertNotIn("crm_order\"", sql[0])
+
+    def test_unfolded_lines_are_included(self):
+        self.order(2, self.pen)
+        sales_rollups.fold()
+        self.order(2, self.pen)
+        self.assertEqual(self.series("DAY"), [("2026-03-02", 2, "5.00")])
+        sales_rollups.fold()
+        self.assertEqual(self.series("DAY"), [("2026-03-02", 2, "5.00")])
+
+    def test_removed_lines_are_retracted_and_compacted(self):
+        first = self.order(2, self.pen, self.ink)
+        second = self.order(2, self.pen)
+        sales_rollups.fold()
+        first.products.remove(self.pen)
+        self.ink.orders.clear()
+        second.delete()
+        self.assertEqual(self.series("DAY"), [])
+        self.assertEqual(self.series("DAY", product=self.ink), [])
+
+        self.order(3, self.pen)
+        sales_rollups.fold()
+        self.assertEqual(sales_rollups.compact(), 6)
+        self.assertEqual(SalesRollup.objects.count(), 3)
+        self.assertEqual(self.series("WEEK"), [("2026-03-02", 1, "2.50")])
+
+    def test_compaction_keeps_deltas_appended_meanwhile(self):
+        self.order(2, self.pen)
+        sales_rollups.fold()
+        self.order(2, self.pen)
+        sales_rollups.fold()
+        real_chunked = sales_rollups.chunked
+
+        def fold_first(*args):
+            # A fold committing between the bucket read and the merge
+            self.order(2, self.pen)
+            sales_rollups.fold()
+            return real_chunked(*args)
+
+        with mock.patch.object(sales_rollups, "chunked", fold_first):
+            self.assertEqual(sales_rollups.compact(), 3)
+        self.assertEqual(self.series("DAY"), [("2026-03-02", 3, "7.50")])
+        self.assertEqual(sales_rollups.compact(), 3)
+        self.assertEqual(SalesRollup.objects.count(), 3)
+        self.assertEqual(self.series("MONTH"), [("2026-03-01", 3, "7.50")])
+
+    def test_backfill_repairs_price_drift(self):
+        order = self.order(2, self.pen)
+        self.order(2, self.pen)
+        sales_rollups.fold()
+        # Retracted at the new price, folded at the old one
+        Product.objects.filter(pk=self.pen.pk).update(price=Decimal("3.00"))
+        order.products.clear()
+        self.assertEqual(self.series("DAY"), [("2026-03-02", 1, "2.00")])
+
+        sales_rollups.backfill(datetime(2026, 3, 2, tzinfo=timezone.utc), datetime(2026, 3, 2, tzinfo=timezone.utc))
+        self.assertEqual(self.series("DAY"), [("2026-03-02", 1, "3.00")])
+        self.assertEqual(self.series("MONTH"), [("2026-03-01", 1, "3.00")])
+
+
+class SearchTests(GraphQLTestCase):
+    GRAPHQL_URL = "/graphql"
+
+    def setUp(self):
+        self.alice = Customer.objects.create(name="Alice Johnson", email="alice@example.com")
+        self.bob = Customer.objects.create(name="Bob Stone", email="bob@johnson.org")
+        self.laptop = Product.objects.create(name="Laptop", price=Decimal("999.00"))
+        self.sleeve = Product.objects.create(name="Laptop sleeve, padded", price=Decimal("25.00"))
+        order = Order.objects.create(customer=self.bob)
+        order.products.add(self.sleeve)
+
+    def names(self, query, field):
+        response = self.query(query)
+        self.assertResponseNoErrors(response)
+        data = response.json()["data"][field]
+        if isinstance(data, dict):
+            data = [edge["node"] for edge in data["edges"]]
+        return [node.get("name") or node.get("id") for node in data]
+
+    def check_backend(self):
+        self.assertEqual(
+            self.names('query { allCustomers(search: "JOHNSON") { edges { node { name } } } }', "allCustomers"),
+            ["Alice Johnson", "Bob Stone"],
+        )
+        self.assertEqual(
+            self.names('query { searchProducts(query: "lapt") { name } }', "searchProducts"),
+            ["Laptop", "Laptop sleeve, padded"],
+        )
+        self.assertEqual(
+            len(self.names('query { allOrders(productSearch: "sleeve") { edges { node { id } } } }', "allOrders")), 1
+        )
+
+        self.alice.name = "Alice Smith"
+        self.alice.save()
+        self.bob.delete()
+        self.assertEqual(self.names('query { searchCustomers(query: "johnson") { name } }', "searchCustomers"), [])
+        self.assertEqual(
+            self.names('query { searchCustomers(query: "smith") { name } }', "searchCustomers"), ["Alice Smith"]
+        )
+
+    def test_fts5_backend(self):
+        self.assertEqual(search.get_backend().name, "fts5")
+        self.check_backend()
+
+    def test_first_is_bounded(self):
+        for text in ("jo", "johnson"):
+            body = self.query(f'query {{ searchCustomers(query: "{text}", first: -1) {{ name }} }}').json()
+            self.assertEqual(body["errors"][0]["message"], "first must be positive")
+            body = self.query(f'query {{ searchCustomers(query: "{text}", first: 101) {{ name }} }}').json()
+            self.assertEqual(body["errors"][0]["message"], "Requesting 101 results exceeds the `first` limit of 100")
+        self.assertEqual(len(self.names('query { searchCustomers(query: "johnson", first: 1) { name } }', "searchCustomers")), 1)
+
+    def test_trigram_backend(self):
+        with self.settings(CRM_SEARCH_BACKEND="trigram"):
+            search.get_backend().rebuild(Customer)
+            search.get_backend().rebuild(Product)
+            self.check_backend()
+
+    def test_trigram_index_is_shared_between_processes(self):
+        with self.settings(CRM_SEARCH_BACKEND="trigram"):
+            search.get_backend().rebuild(Customer)
+            # Indexed by the post_save receiver, then read through a fresh
+            # backend as another worker process would
+            Customer.objects.create(name="Carol Johnson", email="carol@example.com")
+            with self.assertNumQueries(1):
+                names = set(search.TrigramBackend().filter(Customer.objects.all(), "johnson").values_list("name", flat=True))
+        self.assertEqual(names, {"Alice Johnson", "Bob Stone", "Carol Johnson"})
+
+    def test_short_queries_fall_back_to_icontains(self):
+        self.assertEqual(
+            self.names('query { allProducts(search: "p") { edges { node { name } } } }', "allProducts"),
+            ["Laptop", "Laptop sleeve, padded"],
+        )
+
+
+class KeysetPaginationTests(GraphQLTestCase):
+    GRAPHQL_URL = "/graphql"
+
+    ORDERS_QUERY = """
+        query ($first: Int, $after: String, $last: Int, $before: String) {
+            allOrders(keyset: true, first: $first, after: $after, last: $last, before: $before) {
+                pageInfo { hasNextPage hasPreviousPage startCursor endCursor }
+                edges { node { id } }
+            }
+        }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_orders(7, products_per_order=1)
+        # Several orders share a timestamp so the id tie-breaker matters
+        start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        for i, order in enumerate(Order.objects.order_by("pk")):
+            Order.objects.filter(pk=order.pk).update(order_date=start + timedelta(days=i // 3))
+        cls.expected = list(Order.objects.order_by("order_date", "pk").values_list("pk", flat=True))
+
+    def page(self, **variables):
+        response = self.query(self.ORDERS_QUERY, variables=variables)
+        self.assertResponseNoErrors(response)
+        return response.json()["data"]["allOrders"]
+
+    def ids(self, page):
+        return [int(base64.b64decode(edge["node"]["id"]).decode().split(":")[1]) for edge in page["edges"]]
+
+    def test_walks_forwards_without_gaps_or_repeats(self):
+        seen, after = [], None
+        while True:
+            page = self.page(first=2, after=after)
+            seen += self.ids(page)
+            if not page["pageInfo"]["hasNextPage"]:
+                break
+            after = page["pageInfo"]["endCursor"]
+        self.assertEqual(seen, self.expected)
+
+    def test_walks_backwards(self):
+        last_page = self.page(last=3)
+        self.assertEqual(self.ids(last_page), self.expected[-3:])
+        self.assertTrue(last_page["pageInfo"]["hasPreviousPage"])
+        previous = self.page(last=3, before=last_page["pageInfo"]["startCursor"])
+        self.assertEqual(self.ids(previous), self.expected[-6:-3])
+        self.assertTrue(previous["pageInfo"]["hasNextPage"])
+
+    def test_counts_only_when_total_count_is_selected(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.page(first=2)
+        self.assertFalse(any("COUNT(" in q["sql"] for q in ctx.captured_queries))
+        # orderDate is not selected, but the cursors need it from the page query
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+        response = self.query("""
+            query { allOrders(keyset: true, first: 2, orderDateGte: "2025-01-02T00:00:00+00:00") {
+                totalCount edges { node { id } }
+            } }
+        """)
+        self.assertResponseNoErrors(response)
+        self.assertEqual(response.json()["data"]["allOrders"]["totalCount"], 4)
+
+    def test_rejects_offset_cursors(self):
+        offset_cursor = self.query("query { allOrders(first: 1) { pageInfo { endCursor } } }").json()
+        response = self.query(self.ORDERS_QUERY, variables={
+            "first": 2, "after": offset_cursor["data"]["allOrders"]["pageInfo"]["endCursor"],
+        })
+        self.assertResponseHasErrors(response)
+        self.assertIn("Invalid keyset cursor", response.json()["errors"][0]["message"])
+
+
+class PersistedQueryTests(TestCase):
+    QUERY = "query { allProducts(first: 5) { edges { node { name } } } }"
+
+    def setUp(self):
+        cache.clear()
+        document_cache.clear()
+        Product.objects.create(name="Laptop", price=Decimal("999.00"))
+
+    def post(self, **payload):
+        response = self.client.post("/graphql", json.dumps(payload), content_type="application/json")
+        return response.json()
+
+    def persisted(self, query=None, sha256=None):
+        payload = {"extensions": {"persistedQuery": {"version": 1, "sha256Hash": sha256 or query_hash(self.QUERY)}}}
+        if query:
+            payload["query"] = query
+        return self.post(**payload)
+
+    def test_repeated_documents_are_parsed_and_validated_once(self):
+        with mock.patch("crm.views.parse", wraps=views.parse) as parse:
+            for _ in range(3):
+                self.assertNotIn("errors", self.post(query=self.QUERY))
+        self.assertEqual(parse.call_count, 1)
+        self.assertEqual(document_cache.info()["hits"], 2)
+
+        self.assertIn("errors", self.post(query="query { noSuchField }"))
+        self.assertEqual(document_cache.info()["size"], 1)
+
+    def test_apollo_persisted_query_flow(self):
+        response = self.persisted()
+        self.assertEqual(response["errors"][0]["message"], "PersistedQueryNotFound")
+
+        self.assertEqual(
+            self.persisted(query=self.QUERY)["data"]["allProducts"]["edges"], [{"node": {"name": "Laptop"}}]
+        )
+        self.assertEqual(
+            self.persisted()["data"]["allProducts"]["edges"], [{"node": {"name": "Laptop"}}]
+        )
+        self.assertEqual(persisted_queries.get(query_hash(self.QUERY)), self.QUERY)
+
+    def test_rejects_hash_that_does_not_match_the_query(self):
+        response = self.persisted(query=self.QUERY, sha256="0" * 64)
+        self.assertIn("does not match", response["errors"][0]["message"])
+
+    def test_only_valid_bounded_queries_are_registered(self):
+        invalid = "query { noSuchField }"
+        self.assertIn("errors", self.persisted(query=invalid, sha256=query_hash(invalid)))
+        self.assertIsNone(persisted_queries.get(query_hash(invalid)))
+
+        costly = "query { %s }" % QueryCostTests.FAN_OUT.replace("{ id }", "{ orders { edges { node { id } } } }")
+        response = self.persisted(query=costly, sha256=query_hash(costly))
+        self.assertEqual(response["errors"][0]["extensions"]["code"], "QUERY_TOO_COSTLY")
+        self.assertIsNone(persisted_queries.get(query_hash(costly)))
+
+        oversized = self.QUERY + " " * 100
+        with self.settings(CRM_PERSISTED_QUERY_MAX_LENGTH=len(self.QUERY)), \
+                mock.patch("crm.views.parse", wraps=views.parse) as parse:
+            response = self.persisted(query=oversized, sha256=query_hash(oversized))
+        self.assertEqual(
+            response["errors"][0]["message"], f"Persisted query is over the limit of {len(self.QUERY)} characters"
+        )
+        parse.assert_not_called()
+        self.assertIsNone(persisted_queries.get(query_hash(oversized)))
+
+        with mock.patch.object(cache, "set", wraps=cache.set) as cache_set:
+            self.assertNotIn("errors", self.persisted(query=self.QUERY))
+        cache_set.assert_any_call(mock.ANY, self.QUERY, timeout=24 * 3600)
+
+    def test_lru_eviction(self):
+        documents = DocumentCache(maxsize=2)
+        for key in "abc":
+            documents.put(key, key)
+        documents.get("b")
+        documents.put("d", "d")
+        self.assertIsNone(documents.get("a"))
+        self.assertIsNone(documents.get("c"))
+        self.assertEqual(documents.get("b"), "b")
+        self.assertEqual(documents.info()["evictions"], 2)
+
+
+class ResponseCacheTests(GraphQLTestCase):
+    GRAPHQL_URL = "/graphql"
+
+    PRODUCTS = "query { allProducts { edges { node { name stock } } } }"
+    CUSTOMERS = "query { allCustomers { edges { node { name } } } }"
+
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(name="Laptop", price=Decimal("999.00"), stock=3)
+        Customer.objects.create(name="Alice", email="alice@example.com")
+
+    def run_query(self, query):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.query(query)
+        self.assertResponseNoErrors(response)
+        return response.json()["data"], len(ctx.captured_queries)
+
+    def test_repeated_query_is_served_from_cache(self):
+        first, queries = self.run_query(self.PRODUCTS)
+        self.assertGreater(queries, 0)
+        hits = response_cache.stats.info()["hits"]
+        # Same document, different formatting
+        second, queries = self.run_query("query {\n  allProducts { edges { node { name stock } } }\n}")
+        self.assertEqual(second, first)
+        self.assertEqual(queries, 0)
+        self.assertEqual(response_cache.stats.info()["hits"], hits + 1)
+
+    def test_writes_invalidate_only_the_models_they_touch(self):
+        self.run_query(self.PRODUCTS)
+        self.run_query(self.CUSTOMERS)
+
+        self.product.name = "Laptop Pro"
+        self.product.save()
+
+        data, queries = self.run_query(self.PRODUCTS)
+        self.assertGreater(queries, 0)
+        self.assertEqual(data["allProducts"]["edges"][0]["node"]["name"], "Laptop Pro")
+        _, queries = self.run_query(self.CUSTOMERS)
+        self.assertEqual(queries, 0)
+
+    def test_mutations_and_bulk_writes_bypass_and_invalidate(self):
+        self.run_query(self.PRODUCTS)
+        response = self.query('mutation { createProduct(input: {name: "Mouse", price: 20}) { product { name } } }')
+        self.assertResponseNoErrors(response)
+        data, _ = self.run_query(self.PRODUCTS)
+        self.assertEqual(len(data["allProducts"]["edges"]), 2)
+
+        # restock updates with F()/raw SQL and sends no post_save
+        inventory.restock_low_stock()
+        data, queries = self.run_query(self.PRODUCTS)
+        self.assertGreater(queries, 0)
+        self.assertEqual(data["allProducts"]["edges"][0]["node"]["stock"], 13)
+
+    def test_deletes_invalidate_once_per_call(self):
+        orders = "query { allOrders { edges { node { id } } } }"
+        customers = Customer.objects.bulk_create(
+            Customer(name=f"C{i}", email=f"c{i}@example.com") for i in range(3)
+        )
+        for customer in customers:
+            Order.objects.create(customer=customer).products.add(self.product)
+        self.run_query(orders)
+
+        with mock.patch("crm.signals.invalidate", wraps=response_cache.invalidate) as invalidate:
+            Customer.objects.filter(pk__in=[c.pk for c in customers]).delete()
+        invalidate.assert_called_once_with(Customer, Order)
+        # The cascaded orders are gone from the cached response too
+        data, queries = self.run_query(orders)
+        self.assertGreater(queries, 0)
+        self.assertEqual(data["allOrders"]["edges"], [])
+
+
+class QueryCostTests(TestCase):
+    ORDERS = """
+        query ($first: Int) {
+            allOrders(first: $first) { edges { node {
+                customer { name }
+                products(first: 5) { edges { node { ...productName } } }
+            } } }
+        }
+        fragment productName on ProductType { name }
+    """
+
+    def post(self, query, variables=None):
+        response = self.client.post(
+            "/graphql", json.dumps({"query": query, "variables": variables}), content_type="application/json"
+        )
+        return response.json()
+
+    def test_cost_is_reported_in_extensions(self):
+        cost = self.post(self.ORDERS, {"first": 10})["extensions"]["cost"]
+        # 10 orders + 10 customers + 10 * 5 products
+        self.assertEqual((cost["requested"], cost["depth"]), (70, 2))
+        # An unset page size counts as the relay page limit
+        self.assertEqual(self.post(self.ORDERS)["extensions"]["cost"]["requested"], 100 + 100 + 500)
+
+    def test_rejects_fan_out_before_executing(self):
+        query = """
+            query { allCustomers { edges { node { orders { edges { node {
+                products { edges { node { orders { edges { node { id } } } } } }
+            } } } } } } }
+        """
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.post(query)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(response["errors"][0]["extensions"]["code"], "QUERY_TOO_COSTLY")
+        self.assertEqual(response["extensions"]["cost"]["requested"], 100 + 100**2 + 100**3 + 100**4)
+
+    FAN_OUT = "allCustomers { edges { node { orders { edges { node { products { edges { node { id } } } } } } } } }"
+
+    def test_negative_page_size_cannot_offset_other_fields(self):
+        response = self.post("query { a: allCustomers(first: -1000000) { edges { node { id } } } b: %s }" % self.FAN_OUT)
+        self.assertEqual(response["errors"][0]["extensions"]["code"], "QUERY_TOO_COSTLY")
+        self.assertEqual(response["extensions"]["cost"]["requested"], 100 + 100**2 + 100**3)
+
+    def test_list_fields_count_the_requested_size(self):
+        query = 'query { searchCustomers(query: "abc", first: 1000000) { orders { edges { node { id } } } } }'
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.post(query)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(response["errors"][0]["extensions"]["code"], "QUERY_TOO_COSTLY")
+        # Not capped like a connection page
+        self.assertEqual(response["extensions"]["cost"]["requested"], 1000000 + 1000000 * 100)
+
+    def test_negative_page_size_variable_counts_as_zero(self):
+        response = self.post(
+            "query ($n: Int) { a: allCustomers(first: $n) { edges { node { id } } } b: %s }" % self.FAN_OUT,
+            {"n": -1000000},
+        )
+        self.assertEqual(response["errors"][0]["extensions"]["code"], "QUERY_TOO_COSTLY")
+        self.assertEqual(response["extensions"]["cost"]["requested"], 100 + 100**2 + 100**3)
+
+    def test_non_integer_page_size_variable_is_a_client_error(self):
+        response = self.client.post(
+            "/graphql",
+            json.dumps({"query": "query ($n: Int) { allCustomers(first: $n) { edges { node { id } } } }", "variables": {"n": "abc"}}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        body = response.json()
+        self.assertIn("$n", body["errors"][0]["message"])
+        # Counted as the relay page limit
+        self.assertEqual(body["extensions"]["cost"]["requested"], 100)
+
+    def test_rejects_deep_queries(self):
+        with self.settings(CRM_MAX_QUERY_DEPTH=3):
+            response = self.post("""
+                query { allOrders(first: 1) { edges { node { customer {
+                    orders(first: 1) { edges { node { products(first: 1) { edges { node { name } } } } } }
+                } } } } }
+            """)
+        self.assertEqual(response["errors"][0]["extensions"]["code"], "QUERY_TOO_DEEP")
+        self.assertEqual(response["extensions"]["cost"]["depth"], 4)
+
+
+class TracingTests(TestCase):
+    QUERY = """
+        query CustomerOrders {
+            allCustomers(first: 10) { edges { node {
+                name orders(totalAmountGte: 1) { edges { node { totalAmount } } }
+            } } }
+        }
+    """
+
+    def setUp(self):
+        cache.clear()
+        seed_orders(3, products_per_order=1)
+
+    def post(self, **headers):
+        response = self.client.post(
+            "/graphql", json.dumps({"query": self.QUERY}), content_type="application/json", headers=headers
+        )
+        return response.json()
+
+    def test_trace_header_returns_resolver_timings_and_sql(self):
+        self.assertNotIn("tracing", self.post(**{"X-CRM-Trace": "1"}).get("extensions", {}))
+
+        cache.clear()
+        with self.settings(DEBUG=True), CaptureQueriesContext(connection) as ctx:
+            extensions = self.post(**{"X-CRM-Trace": "1"})["extensions"]
+        resolvers = {tuple(r["path"]): r for r in extensions["tracing"]["execution"]["resolvers"]}
+        self.assertEqual(resolvers[("allCustomers",)]["parentType"], "Query")
+        self.assertIn(("allCustomers", "edges", 0, "node", "orders"), resolvers)
+
+        sql = extensions["sql"]
+        self.assertEqual(sql["count"], len(ctx.captured_queries))
+        # A filtered nested connection counts and fetches once per customer
+        self.assertEqual(sql["byField"]["CustomerType.orders"], 6)
+        self.assertEqual([d["count"] for d in sql["duplicates"]], [3, 3])
+
+    def test_metrics_endpoint(self):
+        self.post()
+        body = self.client.get("/metrics").content.decode()
+        self.assertIn(
+            'crm_graphql_operation_sql_queries_count{operation="CustomerOrders",type="query"}', body
+        )
+        self.assertIn('crm_graphql_root_field_resolve_seconds_bucket{field="Query.allCustomers",le="+Inf"}', body)
+        self.assertIn('crm_graphql_duplicate_sql_total{operation="CustomerOrders"}', body)
+        self.assertIn("crm_graphql_document_cache_hits_total", body)
+
+
+class AsyncViewTests(TestCase):
+    QUERY = """
+        query ($first: Int, $keyset: Boolean) {
+            allCustomers(first: $first, keyset: $keyset) { totalCount edges { node {
+                name orders { totalCount edges { node {
+                    totalAmount customer { name } products { edges { node { name } } }
+                } } }
+            } } }
+            allProducts(first: 2) { totalCount pageInfo { hasNextPage } edges { node { name } } }
+            searchCustomers(query: "Customer 1") { name }
+            crmStats { orderCount }
+        }
+    """
+
+    def setUp(self):
+        cache.clear()
+        seed_orders(5)
+
+    async def post(self, url, query, variables=None, **headers):
+        response = await self.async_client.post(
+            url, json.dumps({"query": query, "variables": variables}),
+            content_type="application/json", headers=headers,
+        )
+        return response.json()
+
+    async def test_matches_sync_view(self):
+        for variables in ({"first": 3}, {"first": 3, "keyset": True}):
+            with self.subTest(**variables):
+                expected = await self.post("/graphql", self.QUERY, variables)
+                cache.clear()
+                result = await self.post("/graphql/async", self.QUERY, variables)
+                self.assertNotIn("errors", result)
+                self.assertEqual(result["data"], expected["data"])
+                self.assertEqual(result["extensions"]["cost"], expected["extensions"]["cost"])
+
+    async def test_loaders_batch_and_sql_is_traced(self):
+        traced = {}
+        for url in ("/graphql", "/graphql/async"):
+            cache.clear()
+            with self.settings(DEBUG=True):
+                result = await self.post(url, self.QUERY, {"first": 5}, **{"X-CRM-Trace": "1"})
+            traced[url] = result["extensions"]["sql"]
+        # The SQL runs in the ORM thread but is still attributed per root field,
+        # and the async loaders batch each relation level like the sync ones
+        self.assertEqual(traced["/graphql/async"]["byField"], traced["/graphql"]["byField"])
+        customers = result["data"]["allCustomers"]["edges"]
+        self.assertEqual(customers[4]["node"]["orders"]["edges"][0]["node"]["customer"]["name"], "Customer 4")
+
+    async def test_async_loaders_batch_concurrent_loads(self):
+        loaders = Loaders(asynchronous=True)
+        orders = [order async for order in Order.objects.order_by("pk")]
+        statements = []
+        with observe_sql(statements.append):
+            customers = await asyncio.gather(*(loaders.customer.load(o.customer_id) for o in orders))
+            products = await asyncio.gather(*(loaders.order_products.load(o.pk) for o in orders))
+            again = await loaders.customer.load(orders[0].customer_id)
+        self.assertEqual(len(statements), 2)
+        self.assertEqual([c.name for c in customers], [f"Customer {i}" for i in range(5)])
+        self.assertEqual(len(products[0]), 3)
+        self.assertIs(again, customers[0])
+
+    async def test_mutations_and_response_cache(self):
+        query = "{ allCustomers { totalCount } }"
+        self.assertEqual((await self.post("/graphql/async", query))["data"]["allCustomers"]["totalCount"], 5)
+
+        result = await self.post("/graphql/async", """
+            mutation {
+                createCustomer(input: {name: "Ann", email: "ann@example.com"}) { customer { name } }
+                createProduct(input: {name: "Lamp", price: 12.5, stock: 0}) { product { name } }
+                updateLowStockProducts(threshold: 1) { updatedProducts { name stock } }
+            }
+        """)
+        self.assertNotIn("errors", result)
+        self.assertEqual(result["data"]["createCustomer"]["customer"]["name"], "Ann")
+        self.assertEqual(result["data"]["updateLowStockProducts"]["updatedProducts"], [{"name": "Lamp", "stock": 10}])
+
+        self.assertEqual((await self.post("/graphql/async", query))["data"]["allCustomers"]["totalCount"], 6)
+        result = await self.post("/graphql/async", """
+            mutation { createCustomer(input: {name: "Ann", email: "ann@example.com"}) { customer { name } } }
+        """)
+        self.assertEqual(result["errors"][0]["message"], "Email already exists")
+
+    async def test_node_lookup(self):
+        customer = await Customer.objects.aget(name="Customer 2")
+        node_id = base64.b64encode(f"CustomerType:{customer.pk}".encode()).decode()
+        result = await self.post("/graphql/async", "query ($id: ID!) { node(id: $id) { ... on CustomerType { name } } }", {"id": node_id})
+        self.assertEqual(result["data"]["node"], {"name": "Customer 2"})
+
+
+class OrderRemindersTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(send_order_reminders, "PAGE_SIZE", 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        seed_orders(5, products_per_order=1)
+        self.now = datetime.now(timezone.utc)
+        self.since = self.now - timedelta(days=send_order_reminders.WINDOW_DAYS)
+
+    def fetch(self):
+        return list(send_order_reminders.fetch_recent_orders(graphql_client.get_session(), self.since))
+
+    def test_pages_follow_the_cursors(self):
+        pages = self.fetch()
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        ids = [node["id"] for page in pages for node in page]
+        self.assertEqual(len(set(ids)), 5)
+        dates = [node["orderDate"] for page in pages for node in page]
+        self.assertEqual(dates, sorted(dates))
+
+    def test_only_orders_inside_the_window(self):
+        old, edge, *_ = Order.objects.order_by("pk")
+        Order.objects.filter(pk=old.pk).update(order_date=self.since - timedelta(seconds=1))
+        Order.objects.filter(pk=edge.pk).update(order_date=self.since)
+        emails = [node["customer"]["email"] for page in self.fetch() for node in page]
+        self.assertEqual(len(emails), 4)
+        self.assertNotIn(old.customer.email, emails)
+        self.assertIn(edge.customer.email, emails)
+
+
+class GraphQLClientTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(graphql_client, "_session", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Any HTTP use inside Django is a regression
+        http = mock.patch.object(graphql_client, "RequestsHTTPTransport", side_effect=AssertionError("HTTP used"))
+        http.start()
+        self.addCleanup(http.stop)
+
+    def test_cron_restock_runs_in_process(self):
+        low = Product.objects.create(name="Low", price=Decimal("1.00"), stock=2)
+        with mock.patch("builtins.open", mock.mock_open()) as log:
+            update_low_stock()
+        low.refresh_from_db()
+        self.assertEqual(low.stock, 12)
+        log().write.assert_called_once()
+        self.assertIn("Restocked: Low -> New Stock: 12", log().write.call_args.args[0])
+
+    def test_order_reminders_page_in_process(self):
+        seed_orders(3, products_per_order=1)
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch.object(send_order_reminders, "LOG_FILE", f"{tmp}/log.txt"), \
+                mock.patch.object(send_order_reminders, "PAGE_SIZE", 2), \
+                mock.patch("builtins.print"):
+            send_order_reminders.send_reminders()
+            send_order_reminders.send_reminders()
+            lines = Path(f"{tmp}/log.txt").read_text().splitlines()
+        reminders = [line for line in lines if "Reminder for Order" in line]
+        self.assertEqual(len(reminders), 3)
+        self.assertIn("sent to c0@example.com", reminders[0])
+        self.assertIn("0 sent, 3 already sent, 2 pages", lines[-1])
+        self.assertEqual(OrderReminder.objects.count(), 3)
+
+    def test_http_fallback_reuses_cached_schema(self):
+        url = "http://crm.internal/graphql"
+        introspection = introspection_from_schema(graphql_client.in_process_client().schema)
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch.object(graphql_client, "SCHEMA_CACHE_DIR", Path(tmp)), \
+                mock.patch.object(graphql_client, "RequestsHTTPTransport") as transport:
+            self.assertTrue(graphql_client.http_client(url).fetch_schema_from_transport)
+            graphql_client.save_introspection(url, introspection)
+            client = graphql_client.http_client(url)
+        self.assertFalse(client.fetch_schema_from_transport)
+        self.assertIn("allOrders", client.schema.query_type.fields)
+        transport.assert_called_with(url=url, retries=2)
@@ -0,0 +1,150 @@
+"""
+Per-operation timing and SQL accounting for the GraphQL endpoint.
+
+Every operation CRMGraphQLView executes runs inside :func:`trace_operation`.
+The trace counts the SQL issued through a SQL observer (crm/instrumentation.py),
+notes statements that ran more than once (the N+1 signature: one SQL
+template executed per parent row), and times the root fields through
+``TracingMiddleware``. The totals go into the histograms in crm/metrics.py.
+
+A request with an ``X-CRM-Trace: 1`` header is traced in detail: every
+field's resolver is timed and the SQL is attributed to the field whose
+resolver issued it. That is returned as Apollo tracing
+(``extensions.tracing``) plus ``extensions.sql``. The header is honoured
+only with DEBUG on or for staff users, because the SQL text is included.
+"""
+import inspect
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+from . import metrics
+from .instrumentation import observe_sql
+
+TRACE_HEADER = "HTTP_X_CRM_TRACE"
+OPERATION_KEY = "(operation)"
+# The field whose resolver is running; a ContextVar so concurrently resolving
+# async fields each attribute their own SQL
+_current_field = ContextVar("crm_current_field", default=OPERATION_KEY)
+
+
+def wants_trace(request):
+    if request.META.get(TRACE_HEADER, "").lower() not in ("1", "true", "yes"):
+        return False
+    user = getattr(request, "user", None)
+    return settings.DEBUG or bool(user is not None and user.is_staff)
+
+
+def _iso(moment):
+    return moment.isoformat().replace("+00:00", "Z")
+
+
+class OperationTrace:
+    def __init__(self, detailed):
+        self.detailed = detailed
+        self.started_at = datetime.now(timezone.utc)
+        self.start = time.perf_counter_ns()
+        self.end = None
+        self.resolvers = []
+        self.sql_count = 0
+        self.sql_by_field = Counter()
+        self.statements = Counter()
+
+    # SQL observer
+    def __call__(self, sql):
+        self.sql_count += 1
+        self.statements[sql] += 1
+        self.sql_by_field[_current_field.get()] += 1
+
+    def record_field(self, info, start, end):
+        key = f"{info.parent_type.name}.{info.field_name}"
+        if info.path.prev is None:
+            metrics.field_duration.observe((end - start) / 1e9, key)
+        if self.detailed:
+            self.resolvers.append({
+                "path": info.path.as_list(),
+                "parentType": info.parent_type.name,
+                "fieldName": info.field_name,
+                "returnType": str(info.return_type),
+                "startOffset": start - self.start,
+                "duration": end - start,
+            })
+
+    def duplicates(self):
+        return [(sql, count) for sql, count in self.statements.most_common() if count > 1]
+
+    def extensions(self):
+        return {
+            "tracing": {
+                "version": 1,
+                "startTime": _iso(self.started_at),
+                "endTime": _iso(datetime.now(timezone.utc)),
+                "duration": self.end - self.start,
+                "execution": {"resolvers": self.resolvers},
+            },
+            "sql": {
+                "count": self.sql_count,
+                "byField": dict(self.sql_by_field),
+                "duplicates": [{"sql": sql, "count": count} for sql, count in self.duplicates()],
+            },
+        }
+
+
+@contextmanager
+def trace_operation(request, operation_ast):
+    trace = OperationTrace(detailed=wants_trace(request))
+    request.crm_trace = trace
+    try:
+        with observe_sql(trace):
+            yield trace
+    finally:
+        trace.end = time.perf_counter_ns()
+        del request.crm_trace
+        name = operation_ast.name.value if operation_ast and operation_ast.name else "anonymous"
+        kind = operation_ast.operation.value if operation_ast else "unknown"
+        metrics.operation_duration.observe((trace.end - trace.start) / 1e9, name, kind)
+        metrics.operation_sql_queries.observe(trace.sql_count, name, kind)
+        repeated = sum(count - 1 for _, count in trace.duplicates())
+        if repeated:
+            metrics.duplicate_sql.inc(repeated, name)
+
+
+class TracingMiddleware:
+    """
+    Graphene middleware timing resolvers for the operation's trace.
+
+    Without a detailed trace only root fields are timed, so nested scalar
+    fields pay a single attribute lookup. Async resolvers are timed until
+    their awaitable completes.
+    """
+
+    def resolve(self, next, root, info, **args):
+        trace = getattr(info.context, "crm_trace", None)
+        if trace is None or (not trace.detailed and info.path.prev is not None):
+            return next(root, info, **args)
+        field = f"{info.parent_type.name}.{info.field_name}"
+        token = _current_field.set(field)
+        start = time.perf_counter_ns()
+        try:
+            result = next(root, info, **args)
+        except Exception:
+            trace.record_field(info, start, time.perf_counter_ns())
+            raise
+        finally:
+            _current_field.reset(token)
+        if inspect.isawaitable(result):
+            return self._finish(result, trace, info, field, start)
+        trace.record_field(info, start, time.perf_counter_ns())
+        return result
+
+    async def _finish(self, awaitable, trace, info, field, start):
+        token = _current_field.set(field)
+        try:
+            return await awaitable
+        finally:
+            _current_field.reset(token)
+            trace.record_field(info, start, time.perf_counter_ns())
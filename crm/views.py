@@ -1,3 +1,454 @@
-from django.shortcuts import render
+import inspect
+import json
+from contextlib import nullcontext
+from dataclasses import dataclass
 
-# Create your views here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.http import HttpResponse, HttpResponseNotAllowed
+from django.http.response import HttpResponseBadRequest
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.utils.utils import set_rollback
+from graphene_django.views import GraphQLView, HttpError
+from graphql import (
+    DocumentNode,
+    ExecutionResult,
+    GraphQLSchema,
+    OperationDefinitionNode,
+    OperationType,
+    execute,
+    get_operation_ast,
+    parse,
+    print_ast,
+    validate_schema,
+)
+from graphql.error import GraphQLError
+from graphql.validation import validate
+
+from . import metrics, response_cache, tracing
+from .cost import query_cost_rule
+from .documents import (
+    PERSISTED_QUERY_NOT_FOUND,
+    document_cache,
+    persisted_queries,
+    query_hash,
+)
+from .routers import replica_reads
+
+MAX_BATCH_SIZE = 50
+
+
+def max_batch_size():
+    return getattr(settings, "CRM_MAX_BATCH_SIZE", MAX_BATCH_SIZE)
+
+
+@dataclass
+class PreparedOperation:
+    schema: GraphQLSchema
+    document: DocumentNode
+    document_hash: str
+    operation_ast: OperationDefinitionNode
+    variables: dict
+    operation_name: str
+    extensions: dict
+
+    @property
+    def kind(self):
+        # None when the operation is missing or ambiguous; execute() reports it
+        return self.operation_ast.operation if self.operation_ast is not None else None
+
+
+class CRMGraphQLView(GraphQLView):
+    """
+    GraphQLView with persisted queries and a cache of validated documents.
+
+    Same request handling as graphene-django's view, except that a query is
+    parsed and validated only the first time this process sees it
+    (crm/documents.py), and query results are served from the response
+    cache while the models they read are unchanged (crm/response_cache.py).
+    Mutations always execute. Operations over the depth or cost budget are
+    rejected before execution, and the computed cost is returned in
+    ``extensions.cost`` (crm/cost.py). Every operation is timed and its SQL
+    counted for /metrics, and traced requests get the details back in
+    ``extensions`` (crm/tracing.py).
+
+    POSTing a JSON array executes each entry as its own operation and
+    answers with the array of results, so a client can send many operations
+    in one round trip. The sync view runs a batch in one transaction, which
+    commits once; an entry that fails rolls back to its own savepoint.
+    """
+
+    def is_batch(self, request):
+        return self.batch or (
+            request.method.lower() == "post"
+            and self.get_content_type(request) == "application/json"
+            and request.body.lstrip()[:1] == b"["
+        )
+
+    def dispatch(self, request, *args, **kwargs):
+        # The view instance is per request, so batch mode can be set here
+        self.batch = self.is_batch(request)
+        with transaction.atomic() if self.batch else nullcontext():
+            return super().dispatch(request, *args, **kwargs)
+
+    def parse_body(self, request):
+        data = super().parse_body(request)
+        if self.batch and len(data) > max_batch_size():
+            raise HttpError(HttpResponseBadRequest(
+                f"Batch of {len(data)} operations is over the limit of {max_batch_size()}."
+            ))
+        return data
+
+    def get_persisted_hash(self, request, data):
+        extensions = request.GET.get("extensions") or data.get("extensions") or {}
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest("Extensions are invalid JSON."))
+        persisted = extensions.get("persistedQuery") or {}
+        return persisted.get("sha256Hash")
+
+    def get_document(self, query, sha256):
+        """
+        Return (document, normalized hash, errors) for ``query``, parsing and
+        validating on a miss. The normalized hash ignores formatting and
+        comments, so equivalent spellings share response cache entries.
+        """
+        key = (sha256 or query_hash(query), self.validation_rules and tuple(self.validation_rules))
+        cached = document_cache.get(key)
+        if cached is not None:
+            return (*cached, None)
+
+        try:
+            document = parse(query)
+        except Exception as e:
+            return None, None, [e]
+        validation_errors = validate(
+            self.schema.graphql_schema,
+            document,
+            self.validation_rules,
+            graphene_settings.MAX_VALIDATION_ERRORS,
+        )
+        if validation_errors:
+            return None, None, validation_errors
+        cached = (document, query_hash(print_ast(document)))
+        document_cache.put(key, cached)
+        return (*cached, None)
+
+    def prepare_operation(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        """
+        Resolve, validate and cost the operation. Returns a PreparedOperation,
+        or the ExecutionResult (None to show GraphiQL) to answer with instead.
+        """
+        sha256 = self.get_persisted_hash(request, data)
+        # The text of a persisted query is stored only once it has passed
+        # every check below
+        register = bool(sha256 and query)
+        if register:
+            try:
+                persisted_queries.check(sha256, query)
+            except ValueError as e:
+                return ExecutionResult(errors=[e])
+        elif sha256:
+            query = persisted_queries.get(sha256)
+            if query is None:
+                return ExecutionResult(errors=[GraphQLError(
+                    PERSISTED_QUERY_NOT_FOUND, extensions={"code": "PERSISTED_QUERY_NOT_FOUND"}
+                )])
+
+        if not query:
+            if show_graphiql:
+                return None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        schema = self.schema.graphql_schema
+
+        schema_validation_errors = validate_schema(schema)
+        if schema_validation_errors:
+            return ExecutionResult(data=None, errors=schema_validation_errors)
+
+        document, document_hash, errors = self.get_document(query, sha256)
+        if errors:
+            return ExecutionResult(data=None, errors=errors)
+
+        operation_ast = get_operation_ast(document, operation_name)
+
+        # Unlike the checks above this depends on the variables (page sizes),
+        # so it runs on every request rather than once per document
+        costs = []
+        cost_errors = validate(schema, document, [query_cost_rule(variables, operation_name, costs.append)])
+        extensions = {"cost": costs[0].as_extension()} if costs else None
+        if cost_errors:
+            return ExecutionResult(data=None, errors=cost_errors, extensions=extensions)
+        if register:
+            persisted_queries.register(sha256, query)
+
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None
+
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    "Can only perform a {} operation from a POST request.".format(
+                        operation_ast.operation.value
+                    ),
+                )
+            )
+
+        return PreparedOperation(
+            schema, document, document_hash, operation_ast, variables, operation_name, extensions
+        )
+
+    def add_extensions(self, result, operation, trace):
+        extensions = operation.extensions
+        if trace.detailed:
+            extensions = {**(extensions or {}), **trace.extensions()}
+        if result is not None and extensions:
+            result.extensions = {**(result.extensions or {}), **extensions}
+        return result
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        operation = self.prepare_operation(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        if not isinstance(operation, PreparedOperation):
+            return operation
+        with tracing.trace_operation(request, operation.operation_ast) as trace:
+            result = self.execute_operation(request, operation)
+        return self.add_extensions(result, operation, trace)
+
+    def get_execute_options(self, request, operation):
+        execute_options = {
+            "root_value": self.get_root_value(request),
+            "context_value": self.get_context(request),
+            "variable_values": operation.variables,
+            "operation_name": operation.operation_name,
+            "middleware": self.get_middleware(request),
+        }
+        if self.execution_context_class:
+            execute_options["execution_context_class"] = self.execution_context_class
+        return execute_options
+
+    def is_atomic(self, operation):
+        return (
+            operation.kind == OperationType.MUTATION
+            and (
+                graphene_settings.ATOMIC_MUTATIONS is True
+                or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+            )
+        )
+
+    def execute_operation(self, request, operation):
+        try:
+            execute_options = self.get_execute_options(request, operation)
+            if self.is_atomic(operation):
+                with transaction.atomic():
+                    result = execute(operation.schema, operation.document, **execute_options)
+                    if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                        transaction.set_rollback(True)
+                return result
+
+            if operation.kind != OperationType.QUERY:
+                return execute(operation.schema, operation.document, **execute_options)
+            # Reads go to the replica when one is configured (crm/routers.py)
+            with replica_reads():
+                return self.execute_cached(request, operation, execute_options)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+    def execute_cached(self, request, operation, execute_options):
+        if not response_cache.get_timeout():
+            return execute(operation.schema, operation.document, **execute_options)
+        key = response_cache.cache_key(
+            operation.document_hash, operation.variables, operation.operation_name,
+            response_cache.viewer_key(request),
+        )
+        data = response_cache.lookup(key)
+        if data is not None:
+            return ExecutionResult(data=data)
+
+        # Versions are read before executing: a write that lands while the
+        # query runs moves them, and the entry stored below is already stale
+        versions = response_cache.tag_versions()
+        with response_cache.record_tables() as tables:
+            result = execute(operation.schema, operation.document, **execute_options)
+        if not result.errors:
+            response_cache.store(key, result.data, versions, tables)
+        return result
+
+    def get_response(self, request, data, show_graphiql=False):
+        # graphene-django's get_response, plus the result's extensions
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        with transaction.atomic() if self.batch else nullcontext():
+            execution_result = self.execute_graphql_request(
+                request, data, query, variables, operation_name, show_graphiql
+            )
+            if self.batch and execution_result and execution_result.errors:
+                # Undo this entry's writes only; the rest of the batch commits
+                transaction.set_rollback(True)
+        return self.encode_result(request, execution_result, id, show_graphiql)
+
+    def encode_result(self, request, execution_result, id, show_graphiql=False):
+        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+            set_rollback()
+
+        status_code = 200
+        if execution_result:
+            response = {}
+
+            if execution_result.errors:
+                set_rollback()
+                response["errors"] = [self.format_error(e) for e in execution_result.errors]
+
+            if execution_result.errors and any(
+                not getattr(e, "path", None) for e in execution_result.errors
+            ):
+                status_code = 400
+            else:
+                response["data"] = execution_result.data
+
+            if execution_result.extensions:
+                response["extensions"] = execution_result.extensions
+
+            if self.batch:
+                response["id"] = id
+                response["status"] = status_code
+
+            result = self.json_encode(request, response, pretty=show_graphiql)
+        else:
+            result = None
+
+        return result, status_code
+
+
+async def aexecute(schema, document, **execute_options):
+    result = execute(schema, document, **execute_options)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+class AsyncCRMGraphQLView(CRMGraphQLView):
+    """
+    CRMGraphQLView for ASGI deployments.
+
+    The request is handled on the event loop and the resolvers return
+    awaitables that read through Django's async ORM (crm/aio.py), so
+    independent root fields of a query resolve concurrently and a request
+    waiting on the database does not hold a worker thread. Caches, cost
+    analysis and tracing behave as in the sync view.
+
+    Django runs async ORM calls one at a time in its sync thread, so on
+    SQLite the concurrency is in everything but the queries themselves.
+    A transaction cannot span awaits, so the entries of a batch commit
+    separately here.
+    """
+
+    view_is_async = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        if hasattr(request, "auser"):
+            # Loaded here; the lazy request.user would query from the loop
+            request.user = await request.auser()
+        request.crm_async = True
+        self.batch = self.is_batch(request)
+        try:
+            if request.method.lower() not in ("get", "post"):
+                raise HttpError(
+                    HttpResponseNotAllowed(
+                        ["GET", "POST"], "GraphQL only supports GET and POST requests."
+                    )
+                )
+
+            data = self.parse_body(request)
+            if self.graphiql and self.can_display_graphiql(request, data):
+                # Rendering GraphiQL needs no database
+                return super().dispatch(request, *args, **kwargs)
+
+            if self.batch:
+                responses = [await self.aget_response(request, entry) for entry in data]
+                result = "[{}]".format(",".join([response[0] for response in responses]))
+                status_code = responses and max(response[1] for response in responses) or 200
+            else:
+                result, status_code = await self.aget_response(request, data)
+
+            return HttpResponse(
+                status=status_code, content=result, content_type="application/json"
+            )
+
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(
+                request, {"errors": [self.format_error(e)]}
+            )
+            return response
+
+    async def aget_response(self, request, data):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+        execution_result = await self.aexecute_graphql_request(
+            request, data, query, variables, operation_name
+        )
+        return self.encode_result(request, execution_result, id)
+
+    async def aexecute_graphql_request(self, request, data, query, variables, operation_name):
+        operation = self.prepare_operation(request, data, query, variables, operation_name)
+        if not isinstance(operation, PreparedOperation):
+            return operation
+        with tracing.trace_operation(request, operation.operation_ast) as trace:
+            result = await self.aexecute_operation(request, operation)
+        return self.add_extensions(result, operation, trace)
+
+    async def aexecute_operation(self, request, operation):
+        if self.is_atomic(operation):
+            # transaction.atomic() cannot span awaits: run the sync resolvers
+            # in the ORM thread instead
+            request.crm_async = False
+            try:
+                return await sync_to_async(self.execute_operation)(request, operation)
+            finally:
+                request.crm_async = True
+        try:
+            execute_options = self.get_execute_options(request, operation)
+            if operation.kind != OperationType.QUERY:
+                return await aexecute(operation.schema, operation.document, **execute_options)
+            with replica_reads():
+                return await self.aexecute_cached(request, operation, execute_options)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+    async def aexecute_cached(self, request, operation, execute_options):
+        if not response_cache.get_timeout():
+            return await aexecute(operation.schema, operation.document, **execute_options)
+        key = response_cache.cache_key(
+            operation.document_hash, operation.variables, operation.operation_name,
+            response_cache.viewer_key(request),
+        )
+        data = await sync_to_async(response_cache.lookup)(key)
+        if data is not None:
+            return ExecutionResult(data=data)
+
+        versions = await sync_to_async(response_cache.tag_versions)()
+        with response_cache.record_tables() as tables:
+            result = await aexecute(operation.schema, operation.document, **execute_options)
+        if not result.errors:
+            await sync_to_async(response_cache.store)(key, result.data, versions, tables)
+        return result
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint for this process (crm/metrics.py); keep it internal."""
+    return HttpResponse(metrics.registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")